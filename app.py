@@ -4,9 +4,12 @@ from pydantic import ValidationError
 import sys
 
 from models.ldap_connection import get_connection
+from utils.preflight import configure_bytecode_cache, warm_up
+from utils.session import configure_sessions
 
 app = Flask(__name__)
 
+import commands
 import routes
 import template_filters
 
@@ -21,5 +24,15 @@ except ValidationError as e:
 
 routes.register(app)
 template_filters.register(app)
+commands.register(app)
 
 app.config.update(get_settings())
+configure_bytecode_cache(app)
+configure_sessions(app)
+
+if settings.WARM_UP_ON_START:
+    for result in warm_up(app):
+        if result["error"]:
+            app.logger.error(f"{result['title']}: {result['error']}")
+        else:
+            app.logger.info(f"{result['title']}: {result['ms']:.1f} мс")
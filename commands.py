@@ -0,0 +1,231 @@
+import json
+import os
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup, with_appcontext
+
+from controllers.asset_controller import get_assets_directory
+from utils.assets import MANIFEST_NAME, build_assets
+from utils.benchmark import (
+    BENCHMARK_ENTRIES,
+    DEFAULT_THRESHOLD,
+    compare_benchmarks,
+    run_benchmarks,
+)
+from utils.preflight import warm_up
+
+from utils.password_benchmark import (
+    benchmark_password_schemes,
+    calibrate_bcrypt_rounds,
+    calibrate_sha512_crypt_rounds,
+)
+
+
+passwords_cli = AppGroup("passwords", help="Схемы хэширования паролей")
+
+
+@passwords_cli.command("benchmark")
+@click.option(
+    "--min-time",
+    default=0.5,
+    show_default=True,
+    help="Минимальное время измерения одной схемы, секунд",
+)
+def passwords_benchmark(min_time: float):
+    """
+    Измеряет скорость вычисления хэшей паролей всеми схемами на данном сервере
+    """
+    click.echo(f"{'Схема':<16}{'мс/хэш':>12}{'хэшей/с':>12}")
+    for result in benchmark_password_schemes(min_time):
+        click.echo(
+            f"{result['scheme']:<16}{result['mean_ms']:>12.3f}"
+            f"{result['hashes_per_second']:>12.1f}"
+        )
+
+
+@passwords_cli.command("calibrate")
+@click.option(
+    "--target-ms",
+    default=250.0,
+    show_default=True,
+    help="Целевое время вычисления одного хэша, миллисекунд",
+)
+def passwords_calibrate(target_ms: float):
+    """
+    Подбирает параметры стоимости BCRYPT и SHA512-CRYPT под целевое время
+    вычисления хэша на данном сервере
+    """
+    bcrypt_result = calibrate_bcrypt_rounds(target_ms)
+    for cost, elapsed_ms in bcrypt_result["measurements"].items():
+        click.echo(f"BCRYPT, стоимость {cost}: {elapsed_ms:.1f} мс")
+
+    sha512_crypt_result = calibrate_sha512_crypt_rounds(target_ms)
+    click.echo(
+        f"SHA512-CRYPT, {sha512_crypt_result['rounds']} раундов: "
+        f"{sha512_crypt_result['measured_ms']:.1f} мс"
+    )
+
+    click.echo("")
+    click.echo("Рекомендуемые настройки:")
+    click.echo(f"IREDADMIN_LIGHT_PASSWORD_BCRYPT_ROUNDS={bcrypt_result['rounds']}")
+    click.echo(
+        f"IREDADMIN_LIGHT_PASSWORD_SHA512_CRYPT_ROUNDS={sha512_crypt_result['rounds']}"
+    )
+
+
+assets_cli = AppGroup("assets", help="Статические файлы")
+
+
+@assets_cli.command("build")
+def assets_build():
+    """
+    Собирает статические файлы: добавляет к именам хэш содержимого и создает
+    сжатые варианты gzip и brotli (если установлен модуль brotli)
+    """
+    output_directory = get_assets_directory()
+    manifest = build_assets(current_app.static_folder, output_directory)  # type: ignore
+
+    for source, info in sorted(manifest.items()):
+        encodings = ", ".join(info["encodings"]) or "-"
+        click.echo(f"{source} -> {info['path']} ({info['size']} байт; {encodings})")
+    click.echo(f"Манифест: {os.path.join(output_directory, MANIFEST_NAME)}")
+
+
+@click.command("preflight")
+@with_appcontext
+def preflight():
+    """
+    Проверяет настройки и доступность каталога, компилирует шаблоны в кэш байт-кода,
+    открывает соединения с каталогом и подготавливает модели. Выводит время
+    выполнения каждого шага
+    """
+    results = warm_up(current_app._get_current_object())  # type: ignore
+
+    failed = False
+    for result in results:
+        status = "ошибка" if result["error"] else "ok"
+        click.echo(f"{result['title']:<28}{result['ms']:>10.1f} мс  {status}")
+        for detail in result["details"]:
+            click.echo(f"  {detail}")
+        if result["error"]:
+            click.echo(f"  {result['error']}", err=True)
+            failed = True
+
+    click.echo(f"{'Всего':<28}{sum(r['ms'] for r in results):>10.1f} мс")
+    if failed:
+        raise SystemExit(1)
+
+
+@click.command("benchmark")
+@click.option(
+    "--min-time",
+    default=0.5,
+    show_default=True,
+    help="Минимальная длительность замеров одного теста, секунд",
+)
+@click.option(
+    "--repeat", default=5, show_default=True, help="Количество замеров одного теста"
+)
+@click.option(
+    "--entries",
+    default=BENCHMARK_ENTRIES,
+    show_default=True,
+    help="Количество записей в пакетном тесте преобразования записей",
+)
+@click.option(
+    "-k",
+    "--select",
+    multiple=True,
+    help="Выполнить только тесты, наименование которых содержит подстроку",
+)
+@click.option(
+    "--output", type=click.Path(dir_okay=False), help="Сохранить результаты в JSON"
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Сравнить результаты с сохраненными ранее (JSON)",
+)
+@click.option(
+    "--threshold",
+    default=DEFAULT_THRESHOLD,
+    show_default=True,
+    help="Относительное изменение времени, не считающееся отличием",
+)
+@click.option(
+    "--json", "as_json", is_flag=True, help="Вывести результаты в формате JSON"
+)
+@click.option(
+    "--fail-on-regression",
+    is_flag=True,
+    help="Завершиться с ошибкой, если какой-либо тест медленнее базового",
+)
+def benchmark(
+    min_time: float,
+    repeat: int,
+    entries: int,
+    select: tuple,
+    output: str,
+    baseline: str,
+    threshold: float,
+    as_json: bool,
+    fail_on_regression: bool,
+):
+    """
+    Измеряет скорость преобразования записей каталога, построения моделей и
+    вычисления хэшей паролей. Сервер каталога не требуется
+    """
+
+    def progress(result):
+        if not as_json:
+            click.echo(
+                f"{result['name']:<40}{result['median_us']:>14.3f}"
+                f"{result['min_us']:>14.3f}{result['loops']:>10}"
+            )
+
+    if not as_json:
+        click.echo(
+            f"{'Тест':<40}{'медиана, мкс':>14}{'минимум, мкс':>14}{'вызовов':>10}"
+        )
+    report = run_benchmarks(min_time, repeat, entries, list(select), progress)
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    comparisons = []
+    if baseline:
+        with open(baseline) as file:
+            comparisons = compare_benchmarks(report, json.load(file), threshold)
+        report["comparison"] = comparisons
+
+    if as_json:
+        click.echo(json.dumps(report, indent=2, ensure_ascii=False))
+    elif comparisons:
+        click.echo("")
+        click.echo(f"{'Тест':<40}{'базовое, мкс':>14}{'отношение':>12}  итог")
+        for comparison in comparisons:
+            if comparison["ratio"] is None:
+                click.echo(f"{comparison['name']:<40}{'-':>14}{'-':>12}  new")
+                continue
+            click.echo(
+                f"{comparison['name']:<40}{comparison['baseline_us']:>14.3f}"
+                f"{comparison['ratio']:>12.3f}  {comparison['status']}"
+            )
+
+    if fail_on_regression and any(c["status"] == "slower" for c in comparisons):
+        raise SystemExit(1)
+
+
+def register(app: Flask):
+    """
+    Регистрирует команды интерфейса командной строки flask
+
+    Аргументы:
+      app: экземпляр Flask для которого выполняется регистрация команд
+    """
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(preflight)
+    app.cli.add_command(benchmark)
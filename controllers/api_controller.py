@@ -0,0 +1,215 @@
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import Response, abort, jsonify, request, stream_with_context
+from pydantic import ValidationError
+
+from controllers.domain_controller import get_domains_from_ldap
+from controllers.user_controller import (
+    USER_ATTRIBUTES,
+    get_user_entry_from_ldap,
+    get_user_from_ldap,
+    get_users_from_ldap,
+    iter_users_from_ldap,
+    update_user,
+    update_user_password,
+)
+from models.settings import get_settings
+from models.user import User
+from models.user_list_query import UserListQuery
+from models.user_password import UserPassword
+from utils.decorators import api_login_required
+from utils.ldap import bytes2str, decode_cursor, encode_cursor
+from utils.password_hashing import hash_password
+
+
+API_USER_FIELDS = ["mail"] + [name for name in USER_ATTRIBUTES if name != "mail"]
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def __json_error(status: int, message: str, errors: Optional[Dict] = None) -> Response:
+    body: Dict[str, Any] = {"error": message}
+    if errors:
+        body["errors"] = errors
+    response = jsonify(body)
+    response.status_code = status
+    return response
+
+
+def __parse_fields() -> List[str]:
+    """
+    Разбирает параметр fields - список атрибутов пользователя через запятую. Атрибуты
+    передаются в запрос к каталогу без изменений
+    """
+    fields = [name.strip() for name in request.args.get("fields", "").split(",")]
+    fields = [name for name in fields if name]
+    if not fields:
+        return API_USER_FIELDS
+
+    unknown = [name for name in fields if name not in API_USER_FIELDS]
+    if unknown:
+        abort(__json_error(400, f"Неизвестные атрибуты: {', '.join(unknown)}"))
+    return list(dict.fromkeys(fields))
+
+
+def __attribute_value(name: str, value: Optional[str]) -> Any:
+    """
+    Преобразует значение атрибута каталога к типу, принятому в API. Квота
+    указывается в мегабайтах, как и в формах приложения
+    """
+    if name == "accountStatus":
+        return value == "active"
+    if name == "domainGlobalAdmin":
+        return value == "yes"
+    if name == "mailQuota":
+        return int(value) // 1048576 if value and value.isdigit() else 0
+    return value if value is not None else ""
+
+
+def __entry_to_dict(attrs: Dict[str, List[bytes]], fields: List[str]) -> Dict:
+    return {
+        name: __attribute_value(
+            name, bytes2str(attrs[name][0]) if attrs.get(name) else None
+        )
+        for name in fields
+    }
+
+
+def __user_to_dict(domain: str, user: User, fields: List[str]) -> Dict:
+    data = user.model_dump()
+    data["mail"] = f"{user.uid}@{domain}".lower()
+    data["mailQuota"] = user.mailQuota // 1048576
+    return {name: data[name] for name in fields}
+
+
+def __wants_ndjson() -> bool:
+    if request.args.get("format") == "ndjson":
+        return True
+    return (
+        request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+        == NDJSON_MIMETYPE
+    )
+
+
+def __stream_ndjson(rows: Iterator[Dict]) -> Response:
+    return Response(
+        stream_with_context(
+            json.dumps(row, ensure_ascii=False) + "\n" for row in rows
+        ),
+        mimetype=NDJSON_MIMETYPE,
+    )
+
+
+@api_login_required
+def api_domain_list():
+    """
+    Список доменов
+    """
+    domains = [
+        {
+            "domainName": info["domainName"],
+            "accountStatus": info.get("accountStatus") == "active",
+        }
+        for info in get_domains_from_ldap()
+    ]
+    if __wants_ndjson():
+        return __stream_ndjson(iter(domains))
+    return jsonify({"domains": domains})
+
+
+@api_login_required
+def api_user_list(domain: str):
+    """
+    Список пользователей домена. Принимает параметры отбора и сортировки списка
+    пользователей (q, status, admin, sort) и список атрибутов fields. В формате
+    NDJSON (параметр format=ndjson или заголовок Accept: application/x-ndjson)
+    выдаются все отобранные пользователи по мере их получения из каталога, иначе -
+    одна страница (page, page_size, cursor)
+    """
+    fields = __parse_fields()
+    query = UserListQuery.from_args(request.args)
+
+    if __wants_ndjson():
+        entries = iter_users_from_ldap(domain, query, fields)
+        return __stream_ndjson(
+            __entry_to_dict(attrs, fields) for _, attrs in entries
+        )
+
+    settings = get_settings()
+    page = max(request.args.get("page", 1, type=int), 1)
+    page_size = request.args.get("page_size", settings.USERS_PAGE_SIZE, type=int)
+    page_size = min(max(page_size, 1), settings.USERS_PAGE_SIZE_MAX)
+    cursor = decode_cursor(request.args.get("cursor"))
+
+    search = get_users_from_ldap(domain, page, page_size, cursor, query, fields)
+    users = [__entry_to_dict(attrs, fields) for _, attrs in search]
+    return jsonify(
+        {
+            "users": users,
+            "page": page,
+            "page_size": page_size,
+            "next_cursor": encode_cursor(search.cookie) if search.cookie else None,
+        }
+    )
+
+
+@api_login_required
+def api_user(domain: str, user_uid: str):
+    """
+    Получение (GET) и изменение (PATCH) пользователя. При получении из каталога
+    читаются только атрибуты, перечисленные в fields. При изменении передается
+    JSON-объект с изменяемыми атрибутами пользователя и, при необходимости, новым
+    паролем в атрибуте password
+    """
+    fields = __parse_fields()
+
+    if request.method == "GET":
+        attrs = get_user_entry_from_ldap(domain, user_uid, fields)
+        if attrs is None:
+            return __json_error(404, f"Пользователь {user_uid} не найден")
+        return jsonify({"user": __entry_to_dict(attrs, fields)})
+
+    user = get_user_from_ldap(domain, user_uid)
+    if not user:
+        return __json_error(404, f"Пользователь {user_uid} не найден")
+
+    if request.method == "PATCH":
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict):
+            return __json_error(400, "Ожидается JSON-объект")
+
+        password = changes.pop("password", None)
+        changes.pop("uid", None)
+        changes.pop("mail", None)
+
+        data = user.model_dump()
+        data["mailQuota"] = user.mailQuota // 1048576
+        data.update(changes)
+
+        try:
+            changed_user = User(**data)
+            user_password = (
+                UserPassword(password=password, password_repeat=password)  # type: ignore
+                if password is not None
+                else None
+            )
+        except ValidationError as e:
+            errors = {
+                ".".join(str(loc) for loc in error_dict["loc"]): error_dict["msg"]
+                .replace("Value error,", "")
+                .strip()
+                for error_dict in e.errors()
+            }
+            return __json_error(422, "Некорректные данные", errors)
+
+        updated_user = update_user(domain, changed_user)
+        if user_password:
+            password_hash = hash_password(user_password.password.get_secret_value())
+            updated_user = update_user_password(domain, user_uid, password_hash)
+
+        user = updated_user or get_user_from_ldap(domain, user_uid)
+        if not user:
+            return __json_error(404, f"Пользователь {user_uid} не найден")
+
+    return jsonify({"user": __user_to_dict(domain, user, fields)})
@@ -0,0 +1,45 @@
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+
+from models.settings import get_settings
+from utils.assets import choose_encoding, encoding_suffix, fingerprinted_files
+
+
+def get_assets_directory() -> str:
+    """
+    Возвращает каталог сборки статических файлов
+    """
+    settings = get_settings()
+    static_folder: str = current_app.static_folder  # type: ignore
+    return os.path.join(static_folder, settings.ASSETS_BUILD_DIRECTORY)
+
+
+def asset(filename: str):
+    """
+    Отдает собранный статический файл. Имена собранных файлов содержат хэш
+    содержимого, поэтому файлы кэшируются клиентом без повторной проверки. Если
+    клиент поддерживает сжатие, отдается заранее сжатый вариант файла
+    """
+    settings = get_settings()
+    directory = get_assets_directory()
+
+    info = fingerprinted_files(directory).get(filename)
+    # Для отсутствующих файлов не отображается страница 404 приложения
+    if info is None:
+        return "", 404
+
+    encoding = choose_encoding(request.accept_encodings, info["encodings"])
+    path = filename + encoding_suffix(encoding) if encoding else filename
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    response = send_from_directory(
+        directory, path, mimetype=mimetype, max_age=settings.ASSETS_MAX_AGE
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
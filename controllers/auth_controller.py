@@ -1,7 +1,8 @@
 from flask import session, request, redirect, url_for, g
 from utils.decorators import templated
 from typing import Optional
-from models.ldap_connection import get_connection
+from models.ldap_connection import close_connections, login
+from utils.session import regenerate_session
 from app import app
 
 
@@ -16,7 +17,7 @@ def authenticate_user(email: str, password: str) -> bool:
         булево: истина, если пользователь успешно аутентифицирован
     """
     try:
-        get_connection(email, password)
+        login(email, password)
         app.logger.info(f"Аутентификация пользователя {email} выполнена успешно")
         return True
     except Exception as e:
@@ -42,6 +43,7 @@ def login_page():
             request.form["password"],
         )
         if authenticate_user(email, password):
+            regenerate_session()
             session["email"] = request.form["email"]
             return redirect(next)
         error = "Введены некорректные данные!"
@@ -52,5 +54,8 @@ def logout():
     """
     Обработчик бизес логики выхода пользователя из приложения
     """
+    email = session.get("email")
+    if email:
+        close_connections(email)
     session.clear()
     return redirect(url_for("login_page"))
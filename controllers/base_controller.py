@@ -1,5 +1,5 @@
-from utils.decorators import templated
-from flask import redirect, url_for
+from utils.decorators import DIRECTORY_RETRY_AFTER, templated
+from flask import make_response, redirect, render_template, url_for
 
 
 @templated()
@@ -16,3 +16,23 @@ def ldap_connection_error_handler(e):
     Обработчик ошибки LDAP-соединения
     """
     return redirect(url_for("logout"))
+
+
+def directory_unavailable_handler(e):
+    """
+    Обработчик недоступности каталога, оставшейся после попыток восстановить
+    соединение. Сеанс пользователя сохраняется
+    """
+    response = make_response(render_template("directory_unavailable.html"), 503)
+    response.headers["Retry-After"] = str(DIRECTORY_RETRY_AFTER)
+    return response
+
+
+def pool_exhausted_handler(e):
+    """
+    Обработчик исчерпания пула соединений с каталогом. Сеанс пользователя и его
+    соединения сохраняются, клиенту предлагается повторить запрос позже
+    """
+    response = make_response(render_template("server_busy.html"), 503)
+    response.headers["Retry-After"] = str(DIRECTORY_RETRY_AFTER)
+    return response
@@ -0,0 +1,20 @@
+from controllers.domain_controller import get_domains_from_ldap
+from models.domain_statistics import get_domain_statistics
+from utils.decorators import login_required, templated
+
+
+@login_required
+@templated()
+def dashboard():
+    """
+    Отображение сводной страницы со статистикой пользователей по доменам. Итоги
+    считаются по доменам, статистика которых уже вычислена
+    """
+    domains = sorted(info["domainName"] for info in get_domains_from_ldap())
+    statistics = get_domain_statistics(domains)
+
+    totals = {
+        key: sum(item[key] for item in statistics.values() if item)
+        for key in ("users", "active", "disabled", "admins", "quota")
+    }
+    return {"domains": domains, "statistics": statistics, "totals": totals}
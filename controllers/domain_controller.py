@@ -1,33 +1,87 @@
 import ldapurl
+from utils.cache import TTLCache
 from utils.decorators import login_required
 from utils.decorators import templated
-from models.ldap_connection import get_connection
+from utils.signals import directory_changed
+from models.directory_mirror import get_directory_mirror
+from models.domain_statistics import get_domain_statistics
+from models.ldap_connection import current_identity, get_connection
 from ldap.ldapobject import LDAPObject
 from models.settings import get_settings
-from flask import session, redirect
+from flask import redirect
+from typing import Dict, List, Optional
 from utils.ldap import bytes2str
 
 
-@login_required
-@templated()
-def domain_list():
+__domain_list_cache: Optional[TTLCache] = None
+
+
+def __get_domain_list_cache() -> TTLCache:
+    global __domain_list_cache
+    if __domain_list_cache is None:
+        settings = get_settings()
+        __domain_list_cache = TTLCache(
+            settings.DOMAIN_LIST_CACHE_SIZE, settings.DOMAIN_LIST_CACHE_TTL
+        )
+    return __domain_list_cache
+
+
+@directory_changed.connect
+def invalidate_domain_list_cache(domain: str, **kwargs):
+    """
+    Сбрасывает кэш списка доменов при изменении приложением домена или его
+    пользователей. Кэш сбрасывается для всех учетных записей, так как изменения
+    видны каждой из них
+    """
+    __get_domain_list_cache().clear()
+
+
+def get_domains_from_ldap() -> List[Dict[str, str]]:
     """
-    Отображение страницы со списком пользователей
+    Получение списка доменов с основными атрибутами. Если включено зеркало каталога,
+    список берется из памяти
     """
+    attrlist = ["domainName", "accountStatus", "domainCurrentUserNumber"]
+
+    mirror = get_directory_mirror()
+    query_result = mirror.get_domains(attrlist) if mirror else None
 
-    connection = get_connection()
-    settings = get_settings()
+    if query_result is None:
+        connection = get_connection()
+        settings = get_settings()
 
-    query_result = connection.conn.search_s(
-        settings.LDAP_ROOT_DN,
-        ldapurl.LDAP_SCOPE_SUBTREE,
-        "(objectClass=mailDomain)",
-        ["domainName", "accountStatus", "domainCurrentUserNumber"],
-    )
+        query_result = connection.conn.search_s(
+            settings.LDAP_ROOT_DN,
+            ldapurl.LDAP_SCOPE_SUBTREE,
+            "(objectClass=mailDomain)",
+            attrlist,
+        )
 
     domain_info = []
     if query_result:
         for result in query_result:
             domain_info.append({k: bytes2str(v[0]) for k, v in result[1].items()})
+    return domain_info
+
+
+@login_required
+@templated()
+def domain_list():
+    """
+    Отображение страницы со списком доменов. Список кэшируется отдельно для каждой
+    учетной записи, так как права доступа к каталогу у них могут различаться.
+    Количество пользователей берется из статистики доменов, а не из атрибута
+    domainCurrentUserNumber, который приложение не обновляет
+    """
+    cache = __get_domain_list_cache()
+    identity = current_identity()
+
+    # Зеркало каталога актуальнее кэша, поэтому при его наличии кэш не используется
+    domain_info = None if get_directory_mirror() else cache.get(identity)
+    if domain_info is None:
+        generation = cache.generation
+        domain_info = get_domains_from_ldap()
+        cache.set(identity, domain_info, generation)
 
-    return {"domain_info": domain_info}
+    statistics = get_domain_statistics([info["domainName"] for info in domain_info])
+    return {"domain_info": domain_info, "statistics": statistics}
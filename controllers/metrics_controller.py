@@ -0,0 +1,25 @@
+import hmac
+
+from flask import Response, request
+
+from models.settings import get_settings
+from utils.metrics import render_metrics
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics():
+    """
+    Статистика операций LDAP и обработки запросов в формате Prometheus. Требует
+    заголовок Authorization: Bearer <METRICS_TOKEN>; если настройка METRICS_TOKEN
+    не задана, статистика не выдается
+    """
+    token = get_settings().METRICS_TOKEN
+    if not token:
+        return Response(status=404)
+
+    authorization = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        return Response(status=401, headers={"WWW-Authenticate": "Bearer"})
+
+    return Response(render_metrics(), mimetype=PROMETHEUS_MIMETYPE)
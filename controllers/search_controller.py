@@ -0,0 +1,32 @@
+from flask import jsonify, request
+
+from models.ldap_connection import (
+    current_identity,
+    get_connection,
+    has_directory_access,
+)
+from models.search_index import get_search_index, search_directory
+from models.settings import get_settings
+from utils.decorators import login_required
+
+
+@login_required
+def search():
+    """
+    Поиск пользователей во всех доменах по началу адреса, идентификатора или имени.
+    Возвращает JSON со списком найденных пользователей. Пока индекс поиска строится,
+    список пуст, а признак ready ложен. Учетные записи без доступа ко всему каталогу
+    ищут непосредственно в каталоге через свое соединение
+    """
+    settings = get_settings()
+    q = request.args.get("q", "")
+    limit = request.args.get("limit", settings.SEARCH_RESULTS_LIMIT, type=int)
+    limit = min(max(limit, 1), settings.SEARCH_RESULTS_LIMIT_MAX)
+
+    if not has_directory_access(current_identity()):
+        results = search_directory(get_connection(), q, limit) if q.strip() else []
+        return jsonify({"query": q, "results": results, "ready": True})
+
+    index = get_search_index()
+    results = index.search(q, limit) if index and q.strip() else []
+    return jsonify({"query": q, "results": results, "ready": index is not None})
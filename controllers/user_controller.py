@@ -1,15 +1,105 @@
-from typing import Optional, List, Dict
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+import ldap
 import ldapurl
 from flask import abort, request
+from ldap.controls.readentry import PostReadControl, PreReadControl
+from ldap.controls.sss import SSSRequestControl
+from ldap.filter import escape_filter_chars
 from pydantic import ValidationError
 
-from models.ldap_connection import get_connection
-from models.user import User
+from models.directory_mirror import get_directory_mirror
+from models.ldap_connection import current_identity, get_connection
+from models.settings import get_settings
+from models.user import User, decode_user_rows
+from models.user_list_query import UserListQuery
 from models.user_password import UserPassword
-from utils.decorators import login_required, templated
-from utils.ldap import bytes2str, get_domain_dn, get_email_dn, mod_replace
-from utils.password import generate_password_hash
+from utils.cache import TTLCache
+from utils.decorators import (
+    DIRECTORY_UNAVAILABLE_ERRORS,
+    login_required,
+    templated,
+)
+from utils.ldap import (
+    attrs_ldif,
+    bytes2str,
+    decode_cursor,
+    encode_cursor,
+    EntryPage,
+    generate_maildir_path,
+    get_days_of_shadow_last_change,
+    get_domain_dn,
+    get_email_dn,
+    get_user_dn,
+    iter_paged_search,
+    ldap_error_message,
+    mod_replace,
+    PagedSearch,
+    supports_server_side_sort,
+)
+from utils.password_hashing import hash_password
+from utils.signals import directory_changed
+
+
+USER_ATTRIBUTES = [
+    "mail",
+    "accountStatus",
+    "domainGlobalAdmin",
+    "mailQuota",
+    "uid",
+    "cn",
+    "givenName",
+    "sn",
+    "title",
+    "telephoneNumber",
+    "mobile",
+    "employeeNumber",
+]
+
+USER_LIST_ATTRIBUTES = [
+    "mail",
+    "accountStatus",
+    "domainGlobalAdmin",
+    "mailQuota",
+    "uid",
+    "cn",
+]
+
+# Правила сравнения для сортировки списка пользователей на стороне сервера
+USER_SORT_ORDERING_RULES = {
+    "uid": "caseIgnoreOrderingMatch",
+    "cn": "caseIgnoreOrderingMatch",
+    "mail": "caseIgnoreOrderingMatch",
+    "mailQuota": "integerOrderingMatch",
+    "accountStatus": "caseIgnoreOrderingMatch",
+    "domainGlobalAdmin": "caseIgnoreOrderingMatch",
+}
+
+# Признак cookie страницы, сформированной в памяти
+MEMORY_CURSOR_PREFIX = b"offset:"
+
+
+__user_cache: Optional[TTLCache] = None
+
+
+def __get_user_cache() -> TTLCache:
+    global __user_cache
+    if __user_cache is None:
+        settings = get_settings()
+        __user_cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+    return __user_cache
+
+
+@directory_changed.connect
+def invalidate_user_cache(domain: str, dn: Optional[str] = None, **kwargs):
+    """
+    Удаляет измененную запись пользователя из кэша всех учетных записей
+    """
+    if dn is None:
+        domain_suffix = f",{get_domain_dn(domain)}"
+        __get_user_cache().delete_where(lambda key: key[1].endswith(domain_suffix))
+    else:
+        __get_user_cache().delete_where(lambda key: key[1] == dn)
 
 
 def __ldap_query_to_user(query) -> User:
@@ -35,59 +125,339 @@ def __validation_errors_to_dict(e: ValidationError) -> Dict[str, str]:
 
 def get_user_from_ldap(domain: str, user_id: str) -> Optional[User]:
     """
-    Получение модели пользователя по идентификатору и доменному имени
+    Получение модели пользователя по идентификатору и доменному имени. Если включено
+    зеркало каталога, запись берется из памяти. Иначе модели кэшируются по DN
+    записи отдельно для каждой учетной записи
     """
+    mirror = get_directory_mirror()
+    mirror_result = (
+        mirror.get_user(domain, user_id, USER_ATTRIBUTES) if mirror else None
+    )
+    if mirror_result is not None:
+        found, entry = mirror_result
+        return __ldap_query_to_user(entry) if found else None
+
+    cache = __get_user_cache()
+    cache_key = (current_identity(), get_user_dn(user_id, domain))
+    user = cache.get(cache_key)
+    if user:
+        return user
+
+    generation = cache.generation
     connection = get_connection()
 
     query_result = connection.conn.search_s(
         f"ou=Users,{get_domain_dn(domain)}",
         ldapurl.LDAP_SCOPE_ONELEVEL,
-        f"(&(objectClass=mailUser)(uid={user_id}))",
-        [
-            "mail",
-            "accountStatus",
-            "domainGlobalAdmin",
-            "mailQuota",
-            "uid",
-            "cn",
-            "givenName",
-            "sn",
-            "title",
-            "telephoneNumber",
-            "mobile",
-            "employeeNumber",
-        ],
+        f"(&(objectClass=mailUser)(uid={escape_filter_chars(user_id)}))",
+        USER_ATTRIBUTES,
     )
 
     if not query_result:
         return None
 
-    return __ldap_query_to_user(query_result[0])
+    user = __ldap_query_to_user(query_result[0])
+    cache.set(cache_key, user, generation)
+    return user
 
 
-def get_users_from_ldap(domain: str) -> List[User]:
+def get_user_entry_from_ldap(
+    domain: str, user_id: str, attrlist: List[str]
+) -> Optional[Dict[str, List[bytes]]]:
     """
-    Получение списка моделей пользователей для указанного домена
+    Получение атрибутов attrlist записи пользователя по идентификатору и доменному
+    имени. Из каталога читаются только запрошенные атрибуты. Если включено зеркало
+    каталога, запись берется из памяти
     """
-    connection = get_connection()
+    mirror = get_directory_mirror()
+    mirror_result = mirror.get_user(domain, user_id, attrlist) if mirror else None
+    if mirror_result is not None:
+        found, entry = mirror_result
+        return entry[1] if found and entry else None
 
+    connection = get_connection()
     query_result = connection.conn.search_s(
         f"ou=Users,{get_domain_dn(domain)}",
         ldapurl.LDAP_SCOPE_ONELEVEL,
-        f"(&(objectClass=mailUser)(!(mail=@{domain})))",
-        ["mail", "accountStatus", "domainGlobalAdmin", "mailQuota", "uid"],
+        f"(&(objectClass=mailUser)(uid={escape_filter_chars(user_id)}))",
+        attrlist,
+    )
+    return query_result[0][1] if query_result else None
+
+
+def __build_user_filter(domain: str, query: UserListQuery) -> str:
+    """
+    Формирует фильтр поиска пользователей домена по параметрам отбора
+    """
+    parts = ["(objectClass=mailUser)", f"(!(mail=@{escape_filter_chars(domain)}))"]
+    if query.q:
+        q = escape_filter_chars(query.q)
+        parts.append(f"(|(uid=*{q}*)(cn=*{q}*)(mail=*{q}*))")
+    if query.status:
+        parts.append(f"(accountStatus={query.status})")
+    if query.admin == "yes":
+        parts.append("(domainGlobalAdmin=yes)")
+    elif query.admin == "no":
+        parts.append("(!(domainGlobalAdmin=yes))")
+    return f"(&{''.join(parts)})"
+
+
+def __user_entry_matches(attrs: Dict[str, List[bytes]], query: UserListQuery) -> bool:
+    """
+    Проверяет запись пользователя на соответствие параметрам отбора так же, как это
+    делает фильтр поиска, сформированный __build_user_filter
+    """
+    if query.q:
+        q = query.q.lower()
+        if not any(
+            q in bytes2str(value).lower()
+            for name in ("uid", "cn", "mail")
+            for value in attrs.get(name, [])
+        ):
+            return False
+    if query.status and bytes2str(attrs.get("accountStatus", [b""])[0]) != query.status:
+        return False
+    if query.admin:
+        is_admin = bytes2str(attrs.get("domainGlobalAdmin", [b""])[0]) == "yes"
+        if is_admin != (query.admin == "yes"):
+            return False
+    return True
+
+
+def __memory_page(
+    entries: List, query: UserListQuery, page: int, page_size: int, cursor: bytes
+) -> EntryPage:
+    """
+    Сортирует записи в памяти и возвращает запрошенную страницу
+    """
+    attribute = query.sort_attribute
+    if attribute:
+
+        def sort_key(entry):
+            value = bytes2str(entry[1].get(attribute, [b""])[0])
+            if attribute == "mailQuota":
+                return int(value) if value.isdigit() else 0
+            return value.lower()
+
+        entries.sort(key=sort_key, reverse=query.sort_descending)
+
+    start = (page - 1) * page_size
+    if cursor.startswith(MEMORY_CURSOR_PREFIX):
+        offset = cursor[len(MEMORY_CURSOR_PREFIX) :]
+        start = int(offset) if offset.isdigit() else start
+
+    end = start + page_size
+    next_cursor = b""
+    if end < len(entries):
+        next_cursor = MEMORY_CURSOR_PREFIX + str(end).encode()
+    return EntryPage(entries[start:end], next_cursor)
+
+
+def __fetch_attributes(attrlist: List[str], query: UserListQuery) -> List[str]:
+    """
+    Дополняет список атрибутов атрибутом сортировки, необходимым при сортировке
+    в памяти
+    """
+    if query.sort_attribute and query.sort_attribute not in attrlist:
+        return attrlist + [query.sort_attribute]
+    return attrlist
+
+
+def __sort_controls(connection, base: str, query: UserListQuery) -> Optional[List]:
+    """
+    Возвращает управляющие элементы сортировки на стороне сервера или None, если
+    сервер не может выполнить запрошенную сортировку
+    """
+    attribute = query.sort_attribute
+    if not attribute:
+        return []
+
+    ordering_rule = "{}{}:{}".format(
+        "-" if query.sort_descending else "",
+        attribute,
+        USER_SORT_ORDERING_RULES[attribute],
+    )
+    if not supports_server_side_sort(
+        connection.conn, base, ldapurl.LDAP_SCOPE_ONELEVEL, ordering_rule
+    ):
+        return None
+    return [SSSRequestControl(criticality=True, ordering_rules=[ordering_rule])]
+
+
+def __mirror_entries(
+    domain: str, query: UserListQuery, attrlist: List[str]
+) -> Optional[List]:
+    """
+    Возвращает отобранные записи пользователей домена из зеркала каталога или None,
+    если зеркало отключено или записи следует прочитать из каталога
+    """
+    mirror = get_directory_mirror()
+    if not mirror:
+        return None
+
+    # Атрибуты отбора и сортировки нужны независимо от запрошенных
+    fetch_attributes = list(dict.fromkeys(USER_LIST_ATTRIBUTES + attrlist))
+    entries = mirror.get_domain_users(domain, fetch_attributes)
+    if entries is None:
+        return None
+    return [entry for entry in entries if __user_entry_matches(entry[1], query)]
+
+
+def get_users_from_ldap(
+    domain: str,
+    page: int,
+    page_size: int,
+    cursor: bytes = b"",
+    query: Optional[UserListQuery] = None,
+    attrlist: Optional[List[str]] = None,
+) -> Union[PagedSearch, EntryPage]:
+    """
+    Получение страницы записей пользователей для указанного домена. Записи выдаются
+    по мере получения из каталога (или из зеркала каталога, если оно включено),
+    cookie следующей страницы доступен в атрибуте cookie результата после
+    завершения перебора
+
+    Аргументы:
+      domain: доменное имя
+      page: номер страницы, начиная с 1
+      page_size: количество пользователей на странице
+      cursor: cookie страницы, полученный при запросе предыдущей страницы
+      query: параметры отбора и сортировки. Отбор выполняется фильтром поиска,
+        сортировка - управляющим элементом Server Side Sorting (RFC 2891). Если
+        сервер не может выполнить сортировку, все отобранные записи сортируются
+        в памяти
+      attrlist: запрашиваемые атрибуты, по умолчанию USER_LIST_ATTRIBUTES
+    """
+    query = query or UserListQuery()
+    attrlist = attrlist or USER_LIST_ATTRIBUTES
+
+    mirror = get_directory_mirror()
+    if mirror and not query.is_filtered and not query.sort:
+        mirror_page = mirror.get_users(domain, attrlist, page, page_size, cursor)
+        if mirror_page is not None:
+            return mirror_page
+    elif mirror:
+        entries = __mirror_entries(domain, query, attrlist)
+        if entries is not None:
+            return __memory_page(entries, query, page, page_size, cursor)
+
+    settings = get_settings()
+    connection = get_connection()
+    base = f"ou=Users,{get_domain_dn(domain)}"
+    filterstr = __build_user_filter(domain, query)
+
+    serverctrls = __sort_controls(connection, base, query)
+    if serverctrls is None:
+        entries = list(
+            iter_paged_search(
+                connection.conn,
+                base,
+                ldapurl.LDAP_SCOPE_ONELEVEL,
+                filterstr,
+                __fetch_attributes(attrlist, query),
+                settings.USERS_EXPORT_PAGE_SIZE,
+            )
+        )
+        return __memory_page(entries, query, page, page_size, cursor)
+
+    return PagedSearch(
+        connection.conn,
+        base,
+        ldapurl.LDAP_SCOPE_ONELEVEL,
+        filterstr,
+        attrlist,
+        page_size,
+        page,
+        cursor,
+        serverctrls,
     )
 
-    users: List[User] = []
-    if query_result:
-        for result in query_result:
-            users.append(__ldap_query_to_user(result))
-    return users
 
+def iter_users_from_ldap(
+    domain: str,
+    query: Optional[UserListQuery] = None,
+    attrlist: Optional[List[str]] = None,
+) -> Iterator[Tuple[str, Dict[str, List[bytes]]]]:
+    """
+    Перебирает все отобранные записи пользователей домена. Записи запрашиваются
+    у каталога постранично, если сервер не может выполнить запрошенную сортировку,
+    записи сортируются в памяти
+
+    Аргументы:
+      domain: доменное имя
+      query: параметры отбора и сортировки
+      attrlist: запрашиваемые атрибуты, по умолчанию USER_LIST_ATTRIBUTES
+    """
+    query = query or UserListQuery()
+    attrlist = attrlist or USER_LIST_ATTRIBUTES
+
+    entries = __mirror_entries(domain, query, attrlist)
+    if entries is not None:
+        yield from __memory_page(entries, query, 1, len(entries), b"")
+        return
+
+    settings = get_settings()
+    connection = get_connection()
+    base = f"ou=Users,{get_domain_dn(domain)}"
 
-def update_user(domain: str, user: User):
+    serverctrls = __sort_controls(connection, base, query)
+    entries_iterator = iter_paged_search(
+        connection.conn,
+        base,
+        ldapurl.LDAP_SCOPE_ONELEVEL,
+        __build_user_filter(domain, query),
+        __fetch_attributes(attrlist, query),
+        settings.USERS_EXPORT_PAGE_SIZE,
+        serverctrls or [],
+    )
+    if serverctrls is None:
+        entries = list(entries_iterator)
+        yield from __memory_page(entries, query, 1, len(entries), b"")
+    else:
+        yield from entries_iterator
+
+
+def __modify_user(domain: str, dn_user: str, mod_attrs: List) -> Optional[User]:
+    """
+    Изменяет запись пользователя, запрашивая ее прежнее и новое состояние
+    управляющими элементами Pre-Read и Post-Read (RFC 4527). Если сервер вернул
+    новое состояние записи, она сохраняется в кэш, что избавляет от повторного
+    поиска после изменения. Оба состояния передаются с сигналом directory_changed
+
+    Возвращаемое значение:
+      модель пользователя после изменения или None, если сервер не поддерживает
+      управляющий элемент Post-Read
+    """
     connection = get_connection()
 
+    pre_read = PreReadControl(criticality=False, attrList=USER_ATTRIBUTES)
+    post_read = PostReadControl(criticality=False, attrList=USER_ATTRIBUTES)
+    _, _, _, response_controls = connection.conn.modify_ext_s(
+        dn_user, mod_attrs, serverctrls=[pre_read, post_read]
+    )
+
+    entries = {
+        control.controlType: control.entry
+        for control in response_controls
+        if control.controlType
+        in (PreReadControl.controlType, PostReadControl.controlType)
+        and control.entry
+    }
+    previous = entries.get(PreReadControl.controlType)
+    entry = entries.get(PostReadControl.controlType)
+    if previous is not None and entry is not None:
+        directory_changed.send(domain, dn=dn_user, previous=previous, entry=entry)
+    else:
+        directory_changed.send(domain, dn=dn_user)
+
+    if entry is None:
+        return None
+    user = __ldap_query_to_user((dn_user, entry))
+    __get_user_cache().set((current_identity(), dn_user), user)
+    return user
+
+
+def update_user(domain: str, user: User) -> Optional[User]:
     mod_attrs = mod_replace(
         "domainGlobalAdmin", "yes" if user.domainGlobalAdmin else None
     )
@@ -104,59 +474,126 @@ def update_user(domain: str, user: User):
     )
 
     dn_user = get_email_dn(f"{user.uid}@{domain}")
-    connection.conn.modify_s(dn_user, mod_attrs)
+    return __modify_user(domain, dn_user, mod_attrs)
 
 
-def update_user_password(domain: str, user_uid: str, password_hash: str):
-    connection = get_connection()
+def update_user_password(
+    domain: str, user_uid: str, password_hash: str
+) -> Optional[User]:
     mod_attrs = mod_replace("userPassword", password_hash)
     dn_user = get_email_dn(f"{user_uid}@{domain}")
-    connection.conn.modify_s(dn_user, mod_attrs)
+    return __modify_user(domain, dn_user, mod_attrs)
+
+
+def build_user_ldif(domain: str, user: User, password_hash: str) -> List:
+    """
+    Формирует список атрибутов новой записи пользователя в формате, принятом в iRedMail
+    """
+    settings = get_settings()
+
+    mail = f"{user.uid}@{domain}".lower()
+    mail_message_store = f"{settings.MAIL_STORAGE_NODE}/{generate_maildir_path(mail)}"
+
+    return attrs_ldif(
+        {
+            "objectClass": [
+                "inetOrgPerson",
+                "mailUser",
+                "shadowAccount",
+                "amavisAccount",
+            ],
+            "mail": mail,
+            "uid": user.uid,
+            "userPassword": password_hash,
+            "cn": user.cn or user.uid,
+            "sn": user.sn or user.uid,
+            "givenName": user.givenName,
+            "employeeNumber": user.employeeNumber,
+            "title": user.title,
+            "mobile": user.mobile,
+            "telephoneNumber": user.telephoneNumber,
+            "mailQuota": user.mailQuota * 1024 * 1024,
+            "accountStatus": "active" if user.accountStatus else "disabled",
+            "domainGlobalAdmin": "yes" if user.domainGlobalAdmin else None,
+            "storageBaseDirectory": settings.MAIL_STORAGE_BASE_DIRECTORY,
+            "mailMessageStore": mail_message_store,
+            "homeDirectory": f"{settings.MAIL_STORAGE_BASE_DIRECTORY}/{mail_message_store}",
+            "enabledService": settings.USER_ENABLED_SERVICES,
+            "shadowLastChange": get_days_of_shadow_last_change(),
+        }
+    )
 
 
-def create_user(domain: str, user_uid: str, password_hash): ...
+def create_user(domain: str, user: User, password_hash: str):
+    """
+    Создает запись пользователя в каталоге
+    """
+    connection = get_connection()
+    dn_user = get_user_dn(user.uid, domain)
+    ldif = build_user_ldif(domain, user, password_hash)
+    connection.conn.add_s(dn_user, ldif)
+    directory_changed.send(domain, dn=dn_user, previous=None, entry=dict(ldif))
 
 
 @login_required
-@templated()
+@templated(stream=True)
 def user_list(domain: str):
     """
     Отображение страницы со списком пользователей
     """
-    users = get_users_from_ldap(domain)
-    users.sort(key=lambda x: x.uid)
+    settings = get_settings()
+    page = max(request.args.get("page", 1, type=int), 1)
+    page_size = request.args.get("page_size", settings.USERS_PAGE_SIZE, type=int)
+    page_size = min(max(page_size, 1), settings.USERS_PAGE_SIZE_MAX)
+    cursor = decode_cursor(request.args.get("cursor"))
+    query = UserListQuery.from_args(request.args)
 
-    return {"domain": domain, "users": users}
+    search = get_users_from_ldap(domain, page, page_size, cursor, query)
+
+    def next_cursor() -> Optional[str]:
+        return encode_cursor(search.cookie) if search.cookie else None
+
+    return {
+        "domain": domain,
+        "users": decode_user_rows(search),
+        "page": page,
+        "page_size": page_size,
+        "next_cursor": next_cursor,
+        "query": query,
+        "query_args": query.to_args(),
+    }
 
 
 @login_required
 @templated()
 def user_view(domain: str, user_uid: str, edit_mode: str):
     """
-    Отображение карточки пользователя
+    Отображение карточки пользователя. После изменения отображается запись,
+    возвращенная сервером управляющим элементом Post-Read, без повторного поиска
     """
     error: Optional[str] = None
     validation_errors: Dict[str, str] = {}
     success: Optional[str] = None
+    updated_user: Optional[User] = None
 
     if request.method == "POST":
         try:
             if edit_mode == "general":
                 user = User(**request.form)  # type: ignore
-                update_user(domain, user)
+                updated_user = update_user(domain, user)
                 success = "Информация обновлена успешно!"
 
             elif edit_mode == "password":
                 user_password = UserPassword(**request.form)  # type: ignore
-                password_hash = generate_password_hash(
+                password_hash = hash_password(
                     user_password.password.get_secret_value()
                 )
-                update_user_password(domain, user_uid, password_hash)
+                updated_user = update_user_password(domain, user_uid, password_hash)
                 success = "Пароль обновлен успешно!"
         except ValidationError as e:
             validation_errors = __validation_errors_to_dict(e)
 
-    user = get_user_from_ldap(domain, user_uid)
+    user = updated_user or get_user_from_ldap(domain, user_uid)
     if not user:
         return abort(404)
 
@@ -173,8 +610,10 @@ def user_view(domain: str, user_uid: str, edit_mode: str):
 @login_required
 @templated()
 def user_create_view(domain: str):
+    error: Optional[str] = None
     validation_errors: Dict[str, str] = {}
     user: Optional[User] = None
+    success: Optional[str] = None
 
     if request.method == "POST":
 
@@ -187,8 +626,24 @@ def user_create_view(domain: str):
 
         else:
             try:
-                user = User(**request.form)  # type: ignore
+                user = User(**{"accountStatus": True, **request.form})  # type: ignore
                 password = UserPassword(**request.form)  # type: ignore
+                password_hash = hash_password(password.password.get_secret_value())
+                create_user(domain, user, password_hash)
+                success = f"Пользователь {user.uid} создан успешно!"
             except ValidationError as e:
                 validation_errors = __validation_errors_to_dict(e)
-    return {"domain": domain, "validation_errors": validation_errors, "user": user}
+            except DIRECTORY_UNAVAILABLE_ERRORS:
+                raise
+            except ldap.LDAPError as e:  # type: ignore
+                error = (
+                    f"Не удалось создать пользователя {user_uid}: "
+                    f"{ldap_error_message(e)}"
+                )
+    return {
+        "domain": domain,
+        "error": error,
+        "validation_errors": validation_errors,
+        "user": user,
+        "success": success,
+    }
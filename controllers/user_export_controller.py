@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import ldapurl
+from flask import Response, abort, request, stream_with_context
+from ldap.filter import escape_filter_chars
+from ldif import LDIFWriter
+from werkzeug.http import dump_options_header
+from werkzeug.utils import secure_filename
+
+from controllers.user_controller import USER_ATTRIBUTES
+from models.ldap_connection import get_connection
+from models.settings import get_settings
+from utils.decorators import login_required
+from utils.ldap import bytes2str, get_domain_dn, iter_paged_search
+
+Entry = Tuple[str, Dict[str, List[bytes]]]
+
+
+class __EchoBuffer:
+    """
+    Буфер, возвращающий записанную строку, для получения строк из csv.writer
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def __export_csv(entries: Iterator[Entry]) -> Iterator[str]:
+    writer = csv.writer(__EchoBuffer())
+    yield writer.writerow(USER_ATTRIBUTES)
+    for _, attrs in entries:
+        yield writer.writerow(
+            [bytes2str(attrs[name][0]) if name in attrs else "" for name in USER_ATTRIBUTES]
+        )
+
+
+def __export_ndjson(entries: Iterator[Entry]) -> Iterator[str]:
+    for dn, attrs in entries:
+        user_data = {"dn": dn}
+        user_data.update({k: bytes2str(v[0]) for k, v in attrs.items()})
+        yield json.dumps(user_data, ensure_ascii=False) + "\n"
+
+
+def __export_ldif(entries: Iterator[Entry]) -> Iterator[str]:
+    for dn, attrs in entries:
+        buffer = io.StringIO()
+        LDIFWriter(buffer).unparse(dn, attrs)
+        yield buffer.getvalue()
+
+
+EXPORT_FORMATS: Dict[str, Tuple[str, Callable[[Iterator[Entry]], Iterator[str]]]] = {
+    "csv": ("text/csv", __export_csv),
+    "ndjson": ("application/x-ndjson", __export_ndjson),
+    "ldif": ("text/x-ldif", __export_ldif),
+}
+
+
+@login_required
+def user_export(domain: str):
+    """
+    Выгрузка пользователей домена в формате CSV, NDJSON или LDIF. Записи запрашиваются
+    у каталога постранично и отправляются клиенту по мере получения
+    """
+    export_format = request.args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return abort(400)
+    mimetype, serialize = EXPORT_FORMATS[export_format]
+
+    settings = get_settings()
+    connection = get_connection()
+
+    entries = iter_paged_search(
+        connection.conn,
+        f"ou=Users,{get_domain_dn(domain)}",
+        ldapurl.LDAP_SCOPE_ONELEVEL,
+        f"(&(objectClass=mailUser)(!(mail=@{escape_filter_chars(domain)})))",
+        USER_ATTRIBUTES,
+        settings.USERS_EXPORT_PAGE_SIZE,
+    )
+
+    return Response(
+        stream_with_context(serialize(entries)),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": dump_options_header(
+                "attachment",
+                {"filename": secure_filename(f"{domain}-users.{export_format}")},
+            )
+        },
+    )
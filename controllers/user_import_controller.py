@@ -0,0 +1,315 @@
+import csv
+import io
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Set, Tuple
+
+import ldap
+import ldapurl
+from flask import request
+from ldap.filter import escape_filter_chars
+from pydantic import ValidationError
+
+from controllers.user_controller import build_user_ldif
+from models.ldap_connection import DirectoryConnection, get_connection
+from models.settings import get_settings
+from models.user import User
+from models.user_password import UserPassword
+from utils.decorators import DIRECTORY_UNAVAILABLE_ERRORS, login_required, templated
+from utils.ldap import bytes2str, get_domain_dn, get_user_dn, ldap_error_message
+from utils.password_hashing import hash_passwords
+from utils.signals import directory_changed
+
+
+IMPORT_COLUMNS = {
+    "uid",
+    "password",
+    "cn",
+    "givenName",
+    "sn",
+    "mailQuota",
+    "employeeNumber",
+    "title",
+    "mobile",
+    "telephoneNumber",
+    "accountStatus",
+    "domainGlobalAdmin",
+}
+
+# Значения атрибутов accountStatus и domainGlobalAdmin, принятые в iRedMail.
+# Остальные значения (true/false, 1/0) проверяет модель пользователя
+IMPORT_FLAG_VALUES = {
+    "accountStatus": {"active": "true", "disabled": "false"},
+    "domainGlobalAdmin": {"yes": "true", "no": "false"},
+}
+
+
+class ImportRow:
+    """
+    Строка файла импорта, прошедшая проверку
+    """
+
+    __slots__ = ("line", "user", "password")
+
+    def __init__(self, line: int, user: User, password: str):
+        self.line = line
+        self.user = user
+        self.password = password
+
+
+def __row_error(line: int, uid: str, message: str) -> Dict:
+    return {"line": line, "uid": uid, "message": message}
+
+
+def __validation_error_message(e: ValidationError) -> str:
+    messages: Dict[str, str] = {}
+    for error_dict in e.errors():
+        field_name = ".".join(str(loc) for loc in error_dict["loc"])
+        msg = error_dict["msg"].replace("Value error,", "").strip()
+        # Пароль и его подтверждение в файле совпадают, поэтому ошибки дублируются
+        messages.setdefault(msg, f"{field_name}: {msg}")
+    return "; ".join(messages.values())
+
+
+def __open_csv(stream: io.TextIOBase) -> csv.DictReader:
+    """
+    Открывает CSV-файл, определяя разделитель (запятая или точка с запятой) по строке
+    заголовка
+    """
+    header = stream.readline()
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    fieldnames = [
+        name.strip() for name in next(csv.reader([header], delimiter=delimiter), [])
+    ]
+    return csv.DictReader(stream, fieldnames=fieldnames, delimiter=delimiter)
+
+
+def __parse_rows(
+    reader: csv.DictReader, errors: List[Dict]
+) -> Iterator[ImportRow]:
+    """
+    Построчно проверяет данные файла импорта. Строки с ошибками попадают в отчет,
+    корректные строки выдаются по мере чтения файла
+
+    >>> reader = __open_csv(io.StringIO(
+    ...     "uid;password;accountStatus;domainGlobalAdmin\\n"
+    ...     "john;Secret#123;disabled;yes\\n"
+    ...     "john;Secret#123;active;no\\n"
+    ...     "mary;Secret#123;unknown;no\\n"
+    ...     "ann;Secret#123;true;0\\n"
+    ... ))
+    >>> errors = []
+    >>> [
+    ...     (row.line, row.user.uid, row.user.accountStatus, row.user.domainGlobalAdmin)
+    ...     for row in __parse_rows(reader, errors)
+    ... ]
+    [(2, 'john', False, True), (5, 'ann', True, False)]
+    >>> [(error["line"], error["uid"]) for error in errors]
+    [(3, 'john'), (4, 'mary')]
+    """
+    seen_uids: Set[str] = set()
+
+    for row in reader:
+        # Строка заголовка прочитана до создания reader
+        line = reader.line_num + 1
+        data = {
+            name: value.strip()
+            for name, value in row.items()
+            if name in IMPORT_COLUMNS and value is not None and value.strip()
+        }
+        for name, values in IMPORT_FLAG_VALUES.items():
+            if name in data:
+                data[name] = values.get(data[name].lower(), data[name])
+        uid = data.get("uid", "")
+        password = data.pop("password", "")
+
+        if uid.lower() in seen_uids:
+            errors.append(__row_error(line, uid, "Идентификатор повторяется в файле"))
+            continue
+
+        try:
+            user = User(**{"accountStatus": True, **data})  # type: ignore
+            UserPassword(password=password, password_repeat=password)  # type: ignore
+        except ValidationError as e:
+            errors.append(__row_error(line, uid, __validation_error_message(e)))
+            continue
+
+        seen_uids.add(uid.lower())
+        yield ImportRow(line, user, password)
+
+
+def __find_existing_uids(
+    connection: DirectoryConnection, domain: str, uids: List[str]
+) -> Set[str]:
+    """
+    Одним запросом проверяет, какие из идентификаторов уже заняты в домене
+    """
+    uid_filter = "".join(f"(uid={escape_filter_chars(uid)})" for uid in uids)
+    query_result = connection.conn.search_s(
+        f"ou=Users,{get_domain_dn(domain)}",
+        ldapurl.LDAP_SCOPE_ONELEVEL,
+        f"(&(objectClass=mailUser)(|{uid_filter}))",
+        ["uid"],
+    )
+    return {
+        bytes2str(value).lower()
+        for _, attrs in query_result
+        for value in attrs.get("uid", [])
+    }
+
+
+def __import_batch(
+    connection: DirectoryConnection, domain: str, batch: List[ImportRow], report: Dict
+):
+    """
+    Создает пользователей пачки строк. Хэши паролей пачки вычисляются параллельно
+    в пуле процессов. Запросы на добавление отправляются асинхронно,
+    не дожидаясь ответа на предыдущие, но не более USERS_IMPORT_PIPELINE_DEPTH
+    одновременно. При потере соединения с каталогом строки пачки, ответ на которые
+    не получен или запрос для которых не отправлен, попадают в отчет, а исключение
+    передается вызывающей функции
+    """
+    settings = get_settings()
+    pending: Deque[Tuple[int, ImportRow]] = deque()
+    # Строки пачки, запросы на добавление которых еще не отправлены
+    unsent: List[ImportRow] = list(batch)
+
+    def collect_result():
+        msgid, row = pending[0]
+        try:
+            connection.conn.result3(msgid)
+        except DIRECTORY_UNAVAILABLE_ERRORS:
+            # Результат добавления неизвестен, строка остается в очереди
+            raise
+        except ldap.LDAPError as e:  # type: ignore
+            report["errors"].append(
+                __row_error(row.line, row.user.uid, ldap_error_message(e))
+            )
+        else:
+            report["created"] += 1
+        pending.popleft()
+
+    try:
+        existing_uids = __find_existing_uids(
+            connection, domain, [row.user.uid for row in batch]
+        )
+
+        new_rows: List[ImportRow] = []
+        for row in batch:
+            if row.user.uid.lower() in existing_uids:
+                report["errors"].append(
+                    __row_error(
+                        row.line,
+                        row.user.uid,
+                        f"Пользователь с идентификатором {row.user.uid} уже существует",
+                    )
+                )
+            else:
+                new_rows.append(row)
+        unsent = list(new_rows)
+
+        password_hashes = hash_passwords([row.password for row in new_rows])
+
+        for row, password_hash in zip(new_rows, password_hashes):
+            msgid = connection.conn.add_ext(
+                get_user_dn(row.user.uid, domain),
+                build_user_ldif(domain, row.user, password_hash),
+            )
+            pending.append((msgid, row))
+            unsent.pop(0)
+            if len(pending) >= settings.USERS_IMPORT_PIPELINE_DEPTH:
+                collect_result()
+
+        while pending:
+            collect_result()
+    except DIRECTORY_UNAVAILABLE_ERRORS:
+        for _, row in pending:
+            report["errors"].append(
+                __row_error(
+                    row.line,
+                    row.user.uid,
+                    "Соединение с каталогом потеряно до получения ответа: "
+                    "пользователь мог быть создан, проверьте его наличие",
+                )
+            )
+        for row in unsent:
+            report["errors"].append(
+                __row_error(
+                    row.line,
+                    row.user.uid,
+                    "Соединение с каталогом потеряно: пользователь не создан",
+                )
+            )
+        raise
+
+
+def import_users(domain: str, stream: io.TextIOBase) -> Dict:
+    """
+    Импортирует пользователей домена из CSV-файла. Файл читается потоково и
+    обрабатывается пачками по USERS_IMPORT_BATCH_SIZE строк
+
+    Аргументы:
+      domain: доменное имя
+      stream: текстовый поток с CSV-файлом. Первая строка должна содержать
+        наименования столбцов, обязательны столбцы uid и password
+    Возвращаемое значение:
+      словарь с количеством созданных пользователей (created), списком ошибок
+      по строкам (errors) и сообщением о прерывании импорта из-за потери
+      соединения с каталогом (aborted) или None
+    """
+    settings = get_settings()
+    report: Dict = {"created": 0, "errors": [], "aborted": None}
+
+    reader = __open_csv(stream)
+    missing_columns = {"uid", "password"} - set(reader.fieldnames or [])
+    if missing_columns:
+        report["errors"].append(
+            __row_error(
+                1, "", f"В файле отсутствуют столбцы: {', '.join(sorted(missing_columns))}"
+            )
+        )
+        return report
+
+    connection = get_connection()
+    batch: List[ImportRow] = []
+    try:
+        for row in __parse_rows(reader, report["errors"]):
+            batch.append(row)
+            if len(batch) >= settings.USERS_IMPORT_BATCH_SIZE:
+                __import_batch(connection, domain, batch, report)
+                batch = []
+        if batch:
+            __import_batch(connection, domain, batch, report)
+    except DIRECTORY_UNAVAILABLE_ERRORS:
+        report["aborted"] = (
+            "Соединение с каталогом потеряно, импорт прерван. "
+            f"Строки после {batch[-1].line} не обработаны"
+        )
+    finally:
+        if report["created"]:
+            directory_changed.send(domain, dn=None)
+
+    report["errors"].sort(key=lambda error: error["line"])
+    return report
+
+
+@login_required
+@templated()
+def user_import(domain: str):
+    """
+    Отображение страницы импорта пользователей из CSV-файла
+    """
+    error = None
+    report = None
+
+    if request.method == "POST":
+        file = request.files.get("file")
+        if not file or not file.filename:
+            error = "Выберите файл для импорта"
+        else:
+            stream = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")  # type: ignore
+            try:
+                report = import_users(domain, stream)
+            except (UnicodeDecodeError, csv.Error) as e:
+                error = f"Не удалось прочитать файл: {e}"
+
+    return {"domain": domain, "error": error, "report": report}
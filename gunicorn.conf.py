@@ -0,0 +1,56 @@
+"""
+Настройки gunicorn. Значения берутся из настроек приложения SERVER_*:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Пулы соединений учетных записей, выполнивших вход, существуют только в рабочем
+процессе, обработавшем вход. Поэтому по умолчанию запускается один рабочий
+процесс, а запросы обрабатываются параллельно SERVER_THREADS потоками.
+Несколько рабочих процессов можно запускать в режиме LDAP_PROXY_AUTHZ с
+хранилищем сеансов SESSION_STORE=sqlite: запросы выполняются через общий пул
+служебной учетной записи, а сеансы доступны всем процессам
+"""
+
+from models.settings import get_settings
+
+settings = get_settings()
+
+bind = settings.SERVER_BIND
+workers = settings.SERVER_WORKERS
+threads = settings.SERVER_THREADS
+worker_class = "gthread"
+timeout = settings.SERVER_TIMEOUT
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+preload_app = settings.SERVER_PRELOAD
+
+
+def on_starting(server):
+    shared_sessions = settings.LDAP_PROXY_AUTHZ and settings.SESSION_STORE == "sqlite"
+    if workers > 1 and not shared_sessions:
+        server.log.warning(
+            "SERVER_WORKERS=%s: сеанс пользователя действителен только в рабочем "
+            "процессе, выполнившем вход; запросы, переданные другим процессам, "
+            "завершают сеанс (см. LDAP_PROXY_AUTHZ и SESSION_STORE=sqlite)",
+            workers,
+        )
+
+
+def post_worker_init(worker):
+    """
+    При предварительной загрузке приложения соединения, открытые в главном
+    процессе, отсоединяются в рабочих процессах после fork, поэтому заранее
+    открываемые соединения открываются заново в каждом рабочем процессе
+    """
+    if preload_app and settings.WARM_UP_ON_START:
+        from utils.preflight import warm_up
+        from wsgi import application
+
+        for result in warm_up(application, ["connections"]):
+            if result["error"]:
+                worker.log.error("%s: %s", result["title"], result["error"])
+
+
+def worker_exit(server, worker):
+    from wsgi import shutdown
+
+    shutdown()
@@ -0,0 +1,434 @@
+import bisect
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import ldap
+import ldapurl
+from ldap.ldapobject import LDAPObject
+from ldap.syncrepl import SyncreplConsumer
+
+from models.ldap_connection import (
+    LDAPConnection,
+    current_identity,
+    has_directory_access,
+)
+from models.settings import get_settings
+from utils.ldap import EntryPage, bytes2str
+from utils.signals import directory_changed
+
+
+# Атрибуты, хранящиеся в зеркале. Должны включать все атрибуты доменов и
+# пользователей, которые контроллеры читают из зеркала
+MIRROR_ATTRIBUTES = [
+    "objectClass",
+    "domainName",
+    "domainCurrentUserNumber",
+    "mail",
+    "uid",
+    "accountStatus",
+    "domainGlobalAdmin",
+    "mailQuota",
+    "cn",
+    "givenName",
+    "sn",
+    "title",
+    "telephoneNumber",
+    "mobile",
+    "employeeNumber",
+]
+
+# Признак cookie страницы, выданного зеркалом, а не сервером каталога
+MIRROR_CURSOR_PREFIX = b"mirror:"
+
+Entry = Tuple[str, Dict[str, List[bytes]]]
+
+
+class MirrorConsumer(LDAPObject, SyncreplConsumer):
+    """
+    Соединение, передающее изменения, полученные по протоколу syncrepl, в зеркало
+    """
+
+    mirror: "DirectoryMirror"
+
+    def syncrepl_get_cookie(self):
+        return self.mirror.cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self.mirror.cookie = cookie
+
+    def syncrepl_entry(self, dn, attrs, uuid):
+        self.mirror.apply_entry(dn, attrs, uuid)
+
+    def syncrepl_delete(self, uuids):
+        self.mirror.apply_delete(uuids)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        self.mirror.apply_present(uuids, refreshDeletes)
+
+    def syncrepl_refreshdone(self):
+        self.mirror.refresh_done()
+
+
+class DirectoryMirror:
+    """
+    Копия доменов (mailDomain) и пользователей (mailUser) каталога в памяти
+    процесса. Копия заполняется и поддерживается в актуальном состоянии поиском
+    в режиме refreshAndPersist (RFC 4533) на одном постоянном соединении
+    служебной учетной записи в фоновом потоке. Изменения, выполненные приложением,
+    попадают в зеркало так же, как и любые другие, - после получения от сервера.
+    До их получения (но не дольше DIRECTORY_MIRROR_WRITE_GRACE секунд) измененные
+    записи читаются из каталога
+    """
+
+    def __init__(self):
+        self.cookie: Optional[str] = None
+
+        # Записи доменов и пользователей по entryUUID
+        self.__entries: Dict[str, Entry] = {}
+        self.__domains: Dict[str, str] = {}
+        self.__users: Dict[str, str] = {}
+        # Отсортированные адреса пользователей каждого домена
+        self.__domain_users: Dict[str, List[str]] = {}
+        # entryUUID записей, присутствие которых подтверждено на этапе обновления
+        self.__present: Set[str] = set()
+        # Сроки ожидания изменений, выполненных приложением
+        self.__pending_users: Dict[str, float] = {}
+        self.__pending_domains: Dict[str, float] = {}
+
+        self.__ready = threading.Event()
+        self.__stop = threading.Event()
+        self.__lock = threading.RLock()
+        self.__thread: Optional[threading.Thread] = None
+        self.__connection: Optional[LDAPConnection] = None
+
+    @property
+    def ready(self) -> bool:
+        """
+        Истина, если зеркало заполнено и соединение с каталогом установлено
+        """
+        return self.__ready.is_set()
+
+    def start(self):
+        self.__thread = threading.Thread(
+            target=self.__run, name="directory-mirror", daemon=True
+        )
+        self.__thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self.__stop.set()
+        if self.__thread:
+            self.__thread.join(timeout)
+
+    def detach(self):
+        """
+        Отсоединяет соединение зеркала, унаследованное дочерним процессом при
+        fork. Поток зеркала в дочернем процессе не существует
+        """
+        connection, self.__connection = self.__connection, None
+        if connection:
+            connection.detach()
+
+    def __run(self):
+        settings = get_settings()
+
+        while not self.__stop.is_set():
+            connection: Optional[LDAPConnection] = None
+            try:
+                connection = LDAPConnection(
+                    settings.LDAP_USER,
+                    settings.LDAP_PASSWORD,
+                    ldap_object_class=MirrorConsumer,
+                )
+                connection.conn.mirror = self
+                self.__connection = connection
+                if self.cookie is None:
+                    # Без cookie сервер не сообщает об удаленных записях
+                    self.__clear()
+                with self.__lock:
+                    self.__present.clear()
+
+                msgid = connection.conn.syncrepl_search(
+                    settings.LDAP_ROOT_DN,
+                    ldapurl.LDAP_SCOPE_SUBTREE,
+                    mode="refreshAndPersist",
+                    filterstr="(|(objectClass=mailDomain)(objectClass=mailUser))",
+                    attrlist=MIRROR_ATTRIBUTES,
+                )
+                while not self.__stop.is_set():
+                    try:
+                        if not connection.conn.syncrepl_poll(msgid=msgid, timeout=1):
+                            break
+                    except ldap.TIMEOUT:  # type: ignore
+                        pass
+            except ldap.SERVER_DOWN:  # type: ignore
+                pass
+            except ldap.LDAPError:  # type: ignore
+                # Например, недействительный cookie: зеркало заполняется заново
+                self.cookie = None
+            finally:
+                self.__ready.clear()
+                self.__connection = None
+                if connection:
+                    connection.close()
+
+            self.__stop.wait(settings.DIRECTORY_MIRROR_RETRY_INTERVAL)
+
+    def __clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__domains.clear()
+            self.__users.clear()
+            self.__domain_users.clear()
+            self.__present.clear()
+
+    def __forget(self, uuid: str):
+        entry = self.__entries.pop(uuid, None)
+        if entry is None:
+            return
+
+        attrs = entry[1]
+        domain = bytes2str(attrs.get("domainName", [b""])[0]).lower()
+        if self.__domains.get(domain) == uuid:
+            del self.__domains[domain]
+
+        mail = bytes2str(attrs.get("mail", [b""])[0]).lower()
+        if self.__users.get(mail) == uuid:
+            del self.__users[mail]
+            mails = self.__domain_users.get(mail.rsplit("@", 1)[-1], [])
+            index = bisect.bisect_left(mails, mail)
+            if index < len(mails) and mails[index] == mail:
+                del mails[index]
+
+    def apply_entry(self, dn: str, attrs: Dict[str, List[bytes]], uuid: str):
+        object_classes = {
+            bytes2str(value).lower() for value in attrs.get("objectClass", [])
+        }
+
+        with self.__lock:
+            self.__forget(uuid)
+            self.__present.add(uuid)
+            self.__entries[uuid] = (dn, attrs)
+
+            if "maildomain" in object_classes:
+                domain = bytes2str(attrs.get("domainName", [b""])[0]).lower()
+                self.__domains[domain] = uuid
+
+            if "mailuser" in object_classes:
+                mail = bytes2str(attrs.get("mail", [b""])[0]).lower()
+                if mail.find("@") > 0:
+                    self.__users[mail] = uuid
+                    bisect.insort(
+                        self.__domain_users.setdefault(mail.rsplit("@", 1)[1], []),
+                        mail,
+                    )
+                self.__pending_users.pop(mail, None)
+
+    def apply_delete(self, uuids: List[str]):
+        with self.__lock:
+            for uuid in uuids:
+                self.__forget(uuid)
+                self.__present.discard(uuid)
+
+    def apply_present(self, uuids: Optional[List[str]], refresh_deletes: bool):
+        with self.__lock:
+            if uuids is None:
+                if not refresh_deletes:
+                    # Записи, присутствие которых не подтверждено, удалены
+                    self.apply_delete(
+                        [uuid for uuid in self.__entries if uuid not in self.__present]
+                    )
+                self.__present.clear()
+            elif refresh_deletes:
+                self.apply_delete(uuids)
+            else:
+                self.__present.update(uuids)
+
+    def refresh_done(self):
+        self.__ready.set()
+
+    def mark_changed(self, domain: str, dn: Optional[str] = None):
+        """
+        Отмечает запись (или все записи домена, если dn равен None), измененную
+        приложением. До получения изменения от сервера она читается из каталога
+        """
+        deadline = time.monotonic() + get_settings().DIRECTORY_MIRROR_WRITE_GRACE
+        with self.__lock:
+            if dn is None:
+                self.__pending_domains[domain.lower()] = deadline
+            else:
+                mail = dn.split(",", 1)[0].split("=", 1)[-1].lower()
+                self.__pending_users[mail] = deadline
+
+    def __is_pending(self, pending: Dict[str, float], key: str) -> bool:
+        deadline = pending.get(key)
+        if deadline is None:
+            return False
+        if deadline < time.monotonic():
+            del pending[key]
+            return False
+        return True
+
+    def __project(self, uuid: str, attrlist: List[str]) -> Entry:
+        dn, attrs = self.__entries[uuid]
+        return dn, {name: attrs[name] for name in attrlist if name in attrs}
+
+    def get_domains(self, attrlist: List[str]) -> Optional[List[Entry]]:
+        """
+        Возвращает записи всех доменов или None, если их следует прочитать из
+        каталога
+        """
+        with self.__lock:
+            if any(
+                self.__is_pending(self.__pending_domains, domain)
+                for domain in list(self.__pending_domains)
+            ):
+                return None
+            return [
+                self.__project(uuid, attrlist)
+                for _, uuid in sorted(self.__domains.items())
+            ]
+
+    def get_user(
+        self, domain: str, user_id: str, attrlist: List[str]
+    ) -> Optional[Tuple[bool, Optional[Entry]]]:
+        """
+        Возвращает запись пользователя
+
+        Возвращаемое значение:
+          кортеж из признака наличия пользователя и его записи или None, если
+          запись следует прочитать из каталога
+        """
+        domain = domain.lower()
+        mail = f"{user_id}@{domain}".lower()
+        with self.__lock:
+            if self.__is_pending(self.__pending_domains, domain) or self.__is_pending(
+                self.__pending_users, mail
+            ):
+                return None
+            uuid = self.__users.get(mail)
+            if uuid is None:
+                return False, None
+            return True, self.__project(uuid, attrlist)
+
+    def get_domain_users(
+        self, domain: str, attrlist: List[str]
+    ) -> Optional[List[Entry]]:
+        """
+        Возвращает все записи пользователей домена, упорядоченные по адресу, или
+        None, если их следует прочитать из каталога
+        """
+        domain = domain.lower()
+        with self.__lock:
+            if self.__is_pending(self.__pending_domains, domain):
+                return None
+            return [
+                self.__project(self.__users[mail], attrlist)
+                for mail in self.__domain_users.get(domain, [])
+            ]
+
+    def get_users(
+        self,
+        domain: str,
+        attrlist: List[str],
+        page: int,
+        page_size: int,
+        cursor: bytes = b"",
+    ) -> Optional[EntryPage]:
+        """
+        Возвращает страницу записей пользователей домена, упорядоченных по адресу,
+        или None, если их следует прочитать из каталога. Cookie страницы содержит
+        адрес последнего пользователя на ней, следующая страница начинается после
+        него
+        """
+        domain = domain.lower()
+        with self.__lock:
+            if self.__is_pending(self.__pending_domains, domain):
+                return None
+
+            mails = self.__domain_users.get(domain, [])
+            if cursor.startswith(MIRROR_CURSOR_PREFIX):
+                after = cursor[len(MIRROR_CURSOR_PREFIX) :].decode()
+                start = bisect.bisect_right(mails, after)
+            else:
+                start = (page - 1) * page_size
+
+            page_mails = mails[start : start + page_size]
+            entries = [
+                self.__project(self.__users[mail], attrlist) for mail in page_mails
+            ]
+
+        cookie = b""
+        if page_mails and start + page_size < len(mails):
+            cookie = MIRROR_CURSOR_PREFIX + page_mails[-1].encode()
+        return EntryPage(entries, cookie)
+
+
+__mirror: Optional[DirectoryMirror] = None
+__mirror_lock = threading.Lock()
+
+
+def get_directory_mirror() -> Optional[DirectoryMirror]:
+    """
+    Возвращает зеркало каталога, если оно включено настройкой
+    DIRECTORY_MIRROR_ENABLED и заполнено. Зеркало запускается при первом
+    обращении, до завершения его заполнения данные читаются из каталога.
+    Зеркало заполняется служебной учетной записью, поэтому учетным записям без
+    доступа ко всему каталогу (см. has_directory_access) оно не выдается: их
+    запросы выполняются через их собственные соединения
+    """
+    global __mirror
+
+    if not get_settings().DIRECTORY_MIRROR_ENABLED:
+        return None
+
+    with __mirror_lock:
+        if __mirror is None:
+            __mirror = DirectoryMirror()
+            __mirror.start()
+        mirror = __mirror
+
+    if not mirror.ready or not has_directory_access(current_identity()):
+        return None
+    return mirror
+
+
+def stop_directory_mirror(timeout: Optional[float] = None):
+    """
+    Останавливает зеркало каталога, если оно запущено, ожидая завершения его
+    потока не дольше timeout секунд
+    """
+    global __mirror
+
+    with __mirror_lock:
+        mirror, __mirror = __mirror, None
+    if mirror:
+        mirror.stop(timeout)
+
+
+def __reset_after_fork():
+    """
+    Сбрасывает в дочернем процессе зеркало, унаследованное от родительского
+    процесса. Дочерний процесс запускает собственное зеркало при первом обращении
+    """
+    global __mirror, __mirror_lock
+
+    mirror, __mirror = __mirror, None
+    __mirror_lock = threading.Lock()
+    if mirror:
+        mirror.detach()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork)
+
+
+@directory_changed.connect
+def mark_mirror_changed(domain: str, dn: Optional[str] = None, **kwargs):
+    """
+    Передает зеркалу сведения об изменении записей приложением
+    """
+    with __mirror_lock:
+        mirror = __mirror
+    if mirror:
+        mirror.mark_changed(domain, dn)
@@ -0,0 +1,370 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import ldap
+import ldapurl
+from ldap.filter import escape_filter_chars
+
+from models.ldap_connection import (
+    DirectoryConnection,
+    LDAPConnection,
+    LDAPConnectionError,
+    LDAPPoolExhaustedError,
+    current_identity,
+    get_connection,
+    has_directory_access,
+    service_connection,
+)
+from models.settings import get_settings
+from utils.cache import TTLCache
+from utils.ldap import (
+    TimestampWatermark,
+    bytes2str,
+    get_domain_dn,
+    iter_paged_search,
+)
+from utils.signals import directory_changed
+
+
+__statistics_cache: Optional[TTLCache] = None
+
+# Отметка изменений, учтенных в статистике
+__watermark = TimestampWatermark()
+# Последняя вычисленная статистика доменов, отображаемая, пока статистика
+# вычисляется заново
+__latest: Dict[str, Dict[str, int]] = {}
+# Домены, статистика которых вычисляется в отдельном потоке
+__pending: Set[str] = set()
+__last_refresh = 0.0
+__refresh_lock = threading.Lock()
+# Блокировка изменения статистики доменов по сигналам directory_changed и времени
+# запуска планового обновления
+__update_lock = threading.Lock()
+
+STATISTICS_KEYS = ("users", "active", "disabled", "admins", "quota")
+
+
+def __get_statistics_cache() -> TTLCache:
+    global __statistics_cache
+    if __statistics_cache is None:
+        settings = get_settings()
+        __statistics_cache = TTLCache(
+            settings.DOMAIN_STATISTICS_CACHE_SIZE, settings.DOMAIN_STATISTICS_MAX_AGE
+        )
+    return __statistics_cache
+
+
+def __store(key: str, domain_statistics: Dict[str, int], generation: int):
+    """
+    Сохраняет статистику домена в кэш и запоминает ее как последнюю вычисленную
+    """
+    __get_statistics_cache().set(key, domain_statistics, generation)
+    __latest[key] = domain_statistics
+
+
+def __entry_statistics(attrs: Optional[Dict[str, List[bytes]]]) -> Dict[str, int]:
+    """
+    Возвращает вклад записи пользователя в статистику домена. Для отсутствующей
+    записи (None) вклад нулевой
+    """
+    if attrs is None:
+        return dict.fromkeys(STATISTICS_KEYS, 0)
+
+    active = bytes2str(attrs.get("accountStatus", [b""])[0]) == "active"
+    try:
+        quota = int(attrs.get("mailQuota", [b"0"])[0])
+    except ValueError:
+        quota = 0
+    return {
+        "users": 1,
+        "active": int(active),
+        "disabled": int(not active),
+        "admins": int(bytes2str(attrs.get("domainGlobalAdmin", [b""])[0]) == "yes"),
+        "quota": quota,
+    }
+
+
+@directory_changed.connect
+def update_domain_statistics(domain: str, dn: Optional[str] = None, **kwargs):
+    """
+    Изменяет статистику домена при изменении приложением записи его пользователя
+    на разность вкладов записи до (previous) и после (entry) изменения. Если
+    состояние записи до или после изменения не передано или изменено сразу
+    несколько записей (dn равен None), статистика домена сбрасывается и будет
+    вычислена заново после следующего обращения
+    """
+    cache = __get_statistics_cache()
+    key = domain.lower()
+    if dn is None or "previous" not in kwargs or "entry" not in kwargs:
+        cache.delete(key)
+        return
+
+    previous, entry = kwargs["previous"], kwargs["entry"]
+    before = __entry_statistics(previous)
+    after = __entry_statistics(entry)
+    with __update_lock:
+        domain_statistics = cache.get(key)
+        # Удаление записи сдвигает поколение кэша, поэтому статистика, вычисляемая
+        # одновременно и не учитывающая изменение, не будет сохранена
+        cache.delete(key)
+        if domain_statistics is not None:
+            __store(
+                key,
+                {
+                    name: domain_statistics[name] + after[name] - before[name]
+                    for name in STATISTICS_KEYS
+                },
+                cache.generation,
+            )
+
+
+def __count_domain(
+    connection: DirectoryConnection, domain: str, watermark: TimestampWatermark
+) -> Dict[str, int]:
+    """
+    Подсчитывает статистику домена, перебирая его пользователей постранично. В
+    памяти одновременно находится не более одной страницы записей, а поиск не
+    ограничивается лимитом размера результата сервера. Прочитанные записи
+    учитываются в отметке watermark
+    """
+    settings = get_settings()
+
+    entries = iter_paged_search(
+        connection.conn,
+        f"ou=Users,{get_domain_dn(domain)}",
+        ldapurl.LDAP_SCOPE_ONELEVEL,
+        f"(&(objectClass=mailUser)(!(mail=@{escape_filter_chars(domain)})))",
+        ["accountStatus", "domainGlobalAdmin", "mailQuota"]
+        + TimestampWatermark.ATTRIBUTES,
+        settings.USERS_EXPORT_PAGE_SIZE,
+    )
+
+    domain_statistics = dict.fromkeys(STATISTICS_KEYS, 0)
+    for dn, attrs in entries:
+        for name, value in __entry_statistics(attrs).items():
+            domain_statistics[name] += value
+        watermark.advance_entry(dn, attrs)
+    return domain_statistics
+
+
+def __compute(
+    connection: DirectoryConnection, domains: List[str]
+) -> Tuple[Dict[str, Dict[str, int]], TimestampWatermark]:
+    """
+    Подсчитывает статистику доменов
+
+    Возвращаемое значение:
+      статистика по доменам и отметка изменений, учитывающая прочитанные записи
+    """
+    watermark = TimestampWatermark()
+    statistics = {
+        domain: __count_domain(connection, domain, watermark) for domain in domains
+    }
+    return statistics, watermark
+
+
+def __find_changed_domains(
+    connection: LDAPConnection, since: TimestampWatermark
+) -> Tuple[Set[str], TimestampWatermark]:
+    """
+    Находит домены, пользователи которых изменены после установки отметки since.
+    Записи запрашиваются постранично, поэтому поиск не ограничивается лимитом
+    размера результата сервера после массовых изменений
+
+    Возвращаемое значение:
+      множество доменных имен и новая отметка изменений
+    """
+    settings = get_settings()
+
+    entries = iter_paged_search(
+        connection.conn,
+        settings.LDAP_ROOT_DN,
+        ldapurl.LDAP_SCOPE_SUBTREE,
+        f"(&(objectClass=mailUser){since.filter()})",
+        ["mail"] + TimestampWatermark.ATTRIBUTES,
+        settings.USERS_EXPORT_PAGE_SIZE,
+    )
+
+    domains = set()
+    watermark = since.copy()
+    for dn, attrs in entries:
+        # Записи, прочитанные в секунду отметки и с тех пор не измененные,
+        # снова находятся нестрогим условием поиска и пропускаются
+        if not since.is_entry_changed(dn, attrs):
+            continue
+        mail = bytes2str(attrs.get("mail", [b""])[0])
+        if mail.find("@") >= 0:
+            domains.add(mail.rsplit("@", 1)[1].lower())
+        watermark.advance_entry(dn, attrs)
+    return domains, watermark
+
+
+def refresh_domain_statistics():
+    """
+    Пересчитывает статистику доменов, пользователи которых изменены с момента
+    предыдущего обновления (в том числе другими программами). Изменения находятся
+    по атрибуту modifyTimestamp, пересчитываются только домены, статистика которых
+    уже вычислена. Удаление записей другими программами по modifyTimestamp не
+    обнаруживается, поэтому статистика каждого домена дополнительно вычисляется
+    заново не реже раза в DOMAIN_STATISTICS_MAX_AGE секунд
+    """
+    global __watermark
+
+    if not __refresh_lock.acquire(blocking=False):
+        # Обновление уже выполняется в другом потоке
+        return
+
+    try:
+        if not __watermark:
+            return
+
+        cache = __get_statistics_cache()
+        generation = cache.generation
+
+        with service_connection() as connection:
+            changed_domains, watermark = __find_changed_domains(
+                connection, __watermark
+            )
+            changed_domains = {
+                domain for domain in changed_domains if cache.get(domain) is not None
+            }
+            statistics, _ = __compute(connection, sorted(changed_domains))
+
+        for domain, domain_statistics in statistics.items():
+            __store(domain, domain_statistics, generation)
+        __watermark = watermark
+    finally:
+        __refresh_lock.release()
+
+
+def __refresh_in_background():
+    try:
+        refresh_domain_statistics()
+    except (
+        ldap.LDAPError,  # type: ignore
+        LDAPConnectionError,
+        LDAPPoolExhaustedError,
+    ):
+        # Отметка не сдвигается, изменения будут найдены следующим обновлением
+        pass
+
+
+def __schedule_refresh():
+    """
+    Запускает плановое обновление статистики в отдельном потоке, если с
+    предыдущего запуска прошло DOMAIN_STATISTICS_REFRESH_INTERVAL секунд. Запрос,
+    обнаруживший необходимость обновления, не ожидает его завершения
+    """
+    global __last_refresh
+
+    settings = get_settings()
+    with __update_lock:
+        now = time.monotonic()
+        if now - __last_refresh < settings.DOMAIN_STATISTICS_REFRESH_INTERVAL:
+            return
+        __last_refresh = now
+
+    threading.Thread(
+        target=__refresh_in_background, name="domain-statistics", daemon=True
+    ).start()
+
+
+def __compute_missing(keys: List[str]):
+    """
+    Вычисляет статистику доменов, отсутствующую в кэше
+    """
+    global __watermark
+
+    try:
+        cache = __get_statistics_cache()
+        generation = cache.generation
+        with service_connection() as connection:
+            statistics, watermark = __compute(connection, keys)
+
+        for key, domain_statistics in statistics.items():
+            __store(key, domain_statistics, generation)
+
+        # Отметка устанавливается один раз, далее ее сдвигает только плановое
+        # обновление, просматривающее все изменения с момента отметки
+        with __refresh_lock:
+            if not __watermark:
+                __watermark = watermark
+    except (
+        ldap.LDAPError,  # type: ignore
+        LDAPConnectionError,
+        LDAPPoolExhaustedError,
+    ):
+        # Статистика будет вычислена после следующего обращения
+        pass
+    finally:
+        with __update_lock:
+            __pending.difference_update(keys)
+
+
+def get_domain_statistics(
+    domains: List[str],
+) -> Dict[str, Optional[Dict[str, int]]]:
+    """
+    Возвращает статистику пользователей доменов. Статистика вычисляется в
+    отдельном потоке после первого обращения к домену и затем хранится в памяти.
+    Изменения, выполненные приложением, учитываются сразу, а выполненные другими
+    программами - плановым обновлением в отдельном потоке раз в
+    DOMAIN_STATISTICS_REFRESH_INTERVAL секунд. Пока статистика домена вычисляется,
+    возвращается последняя вычисленная статистика, а если ее нет - None.
+    Статистика вычисляется служебной учетной записью, поэтому учетным записям без
+    доступа ко всему каталогу (см. has_directory_access) она вычисляется при
+    каждом обращении через их собственное соединение
+
+    Аргументы:
+      domains: список доменных имен
+    Возвращаемое значение:
+      словарь, в котором для каждого домена указано количество пользователей
+      (users), активных (active) и заблокированных (disabled) пользователей,
+      глобальных администраторов (admins) и суммарная квота в байтах (quota)
+    """
+    if not has_directory_access(current_identity()):
+        statistics, _ = __compute(get_connection(), domains)
+        return dict(statistics)
+
+    __schedule_refresh()
+
+    cache = __get_statistics_cache()
+    result: Dict[str, Optional[Dict[str, int]]] = {}
+    missing = set()
+    for domain in domains:
+        key = domain.lower()
+        domain_statistics = cache.get(key)
+        if domain_statistics is None:
+            missing.add(key)
+            domain_statistics = __latest.get(key)
+        result[domain] = domain_statistics
+
+    with __update_lock:
+        keys = sorted(missing - __pending)
+        __pending.update(keys)
+    if keys:
+        threading.Thread(
+            target=__compute_missing,
+            args=(keys,),
+            name="domain-statistics",
+            daemon=True,
+        ).start()
+
+    return result
+
+
+def __reset_after_fork():
+    """
+    Сбрасывает в дочернем процессе блокировки и список вычисляемых доменов,
+    которые могли использовать потоки родительского процесса
+    """
+    global __refresh_lock, __update_lock
+
+    __refresh_lock = threading.Lock()
+    __update_lock = threading.Lock()
+    __pending.clear()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork)
@@ -1,17 +1,64 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
 import ldap
 from .settings import get_settings
-from ldap.dn import escape_dn_chars
+from contextlib import contextmanager
+from flask import g, session
+from ldap.filter import escape_filter_chars
 from ldap.ldapobject import LDAPObject
-from utils.ldap import get_email_dn
-from typing import Optional
+from utils.ldap import (
+    ProxyAuthzLDAPObject,
+    ReconnectingLDAPObject,
+    get_bind_dn,
+    get_email_dn,
+)
+from utils.cache import TTLCache
+from utils.metrics import InstrumentedLDAPObject
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type, Union
 import ldapurl
 
 
 class LDAPConnection:
 
-    def __init__(self, email: str, password: str):
+    def __init__(
+        self,
+        email: str,
+        password: str,
+        ldap_object_class: Optional[Type[LDAPObject]] = None,
+    ):
+        """
+        Аргументы:
+          email: адрес электронной почты или имя учетной записи
+          password: пароль
+          ldap_object_class: класс объекта соединения python-ldap, например с
+            примесью SyncreplConsumer. По умолчанию используется ldap.initialize,
+            соединение восстанавливается после потери (ReconnectingLDAPObject), а
+            при включенной настройке METRICS_ENABLED операции соединения
+            учитываются в статистике
+        """
+        self.__ldap_object_class = ldap_object_class
+
+        settings = get_settings()
+        if ldap_object_class:
+            self.conn = self.__open()
+        else:
+            self.conn = ReconnectingLDAPObject(
+                self.__open,
+                attempts=settings.LDAP_RECONNECT_ATTEMPTS,
+                delay=settings.LDAP_RECONNECT_DELAY,
+                max_delay=settings.LDAP_RECONNECT_MAX_DELAY,
+            )
+
+        self.bind(email, password)
+
+    def __open(self):
+        """
+        Открывает соединение с каталогом (без привязки)
+        """
         settings = get_settings()
-        # self.conn = None
         uri = str(settings.LDAP_URI)
 
         starttls = False
@@ -20,55 +67,682 @@ class LDAPConnection:
             uri = uri.replace("ldaps://", "ldap://")
             ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)  # type: ignore
 
-        self.conn = ldap.initialize(uri=uri, bytes_mode=False)
-        self.conn.set_option(ldap.OPT_PROTOCOL_VERSION, ldap.VERSION3)  # type: ignore
+        if self.__ldap_object_class:
+            conn = self.__ldap_object_class(uri, bytes_mode=False)
+        else:
+            conn = ldap.initialize(uri=uri, bytes_mode=False)
+            if settings.METRICS_ENABLED:
+                conn = InstrumentedLDAPObject(conn)
+        conn.set_option(ldap.OPT_PROTOCOL_VERSION, ldap.VERSION3)  # type: ignore
+        conn.set_option(
+            ldap.OPT_NETWORK_TIMEOUT, settings.LDAP_NETWORK_TIMEOUT  # type: ignore
+        )
 
         if starttls:
-            self.conn.start_tls_s()
+            conn.start_tls_s()
+        return conn
 
-        safe_email = escape_dn_chars(email)
-        if email.find("@") >= 0:
-            email_dn = get_email_dn(email)
-            self.conn.bind_s(email_dn, password)
+    def bind(self, email: str, password: str):
+        """
+        Выполняет привязку (bind) учетной записи на уже установленном соединении.
+        Повторная привязка не требует нового TCP-соединения и согласования TLS
+        """
+        self.conn.simple_bind_s(get_bind_dn(email), password)
+        self.last_used = time.monotonic()
 
-            qr = self.conn.search_s(
-                email_dn,
-                ldapurl.LDAP_SCOPE_BASE,
-                f"(&(domainGlobalAdmin=yes)(mail={safe_email}))",
-                ["domainGlobalAdmin"],
-            )
-            if not qr:
-                raise Exception(f"Пользователь {email} не является администратором!")
-        else:
-            self.conn.bind_s(f"cn={safe_email},{settings.LDAP_ROOT_DN}", password)
+    def is_alive(self) -> bool:
+        """
+        Проверяет работоспособность соединения дешевым запросом WhoAmI (RFC 4532)
+        """
+        try:
+            self.conn.whoami_s()
+            return True
+        except ldap.LDAPError:  # type: ignore
+            return False
 
-    def __del__(self):
+    def close(self):
+        """
+        Закрывает соединение с каталогом
+        """
+        conn, self.conn = getattr(self, "conn", None), None
         try:
-            if self.conn:
-                self.conn.unbind()
+            if conn:
+                conn.unbind()
         except:
             pass
 
+    def detach(self):
+        """
+        Отсоединяет соединение, унаследованное дочерним процессом при fork, не
+        затрагивая родительский процесс: дескриптор сокета в дочернем процессе
+        подменяется /dev/null, поэтому завершение соединения (unbind) при
+        удалении объекта не отправляется серверу по общему сокету
+        """
+        conn, self.conn = getattr(self, "conn", None), None
+        if conn is None:
+            return
+        try:
+            descriptor = conn.get_option(ldap.OPT_DESC)  # type: ignore
+            null = os.open(os.devnull, os.O_RDWR)
+            try:
+                os.dup2(null, descriptor)
+            finally:
+                os.close(null)
+        except (ldap.LDAPError, OSError, TypeError, ValueError):  # type: ignore
+            pass
+
+    def __del__(self):
+        self.close()
+
+
+class ProxiedConnection:
+    """
+    Соединение служебной учетной записи, операции которого выполняются от имени
+    учетной записи identity с помощью управляющего элемента Proxied Authorization
+    (RFC 4370). Права доступа к записям проверяются сервером для identity
+
+    Аргументы:
+      connection: соединение служебной учетной записи
+      identity: адрес электронной почты или имя учетной записи
+    """
+
+    def __init__(self, connection: LDAPConnection, identity: str):
+        self.connection = connection
+        self.identity = identity
+        self.conn = ProxyAuthzLDAPObject(
+            connection.conn, "dn:" + get_bind_dn(identity)
+        )
+
 
-__connection_instance: Optional[LDAPConnection] = None
+# Соединение, выдаваемое get_connection
+DirectoryConnection = Union[LDAPConnection, ProxiedConnection]
 
 
 class LDAPConnectionError(Exception): ...
 
 
-def get_connection(
-    email: Optional[str] = None, password: Optional[str] = None
-) -> LDAPConnection:
+class LDAPPoolExhaustedError(Exception):
+    """
+    Все соединения пула заняты, и ни одно не освободилось за время ожидания.
+    Учетные данные и соединения пула при этом остаются действительными
+    """
+
+
+class LDAPConnectionPool:
+    """
+    Пул соединений с каталогом, выполненных от имени одной учетной записи.
+    Соединения создаются по мере необходимости, но не более max_size одновременно.
+    Простаивающие дольше idle_timeout секунд соединения закрываются, а перед выдачей
+    соединения, простоявшего дольше health_check_interval секунд, проверяется его
+    работоспособность. Если свободное соединение не появилось за checkout_timeout
+    секунд, вызывается исключение LDAPPoolExhaustedError
+
+    Аргументы:
+      connection_class: класс соединения, по умолчанию LDAPConnection
+
+    >>> class Connection:
+    ...     def __init__(self, email, password):
+    ...         self.conn = object()
+    ...         self.last_used = 0.0
+    ...     def close(self):
+    ...         self.conn = None
+    >>> pool = LDAPConnectionPool(
+    ...     "admin@example.com",
+    ...     "secret",
+    ...     max_size=1,
+    ...     idle_timeout=60,
+    ...     health_check_interval=60,
+    ...     checkout_timeout=0.01,
+    ...     connection_class=Connection,
+    ... )
+    >>> connection = pool.acquire()
+    >>> pool.acquire()  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    LDAPPoolExhaustedError: Превышено время ожидания свободного соединения с каталогом
+    >>> pool.release(connection)
+    >>> pool.acquire() is connection
+    True
+    >>> pool.close()
+    >>> pool.acquire()  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    LDAPConnectionError: Пул соединений закрыт
+    """
+
+    def __init__(
+        self,
+        email: str,
+        password: str,
+        max_size: int,
+        idle_timeout: float,
+        health_check_interval: float,
+        checkout_timeout: float,
+        connection_class: Callable[[str, str], LDAPConnection] = LDAPConnection,
+    ):
+        self.email = email
+        self.connection_class = connection_class
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self.__password = password
+        # Свободные соединения; в конце списка - использованные последними
+        self.__idle: List[LDAPConnection] = []
+        # Количество открытых соединений (свободных и выданных)
+        self.__size = 0
+        self.__closed = False
+        self.__condition = threading.Condition()
+
+    def has_password(self, password: str) -> bool:
+        """
+        Проверяет, совпадает ли пароль с паролем, с которым создан пул
+        """
+        return hmac.compare_digest(self.__password.encode(), password.encode())
+
+    def acquire(self) -> LDAPConnection:
+        """
+        Выдает свободное соединение из пула, при необходимости открывая новое.
+        Если пул заполнен, ожидает освобождения соединения не дольше checkout_timeout
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+
+        while True:
+            connection: Optional[LDAPConnection] = None
+            expired: List[LDAPConnection] = []
+
+            with self.__condition:
+                while True:
+                    if self.__closed:
+                        raise LDAPConnectionError("Пул соединений закрыт")
+
+                    expired += self.__pop_expired()
+                    if self.__idle:
+                        connection = self.__idle.pop()
+                        break
+                    if self.__size < self.max_size:
+                        self.__size += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LDAPPoolExhaustedError(
+                            "Превышено время ожидания свободного соединения с каталогом"
+                        )
+                    self.__condition.wait(remaining)
+
+            for expired_connection in expired:
+                expired_connection.close()
+
+            if connection is None:
+                try:
+                    return self.connection_class(self.email, self.__password)
+                except:
+                    self.__forget()
+                    raise
+
+            idle_time = time.monotonic() - connection.last_used
+            try:
+                if idle_time < self.health_check_interval or connection.is_alive():
+                    return connection
+            except:
+                # Место соединения в пуле освобождается при любой ошибке проверки
+                connection.close()
+                self.__forget()
+                raise
+
+            connection.close()
+            self.__forget()
+
+    def prefill(self, count: int) -> int:
+        """
+        Заранее открывает соединения, пока их количество не достигнет count (но не
+        более max_size)
+
+        Возвращаемое значение:
+          количество открытых соединений
+        """
+        opened = 0
+        while True:
+            with self.__condition:
+                if self.__closed or self.__size >= min(count, self.max_size):
+                    return opened
+                self.__size += 1
+
+            try:
+                connection = self.connection_class(self.email, self.__password)
+            except:
+                self.__forget()
+                raise
+            self.release(connection)
+            opened += 1
+
+    def release(self, connection: LDAPConnection):
+        """
+        Возвращает выданное ранее соединение в пул
+        """
+        with self.__condition:
+            if not self.__closed and connection.conn:
+                connection.last_used = time.monotonic()
+                self.__idle.append(connection)
+                self.__condition.notify()
+                return
+
+        connection.close()
+        self.__forget()
+
+    def close(self):
+        """
+        Закрывает все свободные соединения пула. Выданные соединения будут закрыты
+        при возврате в пул
+        """
+        with self.__condition:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+            self.__size -= len(idle)
+            self.__condition.notify_all()
+
+        for connection in idle:
+            connection.close()
+
+    def detach(self):
+        """
+        Отсоединяет пул, унаследованный дочерним процессом при fork. Соединения
+        пула отсоединяются методом LDAPConnection.detach, пул закрывается
+        """
+        self.__condition = threading.Condition()
+        self.__closed = True
+        idle, self.__idle = self.__idle, []
+        self.__size = 0
+        for connection in idle:
+            connection.detach()
+
+    def __pop_expired(self) -> List[LDAPConnection]:
+        threshold = time.monotonic() - self.idle_timeout
+        count = 0
+        while count < len(self.__idle) and self.__idle[count].last_used < threshold:
+            count += 1
+
+        expired, self.__idle = self.__idle[:count], self.__idle[count:]
+        self.__size -= count
+        return expired
+
+    def __forget(self):
+        with self.__condition:
+            self.__size -= 1
+            self.__condition.notify()
+
+
+__pools: Dict[str, LDAPConnectionPool] = {}
+__pools_lock = threading.Lock()
+
+# Пул соединений служебной учетной записи (LDAP_USER)
+__service_pool: Optional[LDAPConnectionPool] = None
+# Пул соединений для проверки учетных данных при входе
+__auth_pool: Optional[LDAPConnectionPool] = None
+# Пул соединений служебной учетной записи, через которые операции выполняются от
+# имени пользователей (LDAP_PROXY_AUTHZ)
+__proxy_pool: Optional[LDAPConnectionPool] = None
+# Отпечатки учетных данных, недавно проверенных в каталоге
+__verified_credentials: Optional[TTLCache] = None
+# Недавние результаты проверки учетных записей на права глобального администратора
+__global_admins: Optional[TTLCache] = None
+
+
+def __create_pool(
+    email: str, password: str, max_size: Optional[int] = None
+) -> LDAPConnectionPool:
+    settings = get_settings()
+    return LDAPConnectionPool(
+        email,
+        password,
+        max_size=max_size or settings.LDAP_POOL_MAX_SIZE,
+        idle_timeout=settings.LDAP_POOL_IDLE_TIMEOUT,
+        health_check_interval=settings.LDAP_POOL_HEALTH_CHECK_INTERVAL,
+        checkout_timeout=settings.LDAP_POOL_CHECKOUT_TIMEOUT,
+    )
+
+
+def __get_service_pool() -> LDAPConnectionPool:
+    global __service_pool
+    with __pools_lock:
+        if __service_pool is None:
+            settings = get_settings()
+            __service_pool = __create_pool(
+                settings.LDAP_USER,
+                settings.LDAP_PASSWORD,
+                settings.LDAP_SERVICE_POOL_MAX_SIZE,
+            )
+        return __service_pool
+
+
+def __get_auth_pool() -> LDAPConnectionPool:
+    global __auth_pool
+    with __pools_lock:
+        if __auth_pool is None:
+            settings = get_settings()
+            __auth_pool = __create_pool(
+                settings.LDAP_USER,
+                settings.LDAP_PASSWORD,
+                settings.LDAP_AUTH_POOL_MAX_SIZE,
+            )
+        return __auth_pool
+
+
+def __get_proxy_pool() -> LDAPConnectionPool:
+    global __proxy_pool
+    with __pools_lock:
+        if __proxy_pool is None:
+            settings = get_settings()
+            __proxy_pool = __create_pool(
+                settings.LDAP_USER,
+                settings.LDAP_PASSWORD,
+                settings.LDAP_PROXY_POOL_MAX_SIZE,
+            )
+        return __proxy_pool
+
+
+def __get_verified_credentials() -> TTLCache:
+    global __verified_credentials
+    with __pools_lock:
+        if __verified_credentials is None:
+            settings = get_settings()
+            __verified_credentials = TTLCache(
+                settings.LDAP_PROXY_CREDENTIALS_CACHE_SIZE,
+                settings.LDAP_PROXY_CREDENTIALS_TTL,
+            )
+        return __verified_credentials
+
+
+def __get_global_admins() -> TTLCache:
+    global __global_admins
+    with __pools_lock:
+        if __global_admins is None:
+            settings = get_settings()
+            __global_admins = TTLCache(
+                settings.LDAP_PROXY_CREDENTIALS_CACHE_SIZE,
+                settings.LDAP_PROXY_CREDENTIALS_TTL,
+            )
+        return __global_admins
+
+
+def __credentials_key(email: str, password: str) -> Tuple[str, bytes]:
+    """
+    Возвращает ключ кэша проверенных учетных данных: учетную запись и отпечаток
+    пароля. Пароли в памяти процесса не хранятся
+    """
+    digest = hmac.new(
+        get_settings().SECRET_KEY.encode(),
+        f"{email}\0{password}".encode(),
+        hashlib.sha256,
+    ).digest()
+    return email, digest
+
+
+def open_service_connections() -> int:
+    """
+    Заранее открывает LDAP_SERVICE_POOL_MIN_SIZE соединений служебной учетной
+    записи, чтобы первые запросы не тратили время на установку соединений. В
+    режиме LDAP_PROXY_AUTHZ столько же соединений открывается в пуле, через
+    который выполняются запросы пользователей
+
+    Возвращаемое значение:
+      количество открытых соединений
+    """
+    settings = get_settings()
+    opened = __get_service_pool().prefill(settings.LDAP_SERVICE_POOL_MIN_SIZE)
+    if settings.LDAP_PROXY_AUTHZ:
+        opened += __get_proxy_pool().prefill(settings.LDAP_SERVICE_POOL_MIN_SIZE)
+    return opened
+
+
+@contextmanager
+def service_connection() -> Iterator[LDAPConnection]:
+    """
+    Выдает соединение служебной учетной записи LDAP_USER на время блока with
+    """
+    pool = __get_service_pool()
+    connection = pool.acquire()
+    try:
+        yield connection
+    finally:
+        pool.release(connection)
+
+
+def __check_credentials(email: str, password: str):
+    """
+    Проверяет учетные данные привязкой (bind) на одном из заранее открытых соединений
+    пула проверки. Соединение уже согласовало TLS, поэтому проверка стоит одного
+    обмена bind. После проверки соединение возвращается в пул и перед следующей
+    проверкой привязывается заново
+    """
+    pool = __get_auth_pool()
+    connection = pool.acquire()
+    try:
+        connection.bind(email, password)
+    except ldap.INVALID_CREDENTIALS:  # type: ignore
+        raise
+    except ldap.LDAPError:  # type: ignore
+        # Состояние соединения неизвестно, в пул оно не возвращается
+        connection.close()
+        raise
+    finally:
+        pool.release(connection)
+
+
+def __is_global_admin(email: str) -> bool:
     """
-    Возвращает экземпляр настроек приложения. Настройки будут прочитаны из файла .env
-    или .env.prod (если данный файл представлен в рабочем каталоге приложения)
+    Проверяет, является ли учетная запись глобальным администратором. Запрос
+    выполняется по уже открытому соединению служебной учетной записи, результат
+    запоминается на LDAP_PROXY_CREDENTIALS_TTL секунд
     """
+    with service_connection() as connection:
+        try:
+            query_result = connection.conn.search_s(
+                get_email_dn(email),
+                ldapurl.LDAP_SCOPE_BASE,
+                f"(&(domainGlobalAdmin=yes)(mail={escape_filter_chars(email)}))",
+                ["domainGlobalAdmin"],
+            )
+        except ldap.NO_SUCH_OBJECT:  # type: ignore
+            query_result = []
+
+    is_admin = bool(query_result)
+    __get_global_admins().set(email, is_admin)
+    return is_admin
+
+
+def __check_admin(email: str):
+    """
+    Проверяет, что учетная запись является глобальным администратором
+    """
+    if not __is_global_admin(email):
+        raise LDAPConnectionError(f"Пользователь {email} не является администратором!")
+
+
+def has_directory_access(identity: Optional[str]) -> bool:
+    """
+    Проверяет, можно ли показывать учетной записи данные всего каталога,
+    прочитанные служебной учетной записью (зеркало каталога, индекс поиска,
+    статистику доменов). Доступ есть у служебной учетной записи LDAP_USER и
+    глобальных администраторов. Остальным учетным записям данные читаются через
+    их собственные соединения, чтобы действовали их права доступа
+    """
+    if not identity:
+        return False
+    if identity == get_settings().LDAP_USER:
+        return True
+    if identity.find("@") < 0:
+        return False
+
+    is_admin = __get_global_admins().get(identity)
+    if is_admin is None:
+        is_admin = __is_global_admin(identity)
+    return is_admin
+
+
+def login(email: str, password: str):
+    """
+    Выполняет аутентификацию учетной записи и регистрирует для нее пул соединений.
+    Пул открывает соединения по мере необходимости; если пул с тем же паролем
+    уже существует (учетная запись выполнила вход в другом сеансе), он сохраняется.
+    В режиме LDAP_PROXY_AUTHZ пул учетной записи не создается: запросы выполняются
+    через общий пул служебной учетной записи от имени пользователя
+    """
+    if not email or not password:
+        raise LDAPConnectionError("Не указаны учетные данные")
+
+    __check_credentials(email, password)
+    if email.find("@") >= 0:
+        __check_admin(email)
 
-    global __connection_instance
+    __get_verified_credentials().set(__credentials_key(email, password), True)
+    if get_settings().LDAP_PROXY_AUTHZ:
+        return
+
+    with __pools_lock:
+        previous_pool = __pools.get(email)
+        if previous_pool and previous_pool.has_password(password):
+            return
+        __pools[email] = __create_pool(email, password)
+    if previous_pool:
+        previous_pool.close()
+
+
+def check_login(email: str, password: str):
+    """
+    Проверяет учетные данные, не обращаясь к каталогу, если те же учетные данные
+    были проверены не ранее LDAP_PROXY_CREDENTIALS_TTL секунд назад (а вне режима
+    LDAP_PROXY_AUTHZ - если к тому же у учетной записи есть пул с тем же паролем).
+    Иначе выполняет вход функцией login. Если каталог отклонил пароль, с которым
+    создан пул учетной записи, пул закрывается. Предназначена для аутентификации
+    каждого запроса (например, в API)
+    """
+    verified = False
     if email and password:
-        __connection_instance = LDAPConnection(email, password)
+        key = __credentials_key(email, password)
+        verified = bool(__get_verified_credentials().get(key))
+
+    if get_settings().LDAP_PROXY_AUTHZ:
+        if not verified:
+            login(email, password)
+        return
+
+    with __pools_lock:
+        pool = __pools.get(email)
+    if pool and password and pool.has_password(password):
+        if verified:
+            return
+        try:
+            login(email, password)
+        except (ldap.INVALID_CREDENTIALS, LDAPConnectionError):  # type: ignore
+            # Пароль изменен или учетная запись больше не является администратором
+            with __pools_lock:
+                if __pools.get(email) is pool:
+                    del __pools[email]
+            pool.close()
+            raise
+        return
+    login(email, password)
+
+
+def current_identity() -> Optional[str]:
+    """
+    Возвращает учетную запись текущего запроса: аутентифицированную в самом запросе
+    (g.ldap_identity) или выполнившую вход в сеансе
+    """
+    return g.get("ldap_identity") or session.get("email")
+
+
+def get_connection() -> DirectoryConnection:
+    """
+    Возвращает соединение с каталогом для текущего запроса. Соединение берется из пула
+    учетной записи, выполнившей вход, и возвращается в пул по завершении запроса.
+    В режиме LDAP_PROXY_AUTHZ соединение берется из общего пула служебной учетной
+    записи, а операции выполняются от имени учетной записи, выполнившей вход
+    """
+    if "ldap_connection" in g:
+        return g.ldap_connection
+
+    identity = current_identity()
+    if get_settings().LDAP_PROXY_AUTHZ:
+        if not identity:
+            raise LDAPConnectionError("Аутентификация пользователя не выполнена")
+        pool = __get_proxy_pool()
+        pooled_connection = pool.acquire()
+        g.ldap_connection = ProxiedConnection(pooled_connection, identity)
+    else:
+        with __pools_lock:
+            pool = __pools.get(identity or "")
+        if not pool:
+            raise LDAPConnectionError("Аутентификация пользователя не выполнена")
+        pooled_connection = pool.acquire()
+        g.ldap_connection = pooled_connection
+
+    g.ldap_pooled_connection = pooled_connection
+    g.ldap_connection_pool = pool
+    return g.ldap_connection
+
 
-    elif not __connection_instance:
-        raise LDAPConnectionError("Аутентификация пользователя не выполнена")
+def release_connection(exception: Optional[BaseException] = None):
+    """
+    Возвращает в пул соединение, выданное для текущего запроса
+    """
+    g.pop("ldap_connection", None)
+    connection = g.pop("ldap_pooled_connection", None)
+    pool = g.pop("ldap_connection_pool", None)
+    if connection and pool:
+        pool.release(connection)
+
+
+def __reset_after_fork():
+    """
+    Отсоединяет в дочернем процессе пулы, унаследованные от родительского
+    процесса, например при предварительной загрузке приложения сервером перед
+    запуском рабочих процессов. Дочерний процесс открывает собственные соединения
+    """
+    global __pools_lock, __service_pool, __auth_pool, __proxy_pool
+    global __verified_credentials, __global_admins
+
+    pools = list(__pools.values()) + [
+        pool for pool in (__service_pool, __auth_pool, __proxy_pool) if pool
+    ]
+    __pools.clear()
+    __service_pool = __auth_pool = __proxy_pool = __verified_credentials = None
+    __global_admins = None
+    __pools_lock = threading.Lock()
+
+    for pool in pools:
+        pool.detach()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork)
+
+
+def close_connections(email: Optional[str] = None):
+    """
+    Закрывает пул соединений указанной учетной записи или все пулы, включая пулы
+    служебной учетной записи, если учетная запись не указана. Проверенные учетные
+    данные указанной учетной записи (или всех учетных записей) забываются
+    """
+    global __service_pool, __auth_pool, __proxy_pool
+
+    with __pools_lock:
+        if email is None:
+            pools = list(__pools.values()) + [
+                pool for pool in (__service_pool, __auth_pool, __proxy_pool) if pool
+            ]
+            __pools.clear()
+            __service_pool = __auth_pool = __proxy_pool = None
+        else:
+            pool = __pools.pop(email, None)
+            pools = [pool] if pool else []
+        verified_credentials = __verified_credentials
+
+    if verified_credentials is not None:
+        if email is None:
+            verified_credentials.clear()
+        else:
+            verified_credentials.delete_where(lambda key: key[0] == email)
 
-    return __connection_instance
+    for pool in pools:
+        pool.close()
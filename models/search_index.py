@@ -0,0 +1,298 @@
+import bisect
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import ldap
+import ldapurl
+from ldap.filter import escape_filter_chars
+
+from models.ldap_connection import (
+    DirectoryConnection,
+    LDAPConnectionError,
+    LDAPPoolExhaustedError,
+    service_connection,
+)
+from models.settings import get_settings
+from utils.ldap import TimestampWatermark, bytes2str, iter_paged_search
+from utils.signals import directory_changed
+
+
+SEARCH_INDEX_ATTRIBUTES = [
+    "mail",
+    "uid",
+    "cn",
+    "accountStatus",
+] + TimestampWatermark.ATTRIBUTES
+
+
+class SearchIndex:
+    """
+    Индекс пользователей всех доменов для поиска по началу адреса, идентификатора,
+    имени или любого слова имени. Ключи хранятся в отсортированном списке, поиск
+    выполняется двоичным поиском по префиксу
+    """
+
+    def __init__(self):
+        # Пары (ключ, адрес), упорядоченные по ключу
+        self.__keys: List[Tuple[str, str]] = []
+        self.__records: Dict[str, Dict[str, str]] = {}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __record_keys(record: Dict[str, str]) -> Set[str]:
+        keys = {record["mail"], record["uid"].lower()}
+        cn = record["cn"].lower()
+        if cn:
+            keys.add(cn)
+            keys.update(cn.split())
+        keys.discard("")
+        return keys
+
+    @staticmethod
+    def entry_to_record(attrs) -> Optional[Dict[str, str]]:
+        mail = bytes2str(attrs.get("mail", [b""])[0]).lower()
+        if mail.find("@") <= 0:
+            return None
+        return {
+            "mail": mail,
+            "uid": bytes2str(attrs.get("uid", [b""])[0]),
+            "cn": bytes2str(attrs.get("cn", [b""])[0]),
+            "domain": mail.rsplit("@", 1)[1],
+            "accountStatus": bytes2str(attrs.get("accountStatus", [b""])[0]),
+        }
+
+    def rebuild(self, entries: Iterable):
+        """
+        Заменяет содержимое индекса записями пользователей
+        """
+        records = {}
+        for _, attrs in entries:
+            record = self.entry_to_record(attrs)
+            if record:
+                records[record["mail"]] = record
+
+        keys = sorted(
+            (key, mail)
+            for mail, record in records.items()
+            for key in self.__record_keys(record)
+        )
+        with self.__lock:
+            self.__keys, self.__records = keys, records
+
+    def update(self, entries: Iterable):
+        """
+        Добавляет в индекс новые и измененные записи пользователей
+        """
+        for _, attrs in entries:
+            record = self.entry_to_record(attrs)
+            if not record:
+                continue
+
+            with self.__lock:
+                previous = self.__records.get(record["mail"])
+                if previous:
+                    for key in self.__record_keys(previous):
+                        self.__remove_key((key, previous["mail"]))
+
+                self.__records[record["mail"]] = record
+                for key in self.__record_keys(record):
+                    bisect.insort(self.__keys, (key, record["mail"]))
+
+    def __remove_key(self, item: Tuple[str, str]):
+        index = bisect.bisect_left(self.__keys, item)
+        if index < len(self.__keys) and self.__keys[index] == item:
+            del self.__keys[index]
+
+    def search(self, prefix: str, limit: int) -> List[Dict[str, str]]:
+        """
+        Возвращает не более limit пользователей, у которых адрес, идентификатор,
+        имя или одно из слов имени начинается с prefix (без учета регистра).
+        Пользователи упорядочены по совпавшему ключу
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        results: List[Dict[str, str]] = []
+        seen: Set[str] = set()
+        with self.__lock:
+            index = bisect.bisect_left(self.__keys, (prefix, ""))
+            while index < len(self.__keys) and len(results) < limit:
+                key, mail = self.__keys[index]
+                if not key.startswith(prefix):
+                    break
+                if mail not in seen:
+                    seen.add(mail)
+                    results.append(self.__records[mail])
+                index += 1
+        return results
+
+
+def search_directory(
+    connection: DirectoryConnection, prefix: str, limit: int
+) -> List[Dict[str, str]]:
+    """
+    Ищет пользователей так же, как SearchIndex.search, но запросом к каталогу
+    через соединение учетной записи, которой индекс недоступен (см.
+    has_directory_access). Пользователи упорядочены по адресу
+    """
+    prefix = escape_filter_chars(prefix.strip().lower())
+    if not prefix:
+        return []
+
+    settings = get_settings()
+    entries = iter_paged_search(
+        connection.conn,
+        settings.LDAP_ROOT_DN,
+        ldapurl.LDAP_SCOPE_SUBTREE,
+        f"(&(objectClass=mailUser)(|(mail={prefix}*)(uid={prefix}*)"
+        f"(cn={prefix}*)(cn=* {prefix}*)))",
+        SEARCH_INDEX_ATTRIBUTES,
+        limit,
+    )
+
+    records = []
+    for _, attrs in entries:
+        record = SearchIndex.entry_to_record(attrs)
+        if record:
+            records.append(record)
+        if len(records) >= limit:
+            break
+    entries.close()
+    return sorted(records, key=lambda record: record["mail"])
+
+
+__index: Optional[SearchIndex] = None
+# Отметка изменений, учтенных в индексе
+__watermark = TimestampWatermark()
+__built_at = 0.0
+__refreshed_at = 0.0
+__refresh_lock = threading.Lock()
+
+
+@directory_changed.connect
+def schedule_search_index_refresh(domain: str, **kwargs):
+    """
+    Назначает обновление индекса при следующем поиске после изменения записей
+    приложением
+    """
+    global __refreshed_at
+    __refreshed_at = 0.0
+
+
+def __search_users(connection, filterstr: str) -> List:
+    settings = get_settings()
+    return list(
+        iter_paged_search(
+            connection.conn,
+            settings.LDAP_ROOT_DN,
+            ldapurl.LDAP_SCOPE_SUBTREE,
+            filterstr,
+            SEARCH_INDEX_ATTRIBUTES,
+            settings.USERS_EXPORT_PAGE_SIZE,
+        )
+    )
+
+
+def __advance(entries: List, watermark: TimestampWatermark) -> TimestampWatermark:
+    watermark = watermark.copy()
+    for dn, attrs in entries:
+        watermark.advance_entry(dn, attrs)
+    return watermark
+
+
+def __is_stale() -> Tuple[bool, bool]:
+    """
+    Возвращает признаки необходимости полного перестроения и обновления индекса
+    """
+    settings = get_settings()
+    now = time.monotonic()
+    rebuild = __index is None or now - __built_at >= settings.SEARCH_INDEX_MAX_AGE
+    refresh = now - __refreshed_at >= settings.SEARCH_INDEX_REFRESH_INTERVAL
+    return rebuild, refresh
+
+
+def refresh_search_index():
+    """
+    Строит индекс одним постраничным поиском по всему каталогу или добавляет в
+    него записи, измененные с момента предыдущего обновления (по атрибуту
+    modifyTimestamp). Если обновление уже выполняется в другом потоке, ничего не
+    делает
+    """
+    global __index, __watermark, __built_at, __refreshed_at
+
+    if not __refresh_lock.acquire(blocking=False):
+        return
+
+    try:
+        rebuild, refresh = __is_stale()
+        if not rebuild and not refresh:
+            return
+
+        now = time.monotonic()
+        with service_connection() as connection:
+            if rebuild:
+                entries = __search_users(connection, "(objectClass=mailUser)")
+                index = SearchIndex()
+                index.rebuild(entries)
+                __index, __built_at = index, now
+                __watermark = __advance(entries, TimestampWatermark())
+            elif __watermark:
+                entries = [
+                    (dn, attrs)
+                    for dn, attrs in __search_users(
+                        connection, f"(&(objectClass=mailUser){__watermark.filter()})"
+                    )
+                    # Записи, прочитанные в секунду отметки и с тех пор не
+                    # измененные, снова находятся нестрогим условием поиска
+                    if __watermark.is_entry_changed(dn, attrs)
+                ]
+                __index.update(entries)  # type: ignore
+                __watermark = __advance(entries, __watermark)
+        __refreshed_at = now
+    finally:
+        __refresh_lock.release()
+
+
+def __refresh_in_background():
+    try:
+        refresh_search_index()
+    except (
+        ldap.LDAPError,  # type: ignore
+        LDAPConnectionError,
+        LDAPPoolExhaustedError,
+    ):
+        # Индекс обновится при следующем поиске
+        pass
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """
+    Возвращает текущий индекс поиска пользователей или None, если индекс еще
+    строится. Индекс строится в отдельном потоке при первом обращении. Раз в
+    SEARCH_INDEX_REFRESH_INTERVAL секунд (и после изменений, выполненных
+    приложением) в индекс в отдельном потоке добавляются измененные записи.
+    Удаленные записи исключаются из индекса при полном перестроении раз в
+    SEARCH_INDEX_MAX_AGE секунд. Запрос, обнаруживший необходимость обновления,
+    не ожидает его завершения и использует прежний индекс
+    """
+    rebuild, refresh = __is_stale()
+    if (rebuild or refresh) and not __refresh_lock.locked():
+        threading.Thread(
+            target=__refresh_in_background, name="search-index", daemon=True
+        ).start()
+    return __index
+
+
+def __reset_after_fork():
+    """
+    Сбрасывает в дочернем процессе блокировку обновления индекса, которую мог
+    удерживать поток родительского процесса
+    """
+    global __refresh_lock
+    __refresh_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork)
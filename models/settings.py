@@ -1,7 +1,7 @@
-from typing_extensions import Annotated, Literal
+from typing_extensions import Annotated, Literal, Self
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import AnyUrl, UrlConstraints, Field
-from typing import Optional, Union
+from pydantic import AnyUrl, UrlConstraints, Field, model_validator
+from typing import List, Optional, Union
 
 
 LDAPUrl = Annotated[AnyUrl, UrlConstraints(allowed_schemes=["ldap", "ldaps"])]
@@ -25,16 +25,117 @@ class Settings(BaseSettings):
     LDAP_ROOT_DN: str
 
     TEMPLATES_AUTO_RELOAD: bool = True
+    TEMPLATES_BYTECODE_CACHE_DIRECTORY: Optional[str] = None
+
+    WARM_UP_ON_START: bool = False
+
+    SESSION_STORE: Literal["cookie", "memory", "sqlite"] = "cookie"
+    SESSION_SQLITE_PATH: str = "sessions.sqlite3"
+    SESSION_LIFETIME: int = 43200
+
+    SERVER_BIND: str = "127.0.0.1:8000"
+    SERVER_WORKERS: int = 1
+    SERVER_THREADS: int = 8
+    SERVER_TIMEOUT: int = 60
+    SERVER_GRACEFUL_TIMEOUT: int = 30
+    SERVER_PRELOAD: bool = False
+
+    DOMAIN_LIST_CACHE_TTL: float = 300
+    DOMAIN_LIST_CACHE_SIZE: int = 256
+
+    DOMAIN_STATISTICS_REFRESH_INTERVAL: float = 60
+    DOMAIN_STATISTICS_MAX_AGE: float = 3600
+    DOMAIN_STATISTICS_CACHE_SIZE: int = 4096
+
+    DIRECTORY_MIRROR_ENABLED: bool = False
+    DIRECTORY_MIRROR_RETRY_INTERVAL: float = 5
+    DIRECTORY_MIRROR_WRITE_GRACE: float = 5
+
+    SEARCH_INDEX_REFRESH_INTERVAL: float = 30
+    SEARCH_INDEX_MAX_AGE: float = 3600
+    SEARCH_RESULTS_LIMIT: int = 20
+    SEARCH_RESULTS_LIMIT_MAX: int = 100
+
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: Optional[str] = None
+
+    ASSETS_BUILD_DIRECTORY: str = "dist"
+    ASSETS_MAX_AGE: int = 31536000
+
+    USER_CACHE_TTL: float = 60
+    USER_CACHE_SIZE: int = 1024
+
+    USERS_PAGE_SIZE: int = 100
+    USERS_PAGE_SIZE_MAX: int = 1000
+
+    USERS_EXPORT_PAGE_SIZE: int = 1000
+
+    USERS_IMPORT_BATCH_SIZE: int = 500
+    USERS_IMPORT_PIPELINE_DEPTH: int = 64
+
+    MAIL_STORAGE_BASE_DIRECTORY: str = "/var/vmail"
+    MAIL_STORAGE_NODE: str = "vmail1"
+    USER_ENABLED_SERVICES: List[str] = [
+        "mail",
+        "internal",
+        "doveadm",
+        "lib-storage",
+        "indexer-worker",
+        "dsync",
+        "quota-status",
+        "smtp",
+        "smtpsecured",
+        "submission",
+        "pop3",
+        "pop3secured",
+        "pop3tls",
+        "imap",
+        "imapsecured",
+        "imaptls",
+        "managesieve",
+        "managesievesecured",
+        "managesievetls",
+        "sieve",
+        "sievesecured",
+        "sievetls",
+        "deliver",
+        "lda",
+        "lmtp",
+        "recipientbcc",
+        "senderbcc",
+        "forward",
+        "shadowaddress",
+        "displayedInGlobalAddressBook",
+    ]
 
     LDAP_USER: str
     LDAP_PASSWORD: str
 
+    LDAP_POOL_MAX_SIZE: int = 4
+    LDAP_POOL_IDLE_TIMEOUT: float = 300
+    LDAP_POOL_HEALTH_CHECK_INTERVAL: float = 30
+    LDAP_POOL_CHECKOUT_TIMEOUT: float = 10
+    LDAP_NETWORK_TIMEOUT: float = 5
+    LDAP_RECONNECT_ATTEMPTS: int = 3
+    LDAP_RECONNECT_DELAY: float = 0.2
+    LDAP_RECONNECT_MAX_DELAY: float = 2
+    LDAP_SERVICE_POOL_MAX_SIZE: int = 4
+    LDAP_SERVICE_POOL_MIN_SIZE: int = 1
+    LDAP_AUTH_POOL_MAX_SIZE: int = 4
+    LDAP_PROXY_AUTHZ: bool = False
+    LDAP_PROXY_POOL_MAX_SIZE: int = 8
+    LDAP_PROXY_CREDENTIALS_TTL: float = 300
+    LDAP_PROXY_CREDENTIALS_CACHE_SIZE: int = 1024
+
     PASSWORD_MIN_LENGTH: int = 8
     PASSWORD_INCLUDES_SPECIAL_CHARS: bool = True
     PASSWORD_INCLUDES_NUMBERS: bool = True
     PASSWORD_INCLUDES_LOWERCASE: bool = True
     PASSWORD_INCLUDES_UPPERCASE: bool = True
     PASSWORD_HASHES_USE_PREFIXED_SCHEME: bool = True
+    PASSWORD_HASHING_WORKERS: int = 2
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_SHA512_CRYPT_ROUNDS: int = 5000
     PASSWORD_DEFAULT_SCHEME: Literal[
         "PLAIN",
         "CRYPT",
@@ -50,6 +151,20 @@ class Settings(BaseSettings):
         "NTLM",
     ] = "SSHA512"
 
+    @model_validator(mode="after")
+    def check_proxy_authz_session_store(self) -> Self:
+        """
+        В режиме LDAP_PROXY_AUTHZ выход пользователя должен отзывать сеанс: сеанс в
+        cookie продолжает действовать после выхода, если cookie скопирован, поэтому
+        требуется хранилище сеансов на сервере
+        """
+        if self.LDAP_PROXY_AUTHZ and self.SESSION_STORE == "cookie":
+            raise ValueError(
+                "LDAP_PROXY_AUTHZ требует хранилища сеансов на сервере: "
+                "SESSION_STORE=memory или SESSION_STORE=sqlite"
+            )
+        return self
+
 
 settings_instance: Optional[Settings] = None
 
@@ -1,4 +1,4 @@
-from typing import Any, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from typing_extensions import Self
 from pydantic import BaseModel, ValidationError, model_validator, ConfigDict
 
@@ -17,3 +17,54 @@ class User(BaseModel):
     mobile: str = ""
     telephoneNumber: str = ""
     domainGlobalAdmin: bool = False
+
+
+class UserRow:
+    """
+    Строка списка пользователей. В отличие от модели User не проверяется и содержит
+    только отображаемые в списке атрибуты, поэтому создается значительно быстрее и
+    занимает меньше памяти. Для форм изменения используется модель User
+    """
+
+    __slots__ = ("uid", "mailQuota", "accountStatus", "domainGlobalAdmin")
+
+    def __init__(
+        self, uid: str, mailQuota: int, accountStatus: bool, domainGlobalAdmin: bool
+    ):
+        self.uid = uid
+        self.mailQuota = mailQuota
+        self.accountStatus = accountStatus
+        self.domainGlobalAdmin = domainGlobalAdmin
+
+
+def __first_value(values: List[Union[bytes, str]], default: str) -> str:
+    value = values[0] if values else default
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def decode_user_rows(
+    entries: Iterable[Tuple[str, Dict[str, List[bytes]]]]
+) -> Iterator[UserRow]:
+    """
+    Преобразует записи пользователей из каталога (или зеркала каталога) в строки
+    списка пользователей за один проход, без проверки моделью User. Записи
+    выдаются по мере получения, поэтому страница списка выводится потоком
+
+    >>> rows = decode_user_rows(
+    ...     [("dn", {"uid": [b"ivan"], "mailQuota": [b"1048576"],
+    ...              "accountStatus": [b"active"]})]
+    ... )
+    >>> row = next(rows)
+    >>> row.uid, row.mailQuota, row.accountStatus, row.domainGlobalAdmin
+    ('ivan', 1048576, True, False)
+    """
+    first_value = __first_value
+    empty: List = []
+    for _, attrs in entries:
+        get = attrs.get
+        yield UserRow(
+            first_value(get("uid", empty), "").strip(),
+            int(first_value(get("mailQuota", empty), "100")),
+            first_value(get("accountStatus", empty), "") == "active",
+            first_value(get("domainGlobalAdmin", empty), "") == "yes",
+        )
@@ -0,0 +1,76 @@
+from typing import Dict, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+
+USER_SORT_ATTRIBUTES = {
+    "uid",
+    "cn",
+    "mail",
+    "mailQuota",
+    "accountStatus",
+    "domainGlobalAdmin",
+}
+
+
+class UserListQuery(BaseModel):
+    """
+    Параметры отбора и сортировки списка пользователей
+
+    Аргументы:
+      q: подстрока для поиска по идентификатору, имени и адресу
+      status: состояние учетной записи (active, disabled)
+      admin: признак глобального администратора (yes, no)
+      sort: атрибут сортировки, с префиксом "-" - по убыванию
+    """
+
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    q: str = ""
+    status: Optional[Literal["active", "disabled"]] = None
+    admin: Optional[Literal["yes", "no"]] = None
+    sort: Optional[str] = None
+
+    @field_validator("status", "admin", "sort", mode="before")
+    @classmethod
+    def empty_to_none(cls, value: Optional[str]) -> Optional[str]:
+        return value or None
+
+    @field_validator("sort")
+    @classmethod
+    def validate_sort(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and value.lstrip("-") not in USER_SORT_ATTRIBUTES:
+            raise ValueError("Сортировка по этому атрибуту не поддерживается")
+        return value
+
+    @classmethod
+    def from_args(cls, args) -> "UserListQuery":
+        """
+        Создает параметры из строки запроса. Некорректные значения игнорируются
+        """
+        data = {name: args.get(name) for name in cls.model_fields if args.get(name)}
+        try:
+            return cls(**data)
+        except ValidationError as e:
+            for error_dict in e.errors():
+                for field_name in error_dict["loc"]:
+                    data.pop(str(field_name), None)
+            return cls(**data)
+
+    @property
+    def sort_attribute(self) -> Optional[str]:
+        return self.sort.lstrip("-") if self.sort else None
+
+    @property
+    def sort_descending(self) -> bool:
+        return bool(self.sort and self.sort.startswith("-"))
+
+    @property
+    def is_filtered(self) -> bool:
+        return bool(self.q or self.status or self.admin)
+
+    def to_args(self) -> Dict[str, str]:
+        """
+        Возвращает непустые параметры для построения ссылок
+        """
+        return {name: value for name, value in self.model_dump().items() if value}
@@ -1,11 +1,25 @@
 from flask import Flask, redirect, url_for
 from controllers import (
+    api_controller,
+    asset_controller,
+    dashboard_controller,
     domain_controller,
+    metrics_controller,
+    search_controller,
     user_controller,
     auth_controller,
     base_controller,
+    user_export_controller,
+    user_import_controller,
 )
-from models.ldap_connection import LDAPConnectionError
+from models.ldap_connection import (
+    LDAPConnectionError,
+    LDAPPoolExhaustedError,
+    release_connection,
+)
+from models.settings import get_settings
+from utils.decorators import DIRECTORY_UNAVAILABLE_ERRORS
+from utils.metrics import add_server_timing, start_request_timer
 
 
 def default_route_handler():
@@ -27,6 +41,17 @@ def register(app: Flask):
         user_controller.user_create_view,
         methods=["GET", "POST"],
     )
+    app.add_url_rule(
+        "/<domain>/users/import",
+        "user_import",
+        user_import_controller.user_import,
+        methods=["GET", "POST"],
+    )
+    app.add_url_rule(
+        "/<domain>/users/export",
+        "user_export",
+        user_export_controller.user_export,
+    )
     app.add_url_rule(
         "/<domain>/users/<user_uid>/<edit_mode>",
         "user_view",
@@ -41,9 +66,41 @@ def register(app: Flask):
         methods=["GET", "POST"],
     )
     app.add_url_rule("/domains", "domain_list", domain_controller.domain_list)
+    app.add_url_rule("/dashboard", "dashboard", dashboard_controller.dashboard)
+    app.add_url_rule("/search", "search", search_controller.search)
     app.add_url_rule("/logout", "logout", auth_controller.logout)
+    app.add_url_rule("/assets/<path:filename>", "asset", asset_controller.asset)
+
+    app.add_url_rule(
+        "/api/v1/domains", "api_domain_list", api_controller.api_domain_list
+    )
+    app.add_url_rule(
+        "/api/v1/domains/<domain>/users",
+        "api_user_list",
+        api_controller.api_user_list,
+    )
+    app.add_url_rule(
+        "/api/v1/domains/<domain>/users/<user_uid>",
+        "api_user",
+        api_controller.api_user,
+        methods=["GET", "PATCH"],
+    )
+
+    if get_settings().METRICS_ENABLED:
+        app.add_url_rule("/metrics", "metrics", metrics_controller.metrics)
+        app.before_request(start_request_timer)
+        app.after_request(add_server_timing)
+
+    app.teardown_appcontext(release_connection)
 
     app.register_error_handler(404, base_controller.page_404)
     app.register_error_handler(
         LDAPConnectionError, base_controller.ldap_connection_error_handler
     )
+    app.register_error_handler(
+        LDAPPoolExhaustedError, base_controller.pool_exhausted_handler
+    )
+    for error in DIRECTORY_UNAVAILABLE_ERRORS:
+        app.register_error_handler(
+            error, base_controller.directory_unavailable_handler
+        )
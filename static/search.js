@@ -0,0 +1,48 @@
+(function () {
+  const input = document.getElementById("user_search");
+  const list = document.getElementById("user_search_results");
+  if (!input || !list) return;
+
+  let controller = null;
+
+  input.addEventListener("input", async () => {
+    const q = input.value.trim();
+    if (controller) controller.abort();
+    if (!q) {
+      list.replaceChildren();
+      return;
+    }
+
+    controller = new AbortController();
+    let data;
+    try {
+      const response = await fetch(
+        `${input.dataset.url}?q=${encodeURIComponent(q)}`,
+        { signal: controller.signal }
+      );
+      data = await response.json();
+    } catch (e) {
+      return;
+    }
+
+    if (!data.ready) {
+      const item = document.createElement("li");
+      item.textContent = "Индекс поиска строится, повторите поиск позже";
+      list.replaceChildren(item);
+      return;
+    }
+
+    list.replaceChildren(
+      ...data.results.map((user) => {
+        const link = document.createElement("a");
+        link.href = input.dataset.userUrl
+          .replace("__domain__", encodeURIComponent(user.domain))
+          .replace("__uid__", encodeURIComponent(user.uid));
+        link.textContent = user.cn ? `${user.mail} (${user.cn})` : user.mail;
+        const item = document.createElement("li");
+        item.append(link);
+        return item;
+      })
+    );
+  });
+})();
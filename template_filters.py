@@ -1,4 +1,7 @@
-from flask import Flask
+from flask import Flask, url_for
+
+from controllers.asset_controller import get_assets_directory
+from utils.assets import load_manifest
 
 
 def localize(data: str | bool) -> str:
@@ -21,6 +24,19 @@ def as_megabytes(data: str) -> str:
         return data
 
 
+def asset_url(filename: str) -> str:
+    """
+    Возвращает адрес статического файла. Если статические файлы собраны командой
+    flask assets build, возвращается адрес собранного файла с хэшем содержимого в
+    имени, иначе - обычный адрес статического файла
+    """
+    info = load_manifest(get_assets_directory()).get(filename)
+    if info is None:
+        return url_for("static", filename=filename)
+    return url_for("asset", filename=info["path"])
+
+
 def register(app: Flask):
     app.jinja_env.filters["localize"] = localize
     app.jinja_env.filters["as_megabytes"] = as_megabytes
+    app.jinja_env.globals["asset_url"] = asset_url
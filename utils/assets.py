@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Модуль brotli указан в requirements.txt. Если он не установлен, создаются только
+# варианты gzip
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+MANIFEST_NAME = "manifest.json"
+
+# Расширения файлов, для которых заранее создаются сжатые варианты. Изображения
+# в форматах PNG, JPEG и т.п. уже сжаты
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".html", ".json", ".txt", ".map"}
+
+# Кодировки сжатых вариантов в порядке предпочтения и расширения их файлов
+ENCODINGS: List[Tuple[str, str]] = [("br", ".br"), ("gzip", ".gz")]
+
+
+def __fingerprinted_name(path: str, content: bytes) -> str:
+    """
+    Добавляет к имени файла первые символы хэша его содержимого:
+    css/styles.css -> css/styles.1a2b3c4d.css
+    """
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    root, extension = os.path.splitext(path)
+    return f"{root}.{digest}{extension}"
+
+
+def __write_compressed(path: str, content: bytes) -> List[str]:
+    """
+    Записывает сжатые варианты файла, если они меньше исходного
+
+    Возвращаемое значение:
+      список созданных кодировок
+    """
+    variants = [("gzip", ".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(("br", ".br", brotli.compress(content, quality=11)))
+
+    encodings = []
+    for encoding, suffix, compressed in variants:
+        if len(compressed) < len(content):
+            with open(path + suffix, "wb") as file:
+                file.write(compressed)
+            encodings.append(encoding)
+    return encodings
+
+
+def build_assets(source_directory: str, output_directory: str) -> Dict[str, Dict]:
+    """
+    Копирует статические файлы в каталог сборки под именами, содержащими хэш
+    содержимого, и создает для текстовых файлов сжатые варианты gzip и brotli
+    (если установлен модуль brotli). Соответствие исходных и новых имен
+    записывается в манифест
+
+    Аргументы:
+      source_directory: каталог исходных статических файлов
+      output_directory: каталог сборки. Пересоздается при каждой сборке
+    Возвращаемое значение:
+      манифест: для каждого исходного пути - путь в каталоге сборки (path),
+      размер файла (size) и список доступных сжатых вариантов (encodings)
+    """
+    source_directory = os.path.abspath(source_directory)
+    output_directory = os.path.abspath(output_directory)
+
+    if os.path.isdir(output_directory):
+        shutil.rmtree(output_directory)
+    os.makedirs(output_directory)
+
+    manifest: Dict[str, Dict] = {}
+    for root, directories, files in os.walk(source_directory):
+        if os.path.abspath(root).startswith(output_directory):
+            directories.clear()
+            continue
+
+        for name in sorted(files):
+            source_path = os.path.join(root, name)
+            relative_path = os.path.relpath(source_path, source_directory).replace(
+                os.sep, "/"
+            )
+            with open(source_path, "rb") as file:
+                content = file.read()
+
+            output_name = __fingerprinted_name(relative_path, content)
+            output_path = os.path.join(output_directory, output_name)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "wb") as file:
+                file.write(content)
+
+            encodings = []
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                encodings = __write_compressed(output_path, content)
+
+            manifest[relative_path] = {
+                "path": output_name,
+                "size": len(content),
+                "encodings": encodings,
+            }
+
+    with open(os.path.join(output_directory, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+__manifests: Dict[str, Dict[str, Dict]] = {}
+__manifests_lock = threading.Lock()
+
+
+def load_manifest(output_directory: str) -> Dict[str, Dict]:
+    """
+    Возвращает манифест каталога сборки или пустой словарь, если сборка не
+    выполнялась. Манифест читается один раз за время работы процесса
+    """
+    with __manifests_lock:
+        manifest = __manifests.get(output_directory)
+        if manifest is None:
+            try:
+                with open(os.path.join(output_directory, MANIFEST_NAME)) as file:
+                    manifest = json.load(file)
+            except FileNotFoundError:
+                manifest = {}
+            __manifests[output_directory] = manifest
+        return manifest
+
+
+def fingerprinted_files(output_directory: str) -> Dict[str, Dict]:
+    """
+    Возвращает сведения о файлах сборки по их путям в каталоге сборки
+    """
+    manifest = load_manifest(output_directory)
+    return {info["path"]: info for info in manifest.values()}
+
+
+def choose_encoding(accept_encodings, available: List[str]) -> Optional[str]:
+    """
+    Выбирает кодировку сжатого варианта файла по заголовку Accept-Encoding
+
+    Аргументы:
+      accept_encodings: значение request.accept_encodings
+      available: кодировки, для которых есть сжатые варианты файла
+    """
+    best: Optional[str] = None
+    best_quality = 0.0
+    for encoding, _ in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if encoding in available and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encoding_suffix(encoding: str) -> str:
+    return dict(ENCODINGS)[encoding]
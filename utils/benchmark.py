@@ -0,0 +1,217 @@
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from controllers import user_controller
+from models.user import User, decode_user_rows
+from models.user_password import UserPassword
+from utils.ldap import attr_ldif, bytes2str, get_email_dn, mod_replace
+from utils.password import generate_password_hash, get_password_schemes
+
+BENCHMARK_PASSWORD = "Bench#mark1Password"
+
+# Количество синтетических записей в пакетных тестах преобразования записей
+BENCHMARK_ENTRIES = 10000
+
+# Относительное изменение времени, которое не считается отличием от базовых
+# результатов
+DEFAULT_THRESHOLD = 0.1
+
+
+def __synthetic_entries(count: int) -> List[Tuple[str, Dict[str, List[bytes]]]]:
+    """
+    Создает записи пользователей в том виде, в котором их возвращает python-ldap
+    """
+    entries = []
+    for i in range(count):
+        uid = f"user{i:05d}"
+        entries.append(
+            (
+                f"mail={uid}@example.com,ou=Users,domainName=example.com,o=domains",
+                {
+                    "uid": [uid.encode()],
+                    "mail": [f"{uid}@example.com".encode()],
+                    "cn": [f"Пользователь {i}".encode()],
+                    "givenName": ["Иван".encode()],
+                    "sn": [f"Иванов{i}".encode()],
+                    "title": ["Инженер".encode()],
+                    "telephoneNumber": [f"+7495{i:07d}".encode()],
+                    "mobile": [f"+7916{i:07d}".encode()],
+                    "employeeNumber": [str(i).encode()],
+                    "mailQuota": [str(1024 * 1048576).encode()],
+                    "accountStatus": [b"active" if i % 10 else b"disabled"],
+                    "domainGlobalAdmin": [b"yes" if i % 100 == 0 else b"no"],
+                },
+            )
+        )
+    return entries
+
+
+def __measure(func: Callable[[], object], min_time: float, repeat: int) -> Dict:
+    """
+    Подбирает количество вызовов функции в одном замере так, чтобы замер длился
+    не меньше min_time / repeat секунд, выполняет repeat замеров
+
+    Возвращаемое значение:
+      словарь со временем одного вызова в микросекундах: медиана (median_us),
+      минимум (min_us), среднее (mean_us), а также количеством вызовов в замере
+      (loops) и количеством замеров (repeat)
+    """
+    target = min_time / repeat
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= target:
+            break
+        loops = max(loops * 2, int(loops * target / elapsed) if elapsed else 0)
+
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+
+    return {
+        "median_us": statistics.median(timings) * 1e6,
+        "min_us": min(timings) * 1e6,
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def get_benchmarks(entries: int = BENCHMARK_ENTRIES) -> List[Tuple[str, Callable]]:
+    """
+    Возвращает список тестов: наименование и функцию без аргументов. Тесты не
+    обращаются к каталогу
+    """
+    ldap_entries = __synthetic_entries(entries)
+    dn, attrs = ldap_entries[0]
+    ldap_query_to_user = user_controller.__ldap_query_to_user
+    user_data = {
+        "uid": "user00000",
+        "cn": "Пользователь 0",
+        "givenName": "Иван",
+        "sn": "Иванов",
+        "mailQuota": 1024,
+        "accountStatus": True,
+    }
+
+    benchmarks: List[Tuple[str, Callable]] = [
+        ("bytes2str", lambda: bytes2str(attrs["cn"][0])),
+        ("bytes2str_tuple", lambda: bytes2str(tuple(attrs["mail"]))),
+        ("attr_ldif", lambda: attr_ldif("cn", "Пользователь 0")),
+        ("attr_ldif_list", lambda: attr_ldif("enabledService", ["mail", "imap"])),
+        ("mod_replace", lambda: mod_replace("mailQuota", 1073741824)),
+        ("get_email_dn", lambda: get_email_dn("user00000@example.com")),
+        ("ldap_query_to_user", lambda: ldap_query_to_user((dn, attrs))),
+        (
+            f"ldap_query_to_user_x{entries}",
+            lambda: [ldap_query_to_user(entry) for entry in ldap_entries],
+        ),
+        (f"decode_user_rows_x{entries}", lambda: list(decode_user_rows(ldap_entries))),
+        ("user_model", lambda: User(**user_data)),
+        (
+            "user_password_model",
+            lambda: UserPassword(
+                password=BENCHMARK_PASSWORD,  # type: ignore
+                password_repeat=BENCHMARK_PASSWORD,  # type: ignore
+            ),
+        ),
+    ]
+    for scheme in get_password_schemes():
+        benchmarks.append(
+            (
+                f"generate_password_hash[{scheme.name}]",
+                lambda name=scheme.name: generate_password_hash(
+                    BENCHMARK_PASSWORD, name
+                ),
+            )
+        )
+    return benchmarks
+
+
+def run_benchmarks(
+    min_time: float = 0.5,
+    repeat: int = 5,
+    entries: int = BENCHMARK_ENTRIES,
+    selected: Optional[List[str]] = None,
+    progress: Optional[Callable[[Dict], None]] = None,
+) -> Dict:
+    """
+    Выполняет тесты производительности
+
+    Аргументы:
+      min_time: минимальная длительность всех замеров одного теста, секунд
+      repeat: количество замеров одного теста
+      entries: количество записей в пакетном тесте преобразования записей
+      selected: подстроки наименований выполняемых тестов, по умолчанию - все
+      progress: функция, вызываемая с результатом каждого теста
+    Возвращаемое значение:
+      словарь со сведениями об окружении (python, platform, created) и списком
+      результатов тестов (results)
+    """
+    results = []
+    for name, func in get_benchmarks(entries):
+        if selected and not any(part in name for part in selected):
+            continue
+        result = {"name": name, **__measure(func, min_time, repeat)}
+        results.append(result)
+        if progress:
+            progress(result)
+
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+
+def compare_benchmarks(
+    report: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD
+) -> List[Dict]:
+    """
+    Сравнивает результаты тестов с базовыми по медиане времени вызова
+
+    Аргументы:
+      report: результаты run_benchmarks
+      baseline: сохраненные ранее результаты run_benchmarks
+      threshold: относительное изменение времени, не считающееся отличием
+    Возвращаемое значение:
+      список сравнений тестов: наименование (name), медианы текущего и базового
+      времени вызова (median_us, baseline_us), их отношение (ratio) и итог
+      (status): slower, faster, same или new (нет в базовых результатах)
+    """
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+
+    comparisons = []
+    for result in report["results"]:
+        base = baseline_results.get(result["name"])
+        comparison = {
+            "name": result["name"],
+            "median_us": result["median_us"],
+            "baseline_us": None,
+            "ratio": None,
+            "status": "new",
+        }
+        if base and base["median_us"]:
+            ratio = result["median_us"] / base["median_us"]
+            comparison["baseline_us"] = base["median_us"]
+            comparison["ratio"] = ratio
+            if ratio > 1 + threshold:
+                comparison["status"] = "slower"
+            elif ratio < 1 / (1 + threshold):
+                comparison["status"] = "faster"
+            else:
+                comparison["status"] = "same"
+        comparisons.append(comparison)
+    return comparisons
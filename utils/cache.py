@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш ограниченного размера со временем жизни записей.
+    При переполнении вытесняются записи, которые дольше всего не запрашивались
+
+    Аргументы:
+      maxsize: максимальное количество записей
+      ttl: время жизни записи в секундах. Нулевое значение отключает кэширование
+
+    Значение, прочитанное до инвалидации, не сохраняется:
+
+    >>> cache = TTLCache(maxsize=2, ttl=60)
+    >>> generation = cache.generation
+    >>> cache.delete("a")
+    >>> cache.set("a", 1, generation)
+    >>> cache.get("a") is None
+    True
+    >>> cache.set("a", 1, cache.generation)
+    >>> cache.get("a")
+    1
+    >>> cache.set("b", 2)
+    >>> cache.set("c", 3)
+    >>> sorted(key for key in "abc" if cache.get(key) is not None)
+    ['b', 'c']
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.__generation = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """
+        Номер поколения кэша, увеличивается при каждой инвалидации. Позволяет не
+        сохранять в кэш значение, прочитанное до инвалидации
+        """
+        return self.__generation
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.__lock:
+            item = self.__data.get(key)
+            if item is None:
+                return default
+
+            expires, value = item
+            if expires < time.monotonic():
+                del self.__data[key]
+                return default
+
+            self.__data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """
+        Сохраняет значение в кэш
+
+        Аргументы:
+          generation: номер поколения кэша на момент чтения значения. Если с тех пор
+            кэш был инвалидирован, значение не сохраняется
+        """
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self.__lock:
+            if generation is not None and generation != self.__generation:
+                return
+
+            self.__data[key] = (time.monotonic() + self.ttl, value)
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self.__lock:
+            self.__generation += 1
+            self.__data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]):
+        """
+        Удаляет из кэша записи, ключи которых удовлетворяют условию
+        """
+        with self.__lock:
+            self.__generation += 1
+            for key in [key for key in self.__data if predicate(key)]:
+                del self.__data[key]
+
+    def clear(self):
+        with self.__lock:
+            self.__generation += 1
+            self.__data.clear()
@@ -1,7 +1,41 @@
-from flask import session, request, redirect, url_for, render_template
+from flask import (
+    g,
+    jsonify,
+    session,
+    request,
+    redirect,
+    url_for,
+    render_template,
+    stream_template,
+)
 from functools import wraps
 from typing import Optional
 
+import ldap
+
+from models.ldap_connection import (
+    LDAPConnectionError,
+    LDAPPoolExhaustedError,
+    check_login,
+)
+
+
+# Ошибки недоступности каталога, оставшиеся после попыток восстановить соединение
+DIRECTORY_UNAVAILABLE_ERRORS = (
+    ldap.SERVER_DOWN,  # type: ignore
+    ldap.CONNECT_ERROR,  # type: ignore
+    ldap.TIMEOUT,  # type: ignore
+)
+# Рекомендуемая пауза перед повтором запроса при недоступности каталога, секунд
+DIRECTORY_RETRY_AFTER = 5
+
+
+def __directory_unavailable(message: str = "Каталог временно недоступен"):
+    response = jsonify({"error": message})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(DIRECTORY_RETRY_AFTER)
+    return response
+
 
 def login_required(f):
     """
@@ -18,13 +52,58 @@ def login_required(f):
     return decorated_function
 
 
-def templated(template: Optional[str] = None):
+def api_login_required(f):
+    """
+    Декоратор обработчиков API. Принимает учетные данные в заголовке Authorization
+    (схема Basic) или сеанс пользователя, выполнившего вход через форму. Если
+    аутентификация не выполнена, возвращает ответ 401 в формате JSON
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        auth = request.authorization
+        if auth and auth.type == "basic":
+            try:
+                check_login(auth.username or "", auth.password or "")
+            except DIRECTORY_UNAVAILABLE_ERRORS:
+                return __directory_unavailable()
+            except LDAPPoolExhaustedError as e:
+                return __directory_unavailable(str(e))
+            except (ldap.LDAPError, LDAPConnectionError):  # type: ignore
+                response = jsonify({"error": "Некорректные учетные данные"})
+                response.status_code = 401
+                response.headers["WWW-Authenticate"] = 'Basic realm="iRedAdmin Light"'
+                return response
+            g.ldap_identity = auth.username
+        elif session.get("email") is None:
+            response = jsonify({"error": "Аутентификация не выполнена"})
+            response.status_code = 401
+            return response
+
+        try:
+            return f(*args, **kwargs)
+        except DIRECTORY_UNAVAILABLE_ERRORS:
+            return __directory_unavailable()
+        except LDAPPoolExhaustedError as e:
+            return __directory_unavailable(str(e))
+        except LDAPConnectionError as e:
+            response = jsonify({"error": str(e)})
+            response.status_code = 401
+            return response
+
+    return decorated_function
+
+
+def templated(template: Optional[str] = None, stream: bool = False):
     """
     Декоратор для рендеринга шаблона, соответвующего endpoint'у текущего запроса. Вызывает
     обработчик endpoint'a и рендерит шаблон с возвращенным из обработчика словарем
 
     Аргументы:
       template: путь к файлу шаблона
+      stream: если истина, шаблон рендерится потоково: части страницы отправляются
+        клиенту по мере рендеринга, что позволяет передавать в шаблон генераторы,
+        данные которых еще не получены полностью
     """
 
     def decorator(f):
@@ -41,6 +120,8 @@ def templated(template: Optional[str] = None):
                 ctx = {}
             elif not isinstance(ctx, dict):
                 return ctx
+            if stream:
+                return stream_template(template_name, **ctx)
             return render_template(template_name, **ctx)
 
         return decorated_function
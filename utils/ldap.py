@@ -1,9 +1,29 @@
+from ldap.controls import RequestControl, SimplePagedResultsControl
+from ldap.controls.simple import ProxyAuthzControl
+from ldap.controls.sss import SSSRequestControl
 from ldap.dn import escape_dn_chars
+from ldap.filter import escape_filter_chars
+from ldap.ldapobject import LDAPObject
+import base64
+import binascii
+import random
+import time
 import ldap
 import ldap.modlist
 import ldapurl
 from models.settings import get_settings
-from typing import Union, List, Tuple, Any, Set, Dict, Container
+from typing import (
+    Any,
+    Callable,
+    Container,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 
 def get_domains_for_admin(): ...
@@ -19,6 +39,18 @@ def get_email_dn(email: str) -> str:
     return f"mail={safe_email},ou=Users,domainName={safe_domain},o=domains,{settings.LDAP_ROOT_DN}"
 
 
+def get_bind_dn(login: str) -> str:
+    """
+    Возвращает DN для привязки (bind): для адреса электронной почты - DN почтового
+    пользователя, для остальных имен - DN вида cn=<имя>,LDAP_ROOT_DN
+    """
+    if login.find("@") >= 0:
+        return get_email_dn(login)
+
+    settings = get_settings()
+    return f"cn={escape_dn_chars(login)},{settings.LDAP_ROOT_DN}"
+
+
 def get_user_dn(user_id: str, domain: str) -> str:
     return get_email_dn(f"{user_id}@{domain}")
 
@@ -29,6 +61,694 @@ def get_domain_dn(domain: str):
     return f"domainName={safe_domain},o=domains,{settings.LDAP_ROOT_DN}"
 
 
+def generate_maildir_path(email: str) -> str:
+    """
+    Формирует путь к почтовому ящику пользователя из доменного имени, первых трех
+    символов имени и отметки времени, например
+    example.com/u/s/e/user-2024.01.31.12.00.00/
+    """
+    username, domain = email.split("@", 1)
+    if len(username) >= 3:
+        chars = username[:3]
+    elif len(username) == 2:
+        chars = username[0] + username[1] + username[1]
+    else:
+        chars = username * 3
+    timestamp = time.strftime("-%Y.%m.%d.%H.%M.%S")
+    return f"{domain}/{chars[0]}/{chars[1]}/{chars[2]}/{username}{timestamp}/"
+
+
+def get_days_of_shadow_last_change() -> int:
+    """
+    Возвращает количество дней с 01.01.1970 для атрибута shadowLastChange
+    """
+    return int(time.time() / 86400)
+
+
+class PagedSearch:
+    """
+    Поиск одной страницы записей с использованием управляющего элемента
+    Simple Paged Results (RFC 2696). Записи выдаются по одной по мере их получения
+    от сервера, cookie следующей страницы доступен в атрибуте cookie после
+    завершения перебора (пустой, если страница последняя).
+
+    Cookie действителен только для соединения, на котором он был получен. Если
+    переданный cookie недействителен, предыдущие страницы запрашиваются с начала
+    списка, а их записи отбрасываются.
+
+    Аргументы:
+      conn: соединение с каталогом
+      page_size: максимальное количество записей на странице
+      page: номер страницы, начиная с 1
+      cookie: cookie, полученный при запросе предыдущей страницы
+      serverctrls: дополнительные управляющие элементы запроса, например
+        сортировка на стороне сервера
+    """
+
+    def __init__(
+        self,
+        conn: LDAPObject,
+        base: str,
+        scope: int,
+        filterstr: str,
+        attrlist: Optional[List[str]],
+        page_size: int,
+        page: int = 1,
+        cookie: bytes = b"",
+        serverctrls: Optional[List[RequestControl]] = None,
+    ):
+        self.conn = conn
+        self.base = base
+        self.scope = scope
+        self.filterstr = filterstr
+        self.attrlist = attrlist
+        self.page_size = page_size
+        self.page = page
+        self.start_cookie = cookie
+        self.serverctrls = serverctrls or []
+        self.cookie = b""
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, List[bytes]]]]:
+        yielded = False
+        try:
+            for entry in self.__entries():
+                yielded = True
+                yield entry
+        except ldap.SERVER_DOWN:  # type: ignore
+            if yielded:
+                raise
+            # Записи еще не выданы, поэтому поиск можно повторить. Соединение
+            # ReconnectingLDAPObject восстанавливается при повторном запросе
+            yield from self.__entries()
+
+    def __entries(self) -> Iterator[Tuple[str, Dict[str, List[bytes]]]]:
+        if self.start_cookie:
+            entries = self.__search(self.start_cookie)
+            try:
+                first_entry = next(entries, None)
+            except (ldap.PROTOCOL_ERROR, ldap.UNWILLING_TO_PERFORM):  # type: ignore
+                pass
+            else:
+                if first_entry is not None:
+                    yield first_entry
+                yield from entries
+                return
+
+        self.cookie = b""
+        for _ in range(1, self.page):
+            for _entry in self.__search(self.cookie):
+                pass
+            if not self.cookie:
+                # Запрошенная страница находится за концом списка
+                return
+        yield from self.__search(self.cookie)
+
+    def __search(self, cookie: bytes) -> Iterator[Tuple[str, Dict[str, List[bytes]]]]:
+        page_control = SimplePagedResultsControl(
+            True, size=self.page_size, cookie=cookie
+        )
+        msgid = self.conn.search_ext(
+            self.base,
+            self.scope,
+            self.filterstr,
+            self.attrlist,
+            serverctrls=self.serverctrls + [page_control],
+        )
+        self.cookie = b""
+
+        finished = False
+        try:
+            while True:
+                result_type, result_data, _, response_controls = self.conn.result3(
+                    msgid, all=0
+                )
+                if result_type == ldap.RES_SEARCH_RESULT:  # type: ignore
+                    finished = True
+                    for control in response_controls:
+                        if control.controlType == SimplePagedResultsControl.controlType:
+                            self.cookie = control.cookie
+                    return
+
+                # Отбрасываем ссылки (referrals), у которых нет DN
+                for entry in result_data:
+                    if entry[0] is not None:
+                        yield entry
+        except ldap.LDAPError:  # type: ignore
+            finished = True
+            raise
+        finally:
+            if not finished:
+                # Перебор прерван до получения всех записей
+                self.conn.abandon(msgid)
+
+
+class EntryPage:
+    """
+    Страница записей, сформированная в памяти. Повторяет интерфейс PagedSearch:
+    записи перебираются итератором, cookie следующей страницы доступен в атрибуте
+    cookie (пустой, если страница последняя)
+    """
+
+    __slots__ = ("entries", "cookie")
+
+    def __init__(
+        self, entries: List[Tuple[str, Dict[str, List[bytes]]]], cookie: bytes
+    ):
+        self.entries = entries
+        self.cookie = cookie
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, List[bytes]]]]:
+        return iter(self.entries)
+
+
+__server_sort_support: Dict[str, bool] = {}
+
+
+def supports_server_side_sort(
+    conn: LDAPObject, base: str, scope: int, ordering_rule: str
+) -> bool:
+    """
+    Проверяет, может ли сервер сортировать записи по правилу ordering_rule
+    управляющим элементом Server Side Sorting (RFC 2891). Сервер может не
+    поддерживать управляющий элемент или правило сравнения для атрибута, поэтому
+    проверка выполняется пробным запросом одной записи. Результат запоминается
+    для каждого правила
+
+    Аргументы:
+      ordering_rule: правило сортировки в формате SSSRequestControl, например
+        "-uid:caseIgnoreOrderingMatch"
+    """
+    supported = __server_sort_support.get(ordering_rule)
+    if supported is not None:
+        return supported
+
+    sort_control = SSSRequestControl(criticality=True, ordering_rules=[ordering_rule])
+    try:
+        conn.search_ext_s(
+            base,
+            scope,
+            "(objectClass=*)",
+            ["1.1"],
+            serverctrls=[sort_control],
+            sizelimit=1,
+        )
+        supported = True
+    except ldap.SIZELIMIT_EXCEEDED:  # type: ignore
+        supported = True
+    except (ldap.SERVER_DOWN, ldap.TIMEOUT):  # type: ignore
+        # Недоступность сервера не говорит о поддержке сортировки
+        raise
+    except ldap.LDAPError:  # type: ignore
+        supported = False
+
+    __server_sort_support[ordering_rule] = supported
+    return supported
+
+
+def iter_paged_search(
+    conn: LDAPObject,
+    base: str,
+    scope: int,
+    filterstr: str,
+    attrlist: Optional[List[str]],
+    page_size: int,
+    serverctrls: Optional[List[RequestControl]] = None,
+) -> Iterator[Tuple[str, Dict[str, List[bytes]]]]:
+    """
+    Перебирает все найденные записи, запрашивая их у сервера постранично. В памяти
+    одновременно находится не более одной страницы записей
+    """
+    page = 1
+    cookie = b""
+    while True:
+        search = PagedSearch(
+            conn,
+            base,
+            scope,
+            filterstr,
+            attrlist,
+            page_size,
+            page,
+            cookie,
+            serverctrls,
+        )
+        yield from search
+
+        cookie = search.cookie
+        if not cookie:
+            return
+        page += 1
+
+
+class TimestampWatermark:
+    """
+    Отметка для поиска записей, измененных с момента предыдущего поиска, по
+    атрибуту modifyTimestamp. Точность атрибута - одна секунда, поэтому поиск
+    выполняется с нестрогим условием, а записи, прочитанные в секунду отметки,
+    запоминаются вместе с entryCSN и при следующем поиске считаются измененными,
+    только если изменился их entryCSN. Если сервер не выдает entryCSN, такие
+    записи не считаются измененными
+
+    >>> watermark = TimestampWatermark()
+    >>> watermark.advance("uid=a,ou=Users", "20240131120000Z", "csn-1")
+    >>> watermark.advance("uid=b,ou=Users", "20240131120000Z", "csn-2")
+    >>> watermark.filter()
+    '(modifyTimestamp>=20240131120000Z)'
+    >>> watermark.is_changed("uid=a,ou=Users", "20240131120000Z", "csn-1")
+    False
+    >>> watermark.is_changed("uid=a,ou=Users", "20240131120000Z", "csn-3")
+    True
+    >>> watermark.is_changed("uid=c,ou=Users", "20240131120000Z", "csn-4")
+    True
+    >>> refreshed = watermark.copy()
+    >>> refreshed.advance("uid=a,ou=Users", "20240131120001Z", "csn-5")
+    >>> refreshed.is_changed("uid=b,ou=Users", "20240131120001Z", "csn-6")
+    True
+    >>> watermark.filter()
+    '(modifyTimestamp>=20240131120000Z)'
+    """
+
+    __slots__ = ("value", "seen")
+
+    # Атрибуты, которые нужно запросить для проверки записи
+    ATTRIBUTES = ["modifyTimestamp", "entryCSN"]
+
+    def __init__(self, value: str = "", seen: Optional[Dict[str, str]] = None):
+        self.value = value
+        # entryCSN записей, прочитанных с отметкой value, по DN
+        self.seen: Dict[str, str] = seen or {}
+
+    def __bool__(self) -> bool:
+        return bool(self.value)
+
+    def copy(self) -> "TimestampWatermark":
+        return TimestampWatermark(self.value, dict(self.seen))
+
+    def filter(self) -> str:
+        """
+        Возвращает условие поиска записей, измененных не ранее отметки
+        """
+        return f"(modifyTimestamp>={escape_filter_chars(self.value)})"
+
+    def is_changed(self, dn: str, timestamp: str, csn: str = "") -> bool:
+        """
+        Проверяет, изменена ли запись после того, как отметка была установлена
+        """
+        if timestamp != self.value:
+            return timestamp > self.value
+        return self.seen.get(dn.lower()) != csn
+
+    def advance(self, dn: str, timestamp: str, csn: str = ""):
+        """
+        Учитывает в отметке прочитанную запись
+        """
+        if timestamp > self.value:
+            self.value = timestamp
+            self.seen = {dn.lower(): csn}
+        elif timestamp == self.value:
+            self.seen[dn.lower()] = csn
+
+    def is_entry_changed(self, dn: str, attrs: Dict[str, List[bytes]]) -> bool:
+        """
+        Вызывает is_changed для записи, прочитанной с атрибутами ATTRIBUTES
+        """
+        return self.is_changed(dn, *self.__entry_marks(attrs))
+
+    def advance_entry(self, dn: str, attrs: Dict[str, List[bytes]]):
+        """
+        Вызывает advance для записи, прочитанной с атрибутами ATTRIBUTES
+        """
+        self.advance(dn, *self.__entry_marks(attrs))
+
+    @staticmethod
+    def __entry_marks(attrs: Dict[str, List[bytes]]) -> Tuple[str, str]:
+        return (
+            bytes2str(attrs.get("modifyTimestamp", [b""])[0]),
+            bytes2str(attrs.get("entryCSN", [b""])[0]),
+        )
+
+
+class ReconnectingLDAPObject:
+    """
+    Обертка объекта соединения python-ldap, восстанавливающая соединение после его
+    потери (ldap.SERVER_DOWN) с повтором последней успешной привязки (bind).
+    Попытки открыть соединение разделяются паузами со случайной длительностью до
+    delay, 2 * delay, 4 * delay и т.д. (но не более max_delay), чтобы соединения
+    многих потоков не восстанавливались одновременно.
+    Поиск, сравнение, привязка и WhoAmI при потере соединения повторяются на новом
+    соединении. Изменяющие операции не повторяются: ошибка передается вызывающему
+    коду, а соединение восстанавливается при следующем обращении
+
+    Аргументы:
+      factory: функция, открывающая новое соединение (без привязки)
+      attempts: количество попыток открыть соединение
+      delay: наибольшая пауза перед второй попыткой, секунд
+      max_delay: наибольшая пауза между попытками, секунд
+
+    Соединение восстанавливается и после того, как все попытки оказались
+    неудачными:
+
+    >>> class Server:
+    ...     up = True
+    >>> class Stub:  # как в python-ldap, unbind удаляет внутреннее соединение _l
+    ...     def __init__(self):
+    ...         if not Server.up:
+    ...             raise ldap.SERVER_DOWN({"desc": "Can't contact LDAP server"})
+    ...         self._l = object()
+    ...     def search_s(self, *args):
+    ...         self._l
+    ...         if not Server.up:
+    ...             raise ldap.SERVER_DOWN({"desc": "Can't contact LDAP server"})
+    ...         return []
+    ...     def unbind(self):
+    ...         del self._l
+    >>> conn = ReconnectingLDAPObject(Stub, attempts=2, delay=0, max_delay=0)
+    >>> Server.up = False
+    >>> conn.search_s("dc=example,dc=com")  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    ldap.SERVER_DOWN: {'desc': "Can't contact LDAP server"}
+    >>> conn.search_s("dc=example,dc=com")  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    ldap.SERVER_DOWN: {'desc': "Can't contact LDAP server"}
+    >>> Server.up = True
+    >>> conn.search_s("dc=example,dc=com")
+    []
+    """
+
+    # Методы, которые безопасно выполнить повторно на новом соединении
+    REPLAYABLE_METHODS = {
+        "search",
+        "search_ext",
+        "search_s",
+        "search_st",
+        "search_ext_s",
+        "compare_s",
+        "compare_ext_s",
+        "simple_bind_s",
+        "whoami_s",
+    }
+    # Ошибки, после которых выполняется следующая попытка открыть соединение
+    RECONNECT_ERRORS = (
+        ldap.SERVER_DOWN,  # type: ignore
+        ldap.CONNECT_ERROR,  # type: ignore
+        ldap.TIMEOUT,  # type: ignore
+    )
+    # Методы, перед которыми потерянное соединение не восстанавливается
+    LOCAL_METHODS = {
+        "get_option",
+        "set_option",
+        "abandon",
+        "abandon_ext",
+        "unbind",
+        "unbind_s",
+        "unbind_ext",
+        "unbind_ext_s",
+    }
+
+    def __init__(
+        self,
+        factory: Callable[[], LDAPObject],
+        attempts: int,
+        delay: float,
+        max_delay: float,
+    ):
+        self.__factory = factory
+        self.__attempts = max(attempts, 1)
+        self.__delay = delay
+        self.__max_delay = max_delay
+        self.__credentials: Optional[Tuple[str, str]] = None
+        self.__broken = False
+        # Истина, если соединение __conn уже закрыто (unbind)
+        self.__unbound = False
+        self.__conn = factory()
+
+    def __getattr__(self, name: str):
+        if name.startswith("_ReconnectingLDAPObject__"):
+            raise AttributeError(name)
+
+        attribute = getattr(self.__conn, name)
+        if not callable(attribute):
+            return attribute
+
+        def method(*args, **kwargs):
+            return self.__apply(name, args, kwargs)
+
+        return method
+
+    def __apply(self, name: str, args: tuple, kwargs: dict):
+        if self.__broken:
+            if name in self.LOCAL_METHODS:
+                # Отменять запросы на потерянном соединении не требуется
+                if name.startswith("abandon"):
+                    return None
+                if self.__unbound:
+                    # Соединение закрыто после неудачного восстановления
+                    if name.startswith("unbind"):
+                        return None
+                    raise ldap.SERVER_DOWN(  # type: ignore
+                        {"desc": "Соединение с каталогом не восстановлено"}
+                    )
+            else:
+                self.reconnect()
+
+        try:
+            return getattr(self.__conn, name)(*args, **kwargs)
+        except ldap.SERVER_DOWN:  # type: ignore
+            self.__broken = True
+            if name not in self.REPLAYABLE_METHODS:
+                raise
+
+        self.reconnect()
+        return getattr(self.__conn, name)(*args, **kwargs)
+
+    def simple_bind_s(self, who: str = "", cred: str = "", *args, **kwargs):
+        result = self.__apply("simple_bind_s", (who, cred) + args, kwargs)
+        self.__credentials = (who, cred)
+        return result
+
+    def reconnect(self):
+        """
+        Открывает новое соединение и повторяет на нем последнюю успешную привязку.
+        Если все попытки неудачны, передает последнюю ошибку вызывающему коду
+        """
+        if not self.__unbound:
+            # python-ldap после unbind удаляет внутреннее соединение, поэтому
+            # повторный unbind после неудачного восстановления не выполняется
+            self.__unbound = True
+            try:
+                self.__conn.unbind()
+            except Exception:
+                pass
+
+        error: Optional[Exception] = None
+        for attempt in range(self.__attempts):
+            if attempt:
+                delay = min(self.__delay * 2 ** (attempt - 1), self.__max_delay)
+                time.sleep(random.uniform(0, delay))
+            try:
+                conn = self.__factory()
+                if self.__credentials:
+                    conn.simple_bind_s(*self.__credentials)
+            except self.RECONNECT_ERRORS as e:
+                error = e
+                continue
+
+            self.__conn = conn
+            self.__broken = False
+            self.__unbound = False
+            return
+        raise error  # type: ignore
+
+
+class ProxyAuthzLDAPObject:
+    """
+    Обертка объекта соединения python-ldap, добавляющая к каждой операции
+    управляющий элемент Proxied Authorization (RFC 4370). Соединение привязано к
+    служебной учетной записи, а операции выполняются сервером от имени и с правами
+    доступа authz_id. Методы, не передающие управляющий элемент, недоступны, чтобы
+    операция не была выполнена с правами служебной учетной записи
+
+    Аргументы:
+      conn: соединение служебной учетной записи
+      authz_id: идентификатор учетной записи, например "dn:mail=...,o=domains,..."
+    """
+
+    # Методы, которые не выполняют операций над записями каталога
+    PASSTHROUGH_METHODS = {
+        "result",
+        "result3",
+        "result4",
+        "abandon",
+        "abandon_ext",
+        "get_option",
+    }
+
+    def __init__(self, conn: LDAPObject, authz_id: str):
+        self.__conn = conn
+        # Значение управляющего элемента передается в python-ldap как bytes
+        self.__control = ProxyAuthzControl(
+            criticality=True, authzId=authz_id.encode()
+        )
+
+    def __getattr__(self, name: str):
+        if name not in self.PASSTHROUGH_METHODS:
+            raise AttributeError(
+                f"Метод {name} не поддерживается при передаче полномочий"
+            )
+        return getattr(self.__conn, name)
+
+    def __controls(self, serverctrls: Optional[List[RequestControl]]) -> List:
+        return [self.__control] + list(serverctrls or [])
+
+    def search_ext(
+        self,
+        base: str,
+        scope: int,
+        filterstr: str = "(objectClass=*)",
+        attrlist: Optional[List[str]] = None,
+        attrsonly: int = 0,
+        serverctrls: Optional[List[RequestControl]] = None,
+        clientctrls=None,
+        timeout: int = -1,
+        sizelimit: int = 0,
+    ) -> int:
+        return self.__conn.search_ext(
+            base,
+            scope,
+            filterstr,
+            attrlist,
+            attrsonly,
+            serverctrls=self.__controls(serverctrls),
+            clientctrls=clientctrls,
+            timeout=timeout,
+            sizelimit=sizelimit,
+        )
+
+    def search_ext_s(
+        self,
+        base: str,
+        scope: int,
+        filterstr: str = "(objectClass=*)",
+        attrlist: Optional[List[str]] = None,
+        attrsonly: int = 0,
+        serverctrls: Optional[List[RequestControl]] = None,
+        clientctrls=None,
+        timeout: int = -1,
+        sizelimit: int = 0,
+    ) -> List:
+        return self.__conn.search_ext_s(
+            base,
+            scope,
+            filterstr,
+            attrlist,
+            attrsonly,
+            serverctrls=self.__controls(serverctrls),
+            clientctrls=clientctrls,
+            timeout=timeout,
+            sizelimit=sizelimit,
+        )
+
+    def search_s(
+        self,
+        base: str,
+        scope: int,
+        filterstr: str = "(objectClass=*)",
+        attrlist: Optional[List[str]] = None,
+        attrsonly: int = 0,
+    ) -> List:
+        return self.search_ext_s(base, scope, filterstr, attrlist, attrsonly)
+
+    def compare_ext_s(
+        self, dn: str, attr: str, value, serverctrls=None, clientctrls=None
+    ):
+        return self.__conn.compare_ext_s(
+            dn, attr, value, self.__controls(serverctrls), clientctrls
+        )
+
+    def compare_s(self, dn: str, attr: str, value):
+        return self.compare_ext_s(dn, attr, value)
+
+    def add_ext(self, dn: str, modlist: List, serverctrls=None, clientctrls=None):
+        return self.__conn.add_ext(
+            dn, modlist, self.__controls(serverctrls), clientctrls
+        )
+
+    def add_ext_s(self, dn: str, modlist: List, serverctrls=None, clientctrls=None):
+        return self.__conn.add_ext_s(
+            dn, modlist, self.__controls(serverctrls), clientctrls
+        )
+
+    def add_s(self, dn: str, modlist: List):
+        return self.add_ext_s(dn, modlist)
+
+    def modify_ext(self, dn: str, modlist: List, serverctrls=None, clientctrls=None):
+        return self.__conn.modify_ext(
+            dn, modlist, self.__controls(serverctrls), clientctrls
+        )
+
+    def modify_ext_s(self, dn: str, modlist: List, serverctrls=None, clientctrls=None):
+        return self.__conn.modify_ext_s(
+            dn, modlist, self.__controls(serverctrls), clientctrls
+        )
+
+    def modify_s(self, dn: str, modlist: List):
+        return self.modify_ext_s(dn, modlist)
+
+    def delete_ext(self, dn: str, serverctrls=None, clientctrls=None):
+        return self.__conn.delete_ext(dn, self.__controls(serverctrls), clientctrls)
+
+    def delete_ext_s(self, dn: str, serverctrls=None, clientctrls=None):
+        return self.__conn.delete_ext_s(dn, self.__controls(serverctrls), clientctrls)
+
+    def delete_s(self, dn: str):
+        return self.delete_ext_s(dn)
+
+    def whoami_s(self, serverctrls=None, clientctrls=None) -> str:
+        return self.__conn.whoami_s(self.__controls(serverctrls), clientctrls)
+
+
+def ldap_error_message(e: ldap.LDAPError) -> str:  # type: ignore
+    """
+    Возвращает текст ошибки каталога для показа пользователю: описание ошибки и
+    пояснение сервера, если оно есть
+
+    >>> ldap_error_message(ldap.ALREADY_EXISTS({"desc": "Already exists"}))
+    'Already exists'
+    """
+    if e.args and isinstance(e.args[0], dict):
+        info = e.args[0]
+        return " ".join(filter(None, [info.get("desc"), info.get("info")]))
+    return str(e)
+
+
+def encode_cursor(cookie: bytes) -> str:
+    """
+    Преобразует cookie постраничного поиска в строку для передачи в адресе URL
+
+    >>> encode_cursor(b"\\x01\\x02")
+    'AQI='
+    """
+    return base64.urlsafe_b64encode(cookie).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> bytes:
+    """
+    Преобразует строку из адреса URL в cookie постраничного поиска.
+    Для пустой или некорректной строки возвращает пустой cookie
+
+    >>> decode_cursor("AQI=")
+    b'\\x01\\x02'
+    >>> decode_cursor("%%%")
+    b''
+    """
+    if not cursor:
+        return b""
+    try:
+        return base64.urlsafe_b64decode(cursor.encode())
+    except (binascii.Error, ValueError):
+        return b""
+
+
 def settings_list_to_dict(settings_list: List[str]) -> Dict:
     """Return a dict of 'accountSetting' values."""
     setting_dict = {}
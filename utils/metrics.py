@@ -0,0 +1,433 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import ldap
+from flask import Response, g, has_app_context, has_request_context, request
+
+# Границы интервалов гистограмм времени выполнения, секунд
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Маршрут операций, выполненных вне обработки запроса (фоновые потоки, команды)
+BACKGROUND_ROUTE = "background"
+
+# Типы ответов LDAP, после которых операция еще не завершена
+PARTIAL_RESULT_TYPES = {
+    ldap.RES_SEARCH_ENTRY,  # type: ignore
+    ldap.RES_SEARCH_REFERENCE,  # type: ignore
+}
+
+
+class Histogram:
+    """
+    Гистограмма длительностей в формате Prometheus
+    """
+
+    __slots__ = ("buckets", "count", "sum")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def copy(self) -> "Histogram":
+        result = self.__class__()
+        result.buckets = self.buckets[:]
+        result.count = self.count
+        result.sum = self.sum
+        return result
+
+
+class LDAPOperationStats(Histogram):
+    """
+    Статистика операций LDAP одного типа, выполненных при обработке одного
+    маршрута: гистограмма длительностей, количество полученных записей, объем
+    данных атрибутов (полученных при поиске или переданных при изменении) и
+    количество ошибок
+    """
+
+    __slots__ = ("entries", "bytes", "errors")
+
+    def __init__(self):
+        super().__init__()
+        self.entries = 0
+        self.bytes = 0
+        self.errors = 0
+
+    def copy(self) -> "LDAPOperationStats":
+        result: LDAPOperationStats = super().copy()  # type: ignore
+        result.entries = self.entries
+        result.bytes = self.bytes
+        result.errors = self.errors
+        return result
+
+
+__ldap_stats: Dict[Tuple[str, str], LDAPOperationStats] = {}
+__request_stats: Dict[str, Histogram] = {}
+__stats_lock = threading.Lock()
+
+
+def current_route() -> str:
+    if has_request_context():
+        return request.endpoint or "-"
+    return BACKGROUND_ROUTE
+
+
+def record_ldap_operation(
+    operation: str, seconds: float, entries: int = 0, size: int = 0, error=False
+):
+    """
+    Учитывает выполненную операцию LDAP в статистике маршрута текущего запроса
+
+    Аргументы:
+      operation: тип операции (search, modify, add, delete, bind, whoami)
+      seconds: время от отправки запроса до получения результата
+      entries: количество полученных записей
+      size: объем данных атрибутов в байтах
+      error: признак завершения операции с ошибкой
+    """
+    key = (current_route(), operation)
+    with __stats_lock:
+        stats = __ldap_stats.get(key)
+        if stats is None:
+            stats = __ldap_stats[key] = LDAPOperationStats()
+        stats.observe(seconds)
+        stats.entries += entries
+        stats.bytes += size
+        stats.errors += bool(error)
+
+    if has_app_context():
+        timings = g.setdefault("ldap_operations", {})
+        count, total = timings.get(operation, (0, 0.0))
+        timings[operation] = (count + 1, total + seconds)
+
+
+def record_ldap_wait(seconds: float):
+    """
+    Учитывает время, в течение которого обработка текущего запроса ожидала ответа
+    сервера каталога. При одновременном выполнении нескольких операций на одном
+    соединении оно меньше суммы длительностей операций
+    """
+    if has_app_context():
+        g.ldap_wait = g.get("ldap_wait", 0.0) + seconds
+
+
+def entries_size(entries: List) -> Tuple[int, int]:
+    """
+    Возвращает количество записей в результате поиска (без ссылок) и объем их DN и
+    значений атрибутов в байтах
+    """
+    count = 0
+    size = 0
+    for dn, attrs in entries:
+        if dn is None:
+            continue
+        count += 1
+        size += len(dn)
+        for name, values in attrs.items():
+            size += len(name) + sum(len(value) for value in values)
+    return count, size
+
+
+def modlist_size(modlist: List) -> int:
+    """
+    Возвращает объем значений атрибутов в списке изменений (modlist) в байтах
+    """
+    size = 0
+    for item in modlist:
+        values = item[-1]
+        if values is None:
+            continue
+        if isinstance(values, (bytes, str)):
+            values = [values]
+        size += sum(len(value) for value in values)
+    return size
+
+
+class InstrumentedLDAPObject:
+    """
+    Обертка объекта соединения python-ldap, учитывающая количество, длительность,
+    количество записей и объем данных операций по маршрутам. Длительность
+    асинхронных операций (search_ext, add_ext и т.п.) отсчитывается от отправки
+    запроса до получения итогового результата методом result3. Остальные
+    атрибуты передаются объекту соединения без изменений
+    """
+
+    def __init__(self, conn):
+        self.__conn = conn
+        # Незавершенные асинхронные операции: тип, время отправки, количество
+        # записей и объем данных
+        self.__pending: Dict[int, List[Any]] = {}
+
+    def __getattr__(self, name: str):
+        if name.startswith("_InstrumentedLDAPObject__"):
+            raise AttributeError(name)
+        return getattr(self.__conn, name)
+
+    def __call(self, operation: str, method: str, size: int, *args, **kwargs):
+        started = time.perf_counter()
+        error = False
+        result = None
+        try:
+            result = getattr(self.__conn, method)(*args, **kwargs)
+            return result
+        except ldap.LDAPError:  # type: ignore
+            error = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            entries = 0
+            if operation == "search" and isinstance(result, list):
+                entries, size = entries_size(result)
+            record_ldap_operation(operation, seconds, entries, size, error)
+            record_ldap_wait(seconds)
+
+    def __submit(self, operation: str, method: str, size: int, *args, **kwargs):
+        started = time.perf_counter()
+        msgid = getattr(self.__conn, method)(*args, **kwargs)
+        record_ldap_wait(time.perf_counter() - started)
+        self.__pending[msgid] = [operation, started, 0, size]
+        return msgid
+
+    def __finish(self, msgid: int, error: bool = False):
+        pending = self.__pending.pop(msgid, None)
+        if pending:
+            operation, started, entries, size = pending
+            seconds = time.perf_counter() - started
+            record_ldap_operation(operation, seconds, entries, size, error)
+
+    def search_s(self, *args, **kwargs):
+        return self.__call("search", "search_s", 0, *args, **kwargs)
+
+    def search_ext_s(self, *args, **kwargs):
+        return self.__call("search", "search_ext_s", 0, *args, **kwargs)
+
+    def modify_s(self, dn, modlist, *args, **kwargs):
+        size = modlist_size(modlist)
+        return self.__call("modify", "modify_s", size, dn, modlist, *args, **kwargs)
+
+    def modify_ext_s(self, dn, modlist, *args, **kwargs):
+        size = modlist_size(modlist)
+        return self.__call(
+            "modify", "modify_ext_s", size, dn, modlist, *args, **kwargs
+        )
+
+    def add_s(self, dn, modlist, *args, **kwargs):
+        size = modlist_size(modlist)
+        return self.__call("add", "add_s", size, dn, modlist, *args, **kwargs)
+
+    def add_ext_s(self, dn, modlist, *args, **kwargs):
+        size = modlist_size(modlist)
+        return self.__call("add", "add_ext_s", size, dn, modlist, *args, **kwargs)
+
+    def delete_s(self, *args, **kwargs):
+        return self.__call("delete", "delete_s", 0, *args, **kwargs)
+
+    def delete_ext_s(self, *args, **kwargs):
+        return self.__call("delete", "delete_ext_s", 0, *args, **kwargs)
+
+    def simple_bind_s(self, *args, **kwargs):
+        return self.__call("bind", "simple_bind_s", 0, *args, **kwargs)
+
+    def bind_s(self, *args, **kwargs):
+        return self.__call("bind", "bind_s", 0, *args, **kwargs)
+
+    def whoami_s(self, *args, **kwargs):
+        return self.__call("whoami", "whoami_s", 0, *args, **kwargs)
+
+    def search_ext(self, *args, **kwargs):
+        return self.__submit("search", "search_ext", 0, *args, **kwargs)
+
+    def add_ext(self, dn, modlist, *args, **kwargs):
+        size = modlist_size(modlist)
+        return self.__submit("add", "add_ext", size, dn, modlist, *args, **kwargs)
+
+    def modify_ext(self, dn, modlist, *args, **kwargs):
+        size = modlist_size(modlist)
+        return self.__submit(
+            "modify", "modify_ext", size, dn, modlist, *args, **kwargs
+        )
+
+    def delete_ext(self, *args, **kwargs):
+        return self.__submit("delete", "delete_ext", 0, *args, **kwargs)
+
+    def result3(self, msgid=ldap.RES_ANY, *args, **kwargs):  # type: ignore
+        started = time.perf_counter()
+        try:
+            result = self.__conn.result3(msgid, *args, **kwargs)
+        except ldap.LDAPError as e:  # type: ignore
+            info = e.args[0] if e.args and isinstance(e.args[0], dict) else {}
+            self.__finish(info.get("msgid", msgid), error=True)
+            raise
+        finally:
+            record_ldap_wait(time.perf_counter() - started)
+
+        result_type, result_data, result_msgid = result[0], result[1], result[2]
+        pending = self.__pending.get(result_msgid)
+        if pending and result_data and pending[0] == "search":
+            entries, size = entries_size(result_data)
+            pending[2] += entries
+            pending[3] += size
+        if result_type not in PARTIAL_RESULT_TYPES:
+            self.__finish(result_msgid)
+        return result
+
+    def abandon(self, msgid, *args, **kwargs):
+        self.__pending.pop(msgid, None)
+        return self.__conn.abandon(msgid, *args, **kwargs)
+
+    def unbind(self, *args, **kwargs):
+        self.__pending.clear()
+        return self.__conn.unbind(*args, **kwargs)
+
+
+def start_request_timer():
+    """
+    Обработчик before_request: запоминает время начала обработки запроса
+    """
+    g.request_started = time.perf_counter()
+
+
+def __observe_request(route: str, started: float):
+    seconds = time.perf_counter() - started
+    with __stats_lock:
+        stats = __request_stats.get(route)
+        if stats is None:
+            stats = __request_stats[route] = Histogram()
+        stats.observe(seconds)
+
+
+def add_server_timing(response: Response) -> Response:
+    """
+    Обработчик after_request: учитывает длительность обработки запроса и
+    добавляет заголовок Server-Timing с временем ожидания ответов каталога (ldap),
+    суммарной длительностью операций каждого типа и временем обработки запроса
+    (app).
+
+    Тело потокового ответа (например, списка пользователей или выгрузки)
+    формируется после отправки заголовков, поэтому для него Server-Timing
+    отражает только работу до отправки заголовков (отмечается desc="headers").
+    Длительность такого запроса учитывается в http_request_duration_seconds при
+    закрытии ответа, а операции LDAP при передаче тела учитываются в
+    статистике маршрута по мере выполнения
+    """
+    started = g.get("request_started")
+    if started is None:
+        return response
+    seconds = time.perf_counter() - started
+
+    route = current_route()
+    if response.is_streamed:
+        response.call_on_close(lambda: __observe_request(route, started))
+    else:
+        __observe_request(route, started)
+
+    timings = [f"ldap;dur={g.get('ldap_wait', 0.0) * 1000:.3f}"]
+    for operation, (count, total) in sorted(g.get("ldap_operations", {}).items()):
+        timings.append(
+            f'ldap-{operation};dur={total * 1000:.3f};desc="count={count}"'
+        )
+    if response.is_streamed:
+        timings.append(f'app;dur={seconds * 1000:.3f};desc="headers"')
+    else:
+        timings.append(f"app;dur={seconds * 1000:.3f}")
+    response.headers.add("Server-Timing", ", ".join(timings))
+    return response
+
+
+def __label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def __labels(**labels: str) -> str:
+    return ",".join(
+        f'{name}="{__label_value(value)}"' for name, value in labels.items()
+    )
+
+
+def __histogram_lines(name: str, labels: str, histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), histogram.buckets):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+def render_metrics() -> str:
+    """
+    Возвращает накопленную статистику в текстовом формате Prometheus. Статистика
+    накапливается отдельно в каждом процессе приложения
+    """
+    with __stats_lock:
+        ldap_stats = [
+            (key, stats.copy()) for key, stats in sorted(__ldap_stats.items())
+        ]
+        request_stats = [
+            (route, stats.copy()) for route, stats in sorted(__request_stats.items())
+        ]
+
+    lines = [
+        "# HELP ldap_operation_duration_seconds Длительность операций LDAP",
+        "# TYPE ldap_operation_duration_seconds histogram",
+    ]
+    for (route, operation), stats in ldap_stats:
+        lines += __histogram_lines(
+            "ldap_operation_duration_seconds",
+            __labels(route=route, operation=operation),
+            stats,
+        )
+
+    counters = [
+        ("ldap_operation_entries_total", "Количество полученных записей", "entries"),
+        ("ldap_operation_bytes_total", "Объем данных атрибутов, байт", "bytes"),
+        ("ldap_operation_errors_total", "Количество операций с ошибкой", "errors"),
+    ]
+    for name, description, attribute in counters:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} counter")
+        for (route, operation), stats in ldap_stats:
+            labels = __labels(route=route, operation=operation)
+            lines.append(f"{name}{{{labels}}} {getattr(stats, attribute)}")
+
+    lines += [
+        "# HELP http_request_duration_seconds Длительность обработки запросов",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for route, histogram in request_stats:
+        lines += __histogram_lines(
+            "http_request_duration_seconds", __labels(route=route), histogram
+        )
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    """
+    Сбрасывает накопленную статистику
+    """
+    with __stats_lock:
+        __ldap_stats.clear()
+        __request_stats.clear()
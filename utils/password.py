@@ -1,48 +1,181 @@
 # Author: Zhang Huangbin <zhb@iredmail.org>
 
-import crypt
 import hashlib
-
-import subprocess
-from base64 import b64encode
+import hmac
+import math
+import re
+import struct
+from abc import ABC, abstractmethod
+from base64 import b64decode, b64encode
 
 from os import urandom
-from typing import List, Optional, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 from models.settings import get_settings
 
 
-def generate_bcrypt_password(p) -> str:
+__CRYPT_ITOA64 = "./0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+SHA512_CRYPT_DEFAULT_ROUNDS = 5000
+SHA512_CRYPT_MIN_ROUNDS = 1000
+SHA512_CRYPT_MAX_ROUNDS = 999999999
+
+
+def __to_bytes(p: Union[str, bytes]) -> bytes:
     if isinstance(p, str):
         p = p.encode()
+    return p.strip()
+
+
+def __crypt_salt(length: int) -> str:
+    return "".join(__CRYPT_ITOA64[b & 0x3F] for b in urandom(length))
+
+
+def __crypt_b64(data: bytes, groups: List[Tuple[int, int, int]], tail: List[int]) -> str:
+    """Encode bytes with crypt(3) base64 alphabet, taking bytes by given groups of
+    three indexes (big-endian within group) and final bytes from `tail`."""
+    result = []
+    for b2, b1, b0 in groups:
+        w = (data[b2] << 16) | (data[b1] << 8) | data[b0]
+        for _ in range(4):
+            result.append(__CRYPT_ITOA64[w & 0x3F])
+            w >>= 6
+
+    w = 0
+    for index in tail:
+        w = (w << 8) | data[index]
+    for _ in range(len(tail) + 1):
+        result.append(__CRYPT_ITOA64[w & 0x3F])
+        w >>= 6
+    return "".join(result)
+
+
+def md5_crypt(p: Union[str, bytes], salt: str) -> str:
+    """MD5-based crypt(3) ('$1$'), without depending on removed `crypt` module.
+
+    >>> md5_crypt("password", "saltstri")
+    '$1$saltstri$qQY4WxjABChYG1ccLpfkz/'
+    """
+    pw = p.encode() if isinstance(p, str) else p
+    salt_bytes = salt.encode()[:8]
+    magic = b"$1$"
+
+    final = hashlib.md5(pw + salt_bytes + pw).digest()
+    ctx = hashlib.md5(pw + magic + salt_bytes)
+    for pl in range(len(pw), 0, -16):
+        ctx.update(final[: min(16, pl)])
+
+    i = len(pw)
+    while i:
+        ctx.update(b"\x00" if i & 1 else pw[:1])
+        i >>= 1
+    final = ctx.digest()
+
+    for i in range(1000):
+        ctx = hashlib.md5(pw if i & 1 else final)
+        if i % 3:
+            ctx.update(salt_bytes)
+        if i % 7:
+            ctx.update(pw)
+        ctx.update(final if i & 1 else pw)
+        final = ctx.digest()
+
+    groups = [(0, 6, 12), (1, 7, 13), (2, 8, 14), (3, 9, 15), (4, 10, 5)]
+    return f"$1${salt_bytes.decode()}${__crypt_b64(final, groups, [11])}"
+
+
+def sha512_crypt(p: Union[str, bytes], salt: str, rounds: Optional[int] = None) -> str:
+    """SHA512-based crypt(3) ('$6$', Ulrich Drepper's specification), without
+    depending on removed `crypt` module. As in glibc, 'rounds=N$' is included in
+    result only if `rounds` is given explicitly.
+
+    >>> sha512_crypt("Hello world!", "saltstring")
+    '$6$saltstring$svn8UoSVapNtMuq1ukKS4tPQd8iKwSMHWjl/O817G3uBnIFNjnQJuesI68u4OTLiBFdcbYEdFCoEOfaS35inz1'
+    >>> sha512_crypt("Hello world!", "saltstringsaltstring", 10000)
+    '$6$rounds=10000$saltstringsaltst$OW1/O6BYHV6BcXZu8QVeXbDWra3Oeqh0sbHbbMCVNSnCM/UrjmM0Dp8vOuZeHBy/YTBmSK6H9qs/y3RnOaw5v.'
+    """
+    pw = p.encode() if isinstance(p, str) else p
+    salt_bytes = salt.encode()[:16]
+    rounds_spec = ""
+    if rounds is None:
+        rounds = SHA512_CRYPT_DEFAULT_ROUNDS
+    else:
+        rounds = min(max(rounds, SHA512_CRYPT_MIN_ROUNDS), SHA512_CRYPT_MAX_ROUNDS)
+        rounds_spec = f"rounds={rounds}$"
+
+    b = hashlib.sha512(pw + salt_bytes + pw).digest()
+    a = hashlib.sha512(pw + salt_bytes)
+    length = len(pw)
+    while length > 64:
+        a.update(b)
+        length -= 64
+    a.update(b[:length])
+
+    i = len(pw)
+    while i:
+        a.update(b if i & 1 else pw)
+        i >>= 1
+    a_digest = a.digest()
+
+    dp = hashlib.sha512(pw * len(pw)).digest()
+    p_bytes = (dp * (len(pw) // 64 + 1))[: len(pw)]
+    ds = hashlib.sha512(salt_bytes * (16 + a_digest[0])).digest()
+    s_bytes = (ds * (len(salt_bytes) // 64 + 1))[: len(salt_bytes)]
+
+    c = a_digest
+    for r in range(rounds):
+        ctx = hashlib.sha512(p_bytes if r & 1 else c)
+        if r % 3:
+            ctx.update(s_bytes)
+        if r % 7:
+            ctx.update(p_bytes)
+        ctx.update(c if r & 1 else p_bytes)
+        c = ctx.digest()
+
+    groups = []
+    for i in range(21):
+        indexes = (i, i + 21, i + 42)
+        shift = i % 3
+        groups.append(indexes[shift:] + indexes[:shift])
+
+    return f"$6${rounds_spec}{salt_bytes.decode()}${__crypt_b64(c, groups, [63])}"
+
+
+def generate_bcrypt_password(p, rounds: Optional[int] = None) -> str:
+    p = __to_bytes(p)
 
     try:
         import bcrypt
     except:
         return generate_ssha_password(p)
 
-    return "{CRYPT}" + bcrypt.hashpw(p, bcrypt.gensalt()).decode()
+    rounds = rounds or get_settings().PASSWORD_BCRYPT_ROUNDS
+    return "{CRYPT}" + bcrypt.hashpw(p, bcrypt.gensalt(rounds)).decode()
 
 
-def generate_md5_password(p: str) -> str:
-    return crypt.crypt(p, salt=crypt.METHOD_MD5)
+def generate_md5_password(p: Union[str, bytes]) -> str:
+    return md5_crypt(__to_bytes(p), __crypt_salt(8))
+
+
+def generate_sha512_crypt_password(
+    p: Union[str, bytes], rounds: Optional[int] = None
+) -> str:
+    rounds = rounds or get_settings().PASSWORD_SHA512_CRYPT_ROUNDS
+    return "{CRYPT}" + sha512_crypt(__to_bytes(p), __crypt_salt(16), rounds)
 
 
 def generate_plain_md5_password(p: Union[str, bytes]) -> str:
-    if isinstance(p, str):
-        p_as_str = p.encode()
+    return hashlib.md5(__to_bytes(p)).hexdigest()
 
-    p_as_str = p_as_str.strip()
-    return hashlib.md5(p_as_str).hexdigest()
 
+def generate_sha_password(p: Union[str, bytes]) -> str:
+    """Generate SHA1 password with prefix '{SHA}'."""
+    return "{SHA}" + b64encode(hashlib.sha1(__to_bytes(p)).digest()).decode()
 
-def generate_ssha_password(p: Union[str, bytes]) -> str:
-    if isinstance(p, str):
-        p_as_str = p.encode()
 
-    p_as_str = p_as_str.strip()
+def generate_ssha_password(p: Union[str, bytes]) -> str:
     salt = urandom(8)
-    pw = hashlib.sha1(p_as_str)
+    pw = hashlib.sha1(__to_bytes(p))
     pw.update(salt)
 
     return "{SSHA}" + b64encode(pw.digest() + salt).decode()
@@ -50,58 +183,407 @@ def generate_ssha_password(p: Union[str, bytes]) -> str:
 
 def generate_sha512_password(p: Union[str, bytes]) -> str:
     """Generate SHA512 password with prefix '{SHA512}'."""
-    if isinstance(p, str):
-        p_as_str = p.encode()
-
-    p_as_str = p_as_str.strip()
-    pw = hashlib.sha512(p_as_str)
+    pw = hashlib.sha512(__to_bytes(p))
     return "{SHA512}" + b64encode(pw.digest()).decode()
 
 
 def generate_ssha512_password(p: Union[str, bytes]) -> str:
     """Generate salted SHA512 password with prefix '{SSHA512}'."""
-    if isinstance(p, str):
-        p_as_str = p.encode()
-
-    p_as_str = p_as_str.strip()
     salt = urandom(8)
-    pw = hashlib.sha512(p_as_str)
+    pw = hashlib.sha512(__to_bytes(p))
     pw.update(salt)
     return "{SSHA512}" + b64encode(pw.digest() + salt).decode()
 
 
-def generate_password_with_doveadmpw(scheme: str, plain_password: str) -> str:
-    """Generate password hash with `doveadm pw` command.
-    Return SSHA instead if no 'doveadm' command found or other error raised."""
-    # scheme: CRAM-MD5, NTLM
-    scheme = scheme.upper()
-    settings = get_settings()
+__MASK32 = 0xFFFFFFFF
 
-    p = str(plain_password).strip()
+__MD5_INITIAL_STATE = (0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476)
+__MD5_SHIFTS = [7, 12, 17, 22] * 4 + [5, 9, 14, 20] * 4 + [4, 11, 16, 23] * 4 + [6, 10, 15, 21] * 4
+__MD5_CONSTANTS = [int(abs(math.sin(i + 1)) * 2**32) & __MASK32 for i in range(64)]
 
-    try:
-        pp = subprocess.Popen(
-            args=["doveadm", "pw", "-s", scheme, "-p", p], stdout=subprocess.PIPE
-        )
-        pw = pp.communicate()[0].decode()
+__MD4_ROUND3_ORDER = (0, 8, 4, 12, 2, 10, 6, 14, 1, 9, 5, 13, 3, 11, 7, 15)
 
-        if settings.PASSWORD_HASHES_USE_PREFIXED_SCHEME:
-            pw = pw.lstrip("{" + scheme + "}")
 
-        # remove '\n'
-        pw = pw.strip()
+def __rotl32(x: int, n: int) -> int:
+    x &= __MASK32
+    return ((x << n) | (x >> (32 - n))) & __MASK32
 
-        return pw
-    except:
-        return generate_ssha_password(p)
 
+def __md5_compress(state, block: bytes):
+    """Apply MD5 compression function to one 64-byte block.
+
+    Used to get the intermediate HMAC-MD5 state, which `hashlib` doesn't expose.
+    """
+    x = struct.unpack("<16I", block)
+    a, b, c, d = state
+
+    for i in range(64):
+        if i < 16:
+            f = (b & c) | (~b & d)
+            k = i
+        elif i < 32:
+            f = (d & b) | (~d & c)
+            k = (5 * i + 1) % 16
+        elif i < 48:
+            f = b ^ c ^ d
+            k = (3 * i + 5) % 16
+        else:
+            f = c ^ (b | ~d)
+            k = (7 * i) % 16
+
+        f = (f + a + __MD5_CONSTANTS[i] + x[k]) & __MASK32
+        a, d, c = d, c, b
+        b = (b + __rotl32(f, __MD5_SHIFTS[i])) & __MASK32
+
+    return tuple((s + v) & __MASK32 for s, v in zip(state, (a, b, c, d)))
+
+
+def __md4(data: bytes) -> bytes:
+    """MD4 digest (RFC 1320).
+
+    OpenSSL 3 disables MD4 by default, so `hashlib.new("md4")` is not reliable.
+
+    Test suite from RFC 1320, appendix A.5:
+
+    >>> __md4(b"").hex()
+    '31d6cfe0d16ae931b73c59d7e0c089c0'
+    >>> __md4(b"a").hex()
+    'bde52cb31de33e46245e05fbdbd6fb24'
+    >>> __md4(b"abc").hex()
+    'a448017aaf21d8525fc10ae87aa6729d'
+    >>> __md4(b"message digest").hex()
+    'd9130a8164549fe818874806e1c7014b'
+    >>> __md4(b"abcdefghijklmnopqrstuvwxyz").hex()
+    'd79e1c308aa5bbcdeea8ed63df412da9'
+    >>> __md4(
+    ...     b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    ... ).hex()
+    '043f8582f241db351ce627e153e7f0e4'
+    >>> __md4(b"1234567890" * 8).hex()
+    'e33b4ddc9c38f2199c3e7b164fcc0536'
+    """
+    state = [0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476]
+    message = (
+        data
+        + b"\x80"
+        + b"\x00" * ((55 - len(data)) % 64)
+        + struct.pack("<Q", (len(data) * 8) & 0xFFFFFFFFFFFFFFFF)
+    )
+
+    for offset in range(0, len(message), 64):
+        x = struct.unpack("<16I", message[offset : offset + 64])
+        a, b, c, d = state
+
+        for i in range(16):
+            a = __rotl32(a + ((b & c) | (~b & d)) + x[i], (3, 7, 11, 19)[i % 4])
+            a, b, c, d = d, a, b, c
+        for i in range(16):
+            k = (i % 4) * 4 + i // 4
+            a = __rotl32(
+                a + ((b & c) | (b & d) | (c & d)) + x[k] + 0x5A827999,
+                (3, 5, 9, 13)[i % 4],
+            )
+            a, b, c, d = d, a, b, c
+        for i in range(16):
+            k = __MD4_ROUND3_ORDER[i]
+            a = __rotl32(a + (b ^ c ^ d) + x[k] + 0x6ED9EBA1, (3, 9, 11, 15)[i % 4])
+            a, b, c, d = d, a, b, c
+
+        state = [(s + v) & __MASK32 for s, v in zip(state, (a, b, c, d))]
+
+    return struct.pack("<4I", *state)
+
+
+def cram_md5_hash(p: Union[str, bytes]) -> str:
+    """Return hex encoded HMAC-MD5 context of password, the same value as
+    `doveadm pw -s CRAM-MD5` prints (without prefix): MD5 states after
+    processing `key ^ opad` and `key ^ ipad` blocks, as little-endian words.
+
+    >>> cram_md5_hash("password")
+    '9186d855e11eba527a7a52ca82b313e180d62234f0acc9051b527243d41e2740'
+    >>> cram_md5_hash("Secr3t!")
+    'ae16435de5c66bd79e7a1d616cda8454de4f30e0b3ef4c687d8aa62236539367'
+    >>> cram_md5_hash("x" * 100)  # key longer than 64 bytes is hashed first
+    '52197db948d0932512a61b183e7d05b04e94d60a3bb0d00f92d3df52a5d275ca'
+    """
+    if isinstance(p, str):
+        p = p.encode()
+
+    key = p
+    if len(key) > 64:
+        key = hashlib.md5(key).digest()
+    key = key.ljust(64, b"\x00")
+
+    inner = __md5_compress(__MD5_INITIAL_STATE, bytes(b ^ 0x36 for b in key))
+    outer = __md5_compress(__MD5_INITIAL_STATE, bytes(b ^ 0x5C for b in key))
+    return (struct.pack("<4I", *outer) + struct.pack("<4I", *inner)).hex()
+
+
+def ntlm_hash(p: Union[str, bytes]) -> str:
+    """Return hex encoded NT hash (MD4 of UTF-16LE password), the same value
+    as `doveadm pw -s NTLM` prints (without prefix).
+
+    >>> ntlm_hash("password")
+    '8846f7eaee8fb117ad06bdd830b7586c'
+    >>> ntlm_hash("")
+    '31d6cfe0d16ae931b73c59d7e0c089c0'
+    >>> ntlm_hash("Secr3t!")
+    '50a0bac757f5dc5faec745d20c01be08'
+    """
+    if isinstance(p, bytes):
+        p = p.decode()
+    return __md4(p.encode("utf-16-le")).hex()
+
+
+def split_password_hash(pw_hash: str) -> Tuple[Optional[str], str]:
+    """Split password hash to upper-cased scheme name and hash value.
+
+    >>> split_password_hash("{ssha}abc")
+    ('SSHA', 'abc')
+    >>> split_password_hash("abc")
+    (None, 'abc')
+    """
+    match = re.match(r"^\{([A-Za-z0-9.-]+)\}(.*)$", pw_hash, re.DOTALL)
+    if not match:
+        return None, pw_hash
+    return match.group(1).upper(), match.group(2)
+
+
+class PasswordScheme(ABC):
+    """
+    Схема хэширования паролей: вычисление хэша, проверка пароля по хэшу и
+    определение необходимости пересчета хэша после изменения настроек. Схема
+    должна реализовать методы hash и verify, иначе экземпляр схемы не создается
+
+    Аргументы:
+      name: наименование схемы, как в настройке PASSWORD_DEFAULT_SCHEME
+      prefixes: наименования схем в префиксе хэша ("{SSHA512}..."), по которым
+        хэш относится к данной схеме
+    """
+
+    def __init__(self, name: str, prefixes: Tuple[str, ...]):
+        self.name = name
+        self.prefixes = prefixes
+
+    @abstractmethod
+    def hash(self, password: str) -> str: ...
+
+    @abstractmethod
+    def verify(self, password: str, pw_hash: str) -> bool: ...
+
+    def identify(self, pw_hash: str) -> bool:
+        scheme, _ = split_password_hash(pw_hash)
+        return scheme in self.prefixes
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        return False
+
+
+class FunctionScheme(PasswordScheme):
+    """
+    Схема, хэш которой однозначно определяется паролем (без соли). Проверка
+    выполняется повторным вычислением хэша
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prefixes: Tuple[str, ...],
+        generate: Callable[[str], str],
+    ):
+        super().__init__(name, prefixes)
+        self.generate = generate
+
+    def hash(self, password: str) -> str:
+        return self.generate(password)
+
+    def verify(self, password: str, pw_hash: str) -> bool:
+        _, expected = split_password_hash(pw_hash)
+        _, actual = split_password_hash(self.generate(password))
+        return hmac.compare_digest(actual, expected)
+
+
+class PrefixedFunctionScheme(FunctionScheme):
+    """
+    Схема без соли, префикс которой добавляется в соответствии с настройкой
+    PASSWORD_HASHES_USE_PREFIXED_SCHEME
+    """
+
+    def hash(self, password: str) -> str:
+        pw_hash = self.generate(password)
+        if get_settings().PASSWORD_HASHES_USE_PREFIXED_SCHEME:
+            pw_hash = "{" + self.name + "}" + pw_hash
+        return pw_hash
+
+
+class SaltedDigestScheme(PasswordScheme):
+    """
+    Схемы семейства {SSHA}/{SSHA512}: base64 от дайджеста пароля с солью,
+    за которым следует соль
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prefixes: Tuple[str, ...],
+        generate: Callable[[str], str],
+        digest: Callable,
+    ):
+        super().__init__(name, prefixes)
+        self.generate = generate
+        self.digest = digest
+
+    def hash(self, password: str) -> str:
+        return self.generate(password)
+
+    def verify(self, password: str, pw_hash: str) -> bool:
+        _, value = split_password_hash(pw_hash)
+        try:
+            raw = b64decode(value)
+        except ValueError:
+            return False
+
+        digest_size = self.digest().digest_size
+        expected, salt = raw[:digest_size], raw[digest_size:]
+        actual = self.digest(password.encode() + salt).digest()
+        return hmac.compare_digest(actual, expected)
+
+
+class CryptScheme(PasswordScheme):
+    """
+    Схемы в формате crypt(3) ("{CRYPT}$id$..."), различаемые по идентификатору id
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prefixes: Tuple[str, ...],
+        crypt_ids: Tuple[str, ...],
+    ):
+        super().__init__(name, prefixes)
+        self.crypt_ids = crypt_ids
+
+    def identify(self, pw_hash: str) -> bool:
+        scheme, value = split_password_hash(pw_hash)
+        return scheme in self.prefixes and value.startswith(self.crypt_ids)
+
+
+class MD5CryptScheme(CryptScheme):
+    def hash(self, password: str) -> str:
+        return "{CRYPT}" + generate_md5_password(password)
+
+    def verify(self, password: str, pw_hash: str) -> bool:
+        _, value = split_password_hash(pw_hash)
+        salt = value[3:].split("$", 1)[0]
+        return hmac.compare_digest(md5_crypt(password.encode(), salt), value)
+
+
+class SHA512CryptScheme(CryptScheme):
+    def hash(self, password: str) -> str:
+        return generate_sha512_crypt_password(password)
+
+    def verify(self, password: str, pw_hash: str) -> bool:
+        _, value = split_password_hash(pw_hash)
+        rounds, salt = self.__parse(value)
+        return hmac.compare_digest(
+            sha512_crypt(password.encode(), salt, rounds), value
+        )
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        _, value = split_password_hash(pw_hash)
+        rounds, _ = self.__parse(value)
+        rounds = rounds or SHA512_CRYPT_DEFAULT_ROUNDS
+        return rounds < get_settings().PASSWORD_SHA512_CRYPT_ROUNDS
 
-def generate_cram_md5_password(p):
-    return generate_password_with_doveadmpw("CRAM-MD5", p)
+    def __parse(self, value: str) -> Tuple[Optional[int], str]:
+        parts = value.split("$")
+        if len(parts) > 3 and parts[2].startswith("rounds="):
+            try:
+                return int(parts[2][len("rounds=") :]), parts[3]
+            except ValueError:
+                return None, parts[3]
+        return None, parts[2] if len(parts) > 2 else ""
 
 
-def generate_ntlm_password(p):
-    return generate_password_with_doveadmpw("NTLM", p)
+class BcryptScheme(CryptScheme):
+    def hash(self, password: str) -> str:
+        return generate_bcrypt_password(password)
+
+    def verify(self, password: str, pw_hash: str) -> bool:
+        import bcrypt
+
+        _, value = split_password_hash(pw_hash)
+        try:
+            return bcrypt.checkpw(password.encode(), value.encode())
+        except ValueError:
+            return False
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        _, value = split_password_hash(pw_hash)
+        try:
+            rounds = int(value.split("$")[2])
+        except (IndexError, ValueError):
+            return True
+        return rounds < get_settings().PASSWORD_BCRYPT_ROUNDS
+
+
+__password_schemes: Dict[str, PasswordScheme] = {}
+
+
+def register_password_scheme(scheme: PasswordScheme):
+    """
+    Регистрирует схему хэширования паролей. Схема с тем же наименованием заменяется
+    """
+    __password_schemes[scheme.name] = scheme
+
+
+def get_password_scheme(name: str) -> Optional[PasswordScheme]:
+    return __password_schemes.get(name.upper())
+
+
+def get_password_schemes() -> List[PasswordScheme]:
+    return list(__password_schemes.values())
+
+
+def identify_password_scheme(pw_hash: str) -> Optional[PasswordScheme]:
+    """
+    Определяет схему, которой был вычислен хэш пароля
+    """
+    for scheme in __password_schemes.values():
+        if scheme.identify(pw_hash):
+            return scheme
+    return None
+
+
+register_password_scheme(PrefixedFunctionScheme("PLAIN", ("PLAIN",), lambda p: p))
+register_password_scheme(
+    PrefixedFunctionScheme("PLAIN-MD5", ("PLAIN-MD5",), generate_plain_md5_password)
+)
+register_password_scheme(FunctionScheme("SHA", ("SHA",), generate_sha_password))
+register_password_scheme(
+    FunctionScheme("SHA512", ("SHA512",), generate_sha512_password)
+)
+register_password_scheme(
+    SaltedDigestScheme("SSHA", ("SSHA",), generate_ssha_password, hashlib.sha1)
+)
+register_password_scheme(
+    SaltedDigestScheme(
+        "SSHA512", ("SSHA512",), generate_ssha512_password, hashlib.sha512
+    )
+)
+register_password_scheme(MD5CryptScheme("MD5", ("CRYPT", "MD5-CRYPT"), ("$1$",)))
+register_password_scheme(
+    SHA512CryptScheme("SHA512-CRYPT", ("CRYPT", "SHA512-CRYPT"), ("$6$",))
+)
+register_password_scheme(
+    BcryptScheme("BCRYPT", ("CRYPT", "BLF-CRYPT"), ("$2a$", "$2b$", "$2y$"))
+)
+# {CRYPT} без уточнения алгоритма вычисляется как SHA512-CRYPT
+register_password_scheme(SHA512CryptScheme("CRYPT", ("CRYPT",), ("$6$",)))
+register_password_scheme(
+    PrefixedFunctionScheme("CRAM-MD5", ("CRAM-MD5",), cram_md5_hash)
+)
+register_password_scheme(PrefixedFunctionScheme("NTLM", ("NTLM",), ntlm_hash))
 
 
 def generate_password_hash(p: Union[str, bytes], scheme: Optional[str] = None) -> str:
@@ -116,62 +598,39 @@ def generate_password_hash(p: Union[str, bytes], scheme: Optional[str] = None) -
     p_as_str = p_as_str.strip()
     scheme = scheme or settings.PASSWORD_DEFAULT_SCHEME
 
-    # # Supports returning multiple passwords.
-    # pw_schemes = pwscheme.split("+")
-    # pws = []
-
-    if scheme == "BCRYPT":
-        pw_hash = generate_bcrypt_password(p_as_str)
-    elif scheme == "SSHA512":
-        pw_hash = generate_ssha512_password(p_as_str)
-    elif scheme == "SHA512":
-        pw_hash = generate_sha512_password(p_as_str)
-    elif scheme == "SSHA":
-        pw_hash = generate_ssha_password(p_as_str)
-    elif scheme == "MD5":
-        pw_hash = "{CRYPT}" + generate_md5_password(p_as_str)
-    elif scheme == "CRAM-MD5":
-        pw_hash = generate_cram_md5_password(p_as_str)
-    elif scheme == "PLAIN-MD5":
-        pw_hash = generate_plain_md5_password(p_as_str)
-    elif scheme == "NTLM":
-        pw_hash = generate_ntlm_password(p_as_str)
-    elif scheme == "PLAIN":
-        if settings.PASSWORD_HASHES_USE_PREFIXED_SCHEME:
-            pw_hash = "{PLAIN}" + p_as_str
-        else:
-            pw_hash = p_as_str
+    password_scheme = get_password_scheme(scheme)
+    if password_scheme is None:
+        return p_as_str
+    return password_scheme.hash(p_as_str)
 
-    else:
-        pw_hash = p_as_str
-    return pw_hash
 
+def verify_password_hash(p: Union[str, bytes], pw_hash: str) -> bool:
+    """Check password against hash of any registered scheme."""
+    if isinstance(p, bytes):
+        p = p.decode()
 
-def is_supported_password_scheme(pw_hash):
-    if not (pw_hash.startswith("{") and "}" in pw_hash):
+    password_scheme = identify_password_scheme(pw_hash)
+    if password_scheme is None:
         return False
+    return password_scheme.verify(p.strip(), pw_hash)
 
-    # Extract scheme name from password hash: "{SSHA}xxxx" -> "SSHA"
-    try:
-        scheme = pw_hash.split("}", 1)[0].split("{", 1)[-1]
-        scheme = scheme.upper()
-
-        if scheme in [
-            "PLAIN",
-            "CRYPT",
-            "MD5",
-            "PLAIN-MD5",
-            "SHA",
-            "SSHA",
-            "SHA512",
-            "SSHA512",
-            "SHA512-CRYPT",
-            "BCRYPT",
-            "CRAM-MD5",
-            "NTLM",
-        ]:
-            return True
-    except:
-        pass
 
-    return False
+def password_hash_needs_rehash(pw_hash: str) -> bool:
+    """Return True if hash was generated with other scheme than
+    PASSWORD_DEFAULT_SCHEME, or with weaker parameters than configured."""
+    settings = get_settings()
+
+    password_scheme = identify_password_scheme(pw_hash)
+    default_scheme = get_password_scheme(settings.PASSWORD_DEFAULT_SCHEME)
+    if password_scheme is None or default_scheme is None:
+        return True
+    if not default_scheme.identify(pw_hash):
+        return True
+    return default_scheme.needs_rehash(pw_hash)
+
+
+def is_supported_password_scheme(pw_hash):
+    scheme, _ = split_password_hash(pw_hash)
+    if scheme is None:
+        return False
+    return scheme in __password_schemes or identify_password_scheme(pw_hash) is not None
@@ -0,0 +1,118 @@
+import time
+from typing import Callable, Dict, List
+
+from utils.password import (
+    SHA512_CRYPT_MAX_ROUNDS,
+    SHA512_CRYPT_MIN_ROUNDS,
+    PasswordScheme,
+    generate_bcrypt_password,
+    generate_sha512_crypt_password,
+    get_password_schemes,
+)
+
+BENCHMARK_PASSWORD = "Bench#mark1Password"
+
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 20
+
+
+def __measure(func: Callable[[], object], min_time: float, min_runs: int = 3) -> float:
+    """
+    Выполняет функцию не менее min_runs раз и не меньше min_time секунд,
+    возвращает среднее время одного вызова в секундах
+    """
+    runs = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while runs < min_runs or elapsed < min_time:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - started
+    return elapsed / runs
+
+
+def benchmark_password_scheme(scheme: PasswordScheme, min_time: float = 0.5) -> Dict:
+    """
+    Измеряет скорость вычисления хэша пароля схемой
+
+    Возвращаемое значение:
+      словарь с наименованием схемы (scheme), средним временем вычисления хэша
+      в миллисекундах (mean_ms) и количеством хэшей в секунду (hashes_per_second)
+    """
+    mean = __measure(lambda: scheme.hash(BENCHMARK_PASSWORD), min_time)
+    return {
+        "scheme": scheme.name,
+        "mean_ms": mean * 1000,
+        "hashes_per_second": 1 / mean if mean else 0,
+    }
+
+
+def benchmark_password_schemes(min_time: float = 0.5) -> List[Dict]:
+    """
+    Измеряет скорость вычисления хэша всеми зарегистрированными схемами
+    """
+    return [
+        benchmark_password_scheme(scheme, min_time) for scheme in get_password_schemes()
+    ]
+
+
+def calibrate_bcrypt_rounds(target_ms: float) -> Dict:
+    """
+    Подбирает наибольшую стоимость bcrypt, при которой вычисление хэша занимает
+    не более target_ms миллисекунд (но не меньше минимально допустимой стоимости)
+
+    Возвращаемое значение:
+      словарь с подобранной стоимостью (rounds) и измерениями по стоимостям
+      (measurements: стоимость -> миллисекунды)
+    """
+    measurements: Dict[int, float] = {}
+    rounds = BCRYPT_MIN_ROUNDS
+
+    for cost in range(BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS + 1):
+        elapsed_ms = (
+            __measure(
+                lambda: generate_bcrypt_password(BENCHMARK_PASSWORD, cost),
+                min_time=0,
+                min_runs=1 if cost > 10 else 3,
+            )
+            * 1000
+        )
+        measurements[cost] = elapsed_ms
+        if elapsed_ms > target_ms:
+            break
+        rounds = cost
+
+    return {"rounds": rounds, "measurements": measurements}
+
+
+def calibrate_sha512_crypt_rounds(target_ms: float) -> Dict:
+    """
+    Подбирает количество раундов SHA512-CRYPT, при котором вычисление хэша занимает
+    около target_ms миллисекунд. Время вычисления линейно зависит от количества
+    раундов, поэтому оно оценивается по измерению на 5000 раундах
+
+    Возвращаемое значение:
+      словарь с подобранным количеством раундов (rounds) и измеренным временем
+      вычисления хэша с ними в миллисекундах (measured_ms)
+    """
+    sample_rounds = 5000
+    per_round = (
+        __measure(
+            lambda: generate_sha512_crypt_password(BENCHMARK_PASSWORD, sample_rounds),
+            min_time=0.2,
+        )
+        / sample_rounds
+    )
+
+    rounds = int(target_ms / 1000 / per_round) if per_round else SHA512_CRYPT_MIN_ROUNDS
+    rounds = min(max(rounds, SHA512_CRYPT_MIN_ROUNDS), SHA512_CRYPT_MAX_ROUNDS)
+
+    measured_ms = (
+        __measure(
+            lambda: generate_sha512_crypt_password(BENCHMARK_PASSWORD, rounds),
+            min_time=0,
+            min_runs=1,
+        )
+        * 1000
+    )
+    return {"rounds": rounds, "measured_ms": measured_ms}
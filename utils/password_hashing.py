@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Optional
+
+from models.settings import get_settings
+from utils.password import generate_password_hash
+
+
+__executor: Optional[ProcessPoolExecutor] = None
+__executor_lock = threading.Lock()
+
+
+def __get_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    Возвращает пул процессов для вычисления хэшей паролей, создавая его при первом
+    обращении. Если PASSWORD_HASHING_WORKERS равен нулю, пул не используется
+    """
+    global __executor
+
+    settings = get_settings()
+    if settings.PASSWORD_HASHING_WORKERS <= 0:
+        return None
+
+    with __executor_lock:
+        if __executor is None:
+            # Процессы запускаются методом spawn: fork многопоточного процесса
+            # может унаследовать захваченные другими потоками блокировки
+            __executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return __executor
+
+
+def hash_password(password: str, scheme: Optional[str] = None) -> str:
+    """
+    Вычисляет хэш пароля в пуле процессов, не занимая GIL потока обработки запроса
+
+    Аргументы:
+      password: пароль
+      scheme: схема хэширования, по умолчанию PASSWORD_DEFAULT_SCHEME
+    """
+    scheme = scheme or get_settings().PASSWORD_DEFAULT_SCHEME
+
+    executor = __get_executor()
+    if executor is None:
+        return generate_password_hash(password, scheme)
+    return executor.submit(generate_password_hash, password, scheme).result()
+
+
+def hash_passwords(passwords: List[str], scheme: Optional[str] = None) -> List[str]:
+    """
+    Вычисляет хэши списка паролей параллельно во всех процессах пула
+
+    Аргументы:
+      passwords: список паролей
+      scheme: схема хэширования, по умолчанию PASSWORD_DEFAULT_SCHEME
+    Возвращаемое значение:
+      список хэшей в порядке следования паролей
+    """
+    settings = get_settings()
+    scheme = scheme or settings.PASSWORD_DEFAULT_SCHEME
+
+    executor = __get_executor()
+    if executor is None:
+        return [generate_password_hash(password, scheme) for password in passwords]
+
+    chunksize = max(1, len(passwords) // (settings.PASSWORD_HASHING_WORKERS * 4))
+    return list(
+        executor.map(
+            generate_password_hash, passwords, repeat(scheme), chunksize=chunksize
+        )
+    )
+
+
+def shutdown_executor():
+    """
+    Останавливает пул процессов вычисления хэшей паролей
+    """
+    global __executor
+
+    with __executor_lock:
+        executor, __executor = __executor, None
+    if executor:
+        executor.shutdown()
+
+
+def __reset_after_fork():
+    """
+    Сбрасывает в дочернем процессе пул процессов, унаследованный от родительского
+    процесса: процессы пула и поток управления им принадлежат родителю
+    """
+    global __executor, __executor_lock
+
+    __executor = None
+    __executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork)
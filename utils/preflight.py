@@ -0,0 +1,152 @@
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import ldapurl
+from flask import Flask
+from jinja2 import FileSystemBytecodeCache
+from ldap.dn import str2dn
+from pydantic import ValidationError
+
+from controllers.asset_controller import get_assets_directory
+from models.ldap_connection import open_service_connections, service_connection
+from models.settings import Settings, get_settings
+from models.user import User
+from models.user_list_query import UserListQuery
+from models.user_password import UserPassword
+from utils.assets import load_manifest
+
+WARM_UP_PASSWORD = "Warm#up1Password"
+
+
+def __check_settings(app: Flask) -> List[str]:
+    """
+    Повторно читает и проверяет настройки, возвращает предупреждения о настройках,
+    замедляющих работу приложения
+    """
+    settings = Settings()  # type: ignore
+    str2dn(settings.LDAP_ROOT_DN)
+
+    if settings.LDAP_SERVICE_POOL_MIN_SIZE > settings.LDAP_SERVICE_POOL_MAX_SIZE:
+        raise ValueError(
+            "LDAP_SERVICE_POOL_MIN_SIZE не может превышать LDAP_SERVICE_POOL_MAX_SIZE"
+        )
+
+    warnings = []
+    if settings.TEMPLATES_AUTO_RELOAD:
+        warnings.append(
+            "TEMPLATES_AUTO_RELOAD включен: шаблоны проверяются при каждом рендеринге"
+        )
+    if not settings.TEMPLATES_BYTECODE_CACHE_DIRECTORY:
+        warnings.append("TEMPLATES_BYTECODE_CACHE_DIRECTORY не задан")
+    with app.app_context():
+        if not load_manifest(get_assets_directory()):
+            warnings.append("статические файлы не собраны (flask assets build)")
+    return warnings
+
+
+def __check_directory(app: Flask) -> List[str]:
+    """
+    Проверяет доступность каталога и корневой записи от имени служебной учетной
+    записи
+    """
+    settings = get_settings()
+    with service_connection() as connection:
+        connection.conn.search_s(
+            settings.LDAP_ROOT_DN, ldapurl.LDAP_SCOPE_BASE, attrlist=["1.1"]
+        )
+    return [f"{settings.LDAP_URI}, {settings.LDAP_ROOT_DN}"]
+
+
+def __compile_templates(app: Flask) -> List[str]:
+    """
+    Компилирует все шаблоны. Если задан кэш байт-кода, скомпилированные шаблоны
+    сохраняются в нем и используются другими процессами приложения
+    """
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return [f"шаблонов: {len(names)}"]
+
+
+def __open_connections(app: Flask) -> List[str]:
+    opened = open_service_connections()
+    return [f"открыто соединений: {opened}"]
+
+
+def __warm_up_models(app: Flask) -> List[str]:
+    """
+    Выполняет проверку данных моделями, чтобы первые запросы не тратили время на
+    построение и первый вызов валидаторов
+    """
+    User(uid="preflight", cn="Preflight", mailQuota=1024)
+    UserPassword(
+        password=WARM_UP_PASSWORD, password_repeat=WARM_UP_PASSWORD  # type: ignore
+    )
+    try:
+        UserPassword(password="", password_repeat="")  # type: ignore
+    except ValidationError:
+        pass
+    UserListQuery.from_args({"q": "preflight", "status": "active", "sort": "-uid"})
+    return []
+
+
+PREFLIGHT_STEPS: List[Tuple[str, str, Callable[[Flask], List[str]]]] = [
+    ("settings", "Проверка настроек", __check_settings),
+    ("directory", "Подключение к каталогу", __check_directory),
+    ("templates", "Компиляция шаблонов", __compile_templates),
+    ("connections", "Открытие соединений", __open_connections),
+    ("models", "Подготовка моделей", __warm_up_models),
+]
+
+
+def configure_bytecode_cache(app: Flask):
+    """
+    Подключает кэш байт-кода шаблонов в каталоге TEMPLATES_BYTECODE_CACHE_DIRECTORY,
+    если он задан
+    """
+    directory = get_settings().TEMPLATES_BYTECODE_CACHE_DIRECTORY
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def warm_up(app: Flask, steps: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Проверяет настройки и доступность каталога и выполняет работу, которую иначе
+    выполнили бы первые запросы: компилирует шаблоны, открывает соединения с
+    каталогом и подготавливает модели. После ошибки проверки настроек или
+    подключения к каталогу остальные шаги не выполняются
+
+    Аргументы:
+      app: экземпляр Flask
+      steps: идентификаторы выполняемых шагов, по умолчанию - все шаги
+    Возвращаемое значение:
+      список результатов шагов: идентификатор (step), наименование (title),
+      время выполнения в миллисекундах (ms), пояснения (details) и текст ошибки
+      (error) или None
+    """
+    results = []
+    for step, title, func in PREFLIGHT_STEPS:
+        if steps is not None and step not in steps:
+            continue
+
+        started = time.perf_counter()
+        details: List[str] = []
+        error = None
+        try:
+            details = func(app)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+        results.append(
+            {
+                "step": step,
+                "title": title,
+                "ms": (time.perf_counter() - started) * 1000,
+                "details": details,
+                "error": error,
+            }
+        )
+        if error and step in ("settings", "directory"):
+            break
+    return results
@@ -0,0 +1,283 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional, Tuple, Union
+
+from flask import Flask, Request, Response, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from models.settings import get_settings
+
+# Интервал удаления истекших сеансов из хранилища, секунд
+CLEANUP_INTERVAL = 300
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Сеанс, данные которого хранятся на сервере, а в cookie передается только
+    случайный идентификатор сеанса
+
+    Аргументы:
+      initial: данные сеанса
+      sid: идентификатор сеанса
+      new: истина, если сеанс создан в текущем запросе
+      expires: время истечения сеанса в хранилище (time.time())
+    """
+
+    def __init__(
+        self,
+        initial: Optional[Dict] = None,
+        sid: str = "",
+        new: bool = False,
+        expires: float = 0,
+    ):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.modified = False
+        # Идентификатор, замененный методом regenerate
+        self.previous_sid: Optional[str] = None
+
+    def regenerate(self):
+        """
+        Заменяет идентификатор сеанса, сохраняя данные. Вызывается после входа
+        пользователя, чтобы идентификатор, известный до входа, не давал доступа к
+        сеансу (защита от фиксации сеанса)
+        """
+        if self.previous_sid is None and not self.new:
+            self.previous_sid = self.sid
+        self.sid = generate_sid()
+        self.modified = True
+
+
+def generate_sid() -> str:
+    return secrets.token_urlsafe(32)
+
+
+class MemorySessionStore:
+    """
+    Хранилище сеансов в памяти процесса. Сеансы не переживают перезапуск и не
+    разделяются между рабочими процессами
+    """
+
+    def __init__(self):
+        self.__data: Dict[str, Tuple[float, str]] = {}
+        self.__lock = threading.Lock()
+        self.__cleaned = time.time()
+
+    def get(self, sid: str) -> Optional[Tuple[str, float]]:
+        """
+        Возвращает сериализованные данные сеанса и время его истечения или None,
+        если сеанс не найден или истек
+        """
+        with self.__lock:
+            item = self.__data.get(sid)
+        if item is None or item[0] <= time.time():
+            return None
+        expires, data = item
+        return data, expires
+
+    def set(self, sid: str, data: str, expires: float):
+        now = time.time()
+        with self.__lock:
+            self.__data[sid] = (expires, data)
+            if now - self.__cleaned > CLEANUP_INTERVAL:
+                self.__cleaned = now
+                for key in [k for k, v in self.__data.items() if v[0] <= now]:
+                    del self.__data[key]
+
+    def delete(self, sid: str):
+        with self.__lock:
+            self.__data.pop(sid, None)
+
+
+class SQLiteSessionStore:
+    """
+    Хранилище сеансов в базе SQLite. Сеансы переживают перезапуск приложения и
+    доступны всем рабочим процессам на одном сервере. Каждый поток использует
+    собственное соединение, база работает в режиме WAL, поэтому чтение не
+    блокируется записью
+
+    Аргументы:
+      path: путь к файлу базы данных
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__local = threading.local()
+        self.__cleaned = 0.0
+
+    def __connection(self) -> sqlite3.Connection:
+        """
+        Возвращает соединение текущего потока. Соединение, унаследованное при fork,
+        не используется
+        """
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None and self.__local.pid == os.getpid():
+            return connection
+
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self.__local.connection = connection
+        self.__local.pid = os.getpid()
+        return connection
+
+    def get(self, sid: str) -> Optional[Tuple[str, float]]:
+        """
+        Возвращает сериализованные данные сеанса и время его истечения или None,
+        если сеанс не найден или истек
+        """
+        row = (
+            self.__connection()
+            .execute(
+                "SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?",
+                (sid, time.time()),
+            )
+            .fetchone()
+        )
+        return (row[0], row[1]) if row else None
+
+    def set(self, sid: str, data: str, expires: float):
+        connection = self.__connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (sid, data, expires),
+        )
+        now = time.time()
+        if now - self.__cleaned > CLEANUP_INTERVAL:
+            self.__cleaned = now
+            connection.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+    def delete(self, sid: str):
+        self.__connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+SessionStore = Union[MemorySessionStore, SQLiteSessionStore]
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Интерфейс сеансов Flask, хранящий данные сеансов в хранилище store. Время
+    жизни сеанса в хранилище продлевается запросами, но запись в хранилище
+    выполняется только при изменении сеанса или когда до истечения сеанса
+    остается меньше половины времени жизни
+
+    Аргументы:
+      store: хранилище сеансов
+      lifetime: время жизни сеанса без запросов, секунд
+    """
+
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSideSession
+
+    def __init__(self, store: SessionStore, lifetime: float):
+        self.store = store
+        self.lifetime = lifetime
+
+    def open_session(self, app: Flask, request: Request) -> ServerSideSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            item = self.store.get(sid)
+            if item is not None:
+                data, expires = item
+                try:
+                    return self.session_class(
+                        self.serializer.loads(data), sid=sid, expires=expires
+                    )
+                except ValueError:
+                    pass
+        return self.session_class(sid=generate_sid(), new=True)
+
+    def save_session(
+        self, app: Flask, session: ServerSideSession, response: Response  # type: ignore
+    ):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    name,
+                    domain=domain,
+                    path=path,
+                    secure=secure,
+                    samesite=samesite,
+                    httponly=httponly,
+                )
+                response.vary.add("Cookie")
+            return
+
+        now = time.time()
+        if not session.modified and session.expires - now > self.lifetime / 2:
+            return
+
+        self.store.set(
+            session.sid, self.serializer.dumps(dict(session)), now + self.lifetime
+        )
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+        response.vary.add("Cookie")
+
+
+def configure_sessions(app: Flask):
+    """
+    Подключает хранилище сеансов, выбранное настройкой SESSION_STORE: cookie
+    (данные сеанса подписываются и передаются в cookie, по умолчанию), memory
+    (в памяти процесса) или sqlite (в базе SESSION_SQLITE_PATH). Для хранилищ на
+    сервере время жизни сеанса без запросов задается настройкой SESSION_LIFETIME
+    """
+    settings = get_settings()
+    if settings.SESSION_STORE == "cookie":
+        return
+
+    if settings.SESSION_STORE == "sqlite":
+        store = SQLiteSessionStore(settings.SESSION_SQLITE_PATH)
+    else:
+        store = MemorySessionStore()
+    app.permanent_session_lifetime = timedelta(seconds=settings.SESSION_LIFETIME)
+    app.session_interface = ServerSideSessionInterface(
+        store, settings.SESSION_LIFETIME
+    )
+
+
+def regenerate_session():
+    """
+    Заменяет идентификатор текущего сеанса, если сеанс хранится на сервере. Сеанс
+    в cookie заменяется целиком при каждом изменении и не требует замены
+    """
+    regenerate = getattr(session, "regenerate", None)
+    if regenerate:
+        regenerate()
@@ -0,0 +1,12 @@
+from blinker import Namespace
+
+__signals = Namespace()
+
+directory_changed = __signals.signal("directory-changed")
+"""
+Сигнал об изменении записей каталога самим приложением. Отправляется с доменным именем
+измененной записи в качестве sender и DN записи в именованном аргументе dn. При
+массовом изменении записей домена dn равен None. Если известно состояние записи до
+и после изменения, оно передается в именованных аргументах previous и entry
+(атрибуты записи в формате python-ldap; None для отсутствующей записи)
+"""
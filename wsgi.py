@@ -0,0 +1,29 @@
+"""
+Точка входа WSGI для запуска приложения сервером, например:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+import atexit
+
+from app import app
+from models.directory_mirror import stop_directory_mirror
+from models.ldap_connection import close_connections
+from models.settings import get_settings
+from utils.password_hashing import shutdown_executor
+
+application = app
+
+
+def shutdown():
+    """
+    Освобождает ресурсы процесса при завершении работы: останавливает зеркало
+    каталога и пул процессов вычисления хэшей паролей, закрывает (unbind)
+    соединения всех пулов. Может вызываться повторно
+    """
+    stop_directory_mirror(get_settings().SERVER_GRACEFUL_TIMEOUT)
+    shutdown_executor()
+    close_connections()
+
+
+atexit.register(shutdown)